@@ -6,18 +6,13 @@ This package provides functionality for:
 - Listing available snapshots
 - Restoring directories from snapshots
 - Pruning old snapshots
+
+Logging is configured by the command line entry point (see
+``backuptool.cli.setup_logging``); importing the package has no side effects.
 """
 
 import logging
-import os
 
 __version__ = '0.1.0'
 
-# Configure logging
-LOG_LEVEL = os.environ.get("BACKUPTOOL_LOG_LEVEL", "INFO")
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-
 logger = logging.getLogger("backuptool")
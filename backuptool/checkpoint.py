@@ -0,0 +1,152 @@
+import json
+import time
+import logging
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger("backuptool.checkpoint")
+
+
+class SnapshotCheckpoint:
+    """Partial manifest of a snapshot that is still being created.
+
+    The partial manifest lives at ``snapshots/<id>.partial`` as JSON lines: a
+    header with the snapshot id, timestamp and target directory, followed by
+    one record per processed file. Records are buffered and appended in
+    batches every ``every`` files or ``interval`` seconds, whichever comes
+    first, so an interrupted snapshot can be resumed without rehashing the
+    files it already processed. Each batch is preceded by a backend sync so
+    a checkpoint never references content that is not yet durable.
+
+    On backends that cannot append in place, such as S3, appending would
+    rewrite the whole partial manifest on every batch. There the header and
+    each batch are written as numbered objects under
+    ``snapshots/<id>.partial/`` instead and concatenated when loaded.
+    """
+
+    def __init__(self, backend, snapshot_id: int, every: int = 1000,
+                 interval: float = 30.0):
+        self.backend = backend
+        self.key = partial_key(snapshot_id)
+        self.every = every
+        self.interval = interval
+        self._pending: List[bytes] = []
+        self._last_flush = time.monotonic()
+        self._parts = None
+        if not backend.appends_in_place:
+            self._parts = len(_part_keys(backend, self.key))
+
+    def start(self, header: Dict) -> None:
+        if self._parts is None:
+            self.backend.put(self.key, _encode(header))
+        else:
+            self._put_part(_encode(header))
+        self._last_flush = time.monotonic()
+
+    def _put_part(self, data: bytes) -> None:
+        self.backend.put(f"{self.key}/{self._parts}", data)
+        self._parts += 1
+
+    def record(self, record: Dict) -> None:
+        self._pending.append(_encode(record))
+        if (
+            len(self._pending) >= self.every
+            or time.monotonic() - self._last_flush >= self.interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            # Records name content blobs; make those durable first.
+            self.backend.sync()
+            if self._parts is None:
+                self.backend.append(self.key, b"".join(self._pending))
+            else:
+                self._put_part(b"".join(self._pending))
+            logger.debug(f"Checkpointed {len(self._pending)} files to {self.key}")
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def discard(self) -> None:
+        self._pending = []
+        _delete_partial(self.backend, self.key)
+
+
+def partial_key(snapshot_id: int) -> str:
+    return f"snapshots/{snapshot_id}.partial"
+
+
+def load_partial(backend, key: str) -> Tuple[Dict, List[Dict]]:
+    parts = _part_keys(backend, key)
+    if parts:
+        data = b"".join(backend.get(part) for part in parts)
+    else:
+        data = backend.get(key)
+    lines = [line for line in data.split(b"\n") if line.strip()]
+    if not lines:
+        raise ValueError(f"Empty partial manifest {key}")
+    header = json.loads(lines[0])
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logger.warning(f"Skipping torn record in {key}")
+    return header, records
+
+
+def iter_partials(backend) -> Iterator[Tuple[Dict, List[Dict]]]:
+    keys = set()
+    for key in backend.list("snapshots/"):
+        if ".partial/" in key:
+            # Written in parts, listed as <id>.partial/<n>.
+            key = key.rpartition("/")[0]
+        if key.endswith(".partial"):
+            keys.add(key)
+    for key in sorted(keys):
+        try:
+            yield load_partial(backend, key)
+        except (ValueError, IOError) as e:
+            logger.warning(f"Ignoring unreadable partial manifest {key}: {e}")
+
+
+def discard_partials(backend, target_dir: str, before: int) -> List[int]:
+    """Delete partial manifests of ``target_dir`` older than snapshot ``before``.
+
+    Once a newer snapshot of the same directory is committed they are no
+    longer worth resuming, and prune would otherwise keep their blobs.
+    Returns the ids of the discarded partials.
+    """
+    discarded = []
+    for header, _ in iter_partials(backend):
+        if header["target_dir"] != target_dir or header["id"] >= before:
+            continue
+        try:
+            _delete_partial(backend, partial_key(header["id"]))
+        except OSError as e:
+            logger.warning(f"Failed to remove partial manifest {header['id']}: {e}")
+            continue
+        discarded.append(header["id"])
+    return discarded
+
+
+def _part_keys(backend, key: str) -> List[str]:
+    prefix = f"{key}/"
+    parts = [k for k in backend.list(prefix) if k[len(prefix):].isdigit()]
+    return sorted(parts, key=lambda k: int(k[len(prefix):]))
+
+
+def _delete_partial(backend, key: str) -> None:
+    parts = _part_keys(backend, key)
+    if parts:
+        failed = backend.delete_many(parts)
+        if failed:
+            raise IOError(f"Failed to remove {len(failed)} parts of {key}")
+        return
+    try:
+        backend.delete(key)
+    except FileNotFoundError:
+        pass
+
+
+def _encode(record: Dict) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
@@ -1,8 +1,8 @@
+import os
 import sys
 import argparse
 import datetime
 import logging
-from tabulate import tabulate
 from . import core
 
 logger = logging.getLogger("backuptool.cli")
@@ -20,12 +20,61 @@ def parse_args():
         help="Take a snapshot of a directory",
         description="Take a snapshot of a directory and store it in the database",
     )
+    source_group = snapshot_parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--target-directory", help="Directory to snapshot")
+    source_group.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Snapshot data read from standard input, e.g. a database dump",
+    )
     snapshot_parser.add_argument(
-        "--target-directory", required=True, help="Directory to snapshot"
+        "--name",
+        default="stdin",
+        help="File name under which --stdin data is stored",
     )
     snapshot_parser.add_argument(
         "--db-path", help="Path to the database directory (default: ~/.backuptool)"
     )
+    snapshot_parser.add_argument(
+        "--read-order",
+        choices=["walk", "inode", "extent"],
+        help="Order in which files are read: directory walk order, inode number "
+        "or physical extent (FIEMAP); the repository default is walk",
+    )
+    snapshot_parser.add_argument(
+        "--durability",
+        choices=["none", "batch", "strict"],
+        help="When stored content is fsync'd: never, once before the snapshot "
+        "is committed, or after every file; the repository default is batch",
+    )
+    snapshot_parser.add_argument(
+        "--delta",
+        action="store_true",
+        default=None,
+        help="Store changed files as binary deltas against their previous version",
+    )
+    snapshot_parser.add_argument(
+        "--delta-max-depth",
+        type=int,
+        help="Longest chain of deltas before a file is stored in full again",
+    )
+    snapshot_parser.add_argument(
+        "--manifest-memory",
+        type=parse_size,
+        help="Memory for manifest entries before they are spilled to sorted "
+        "temporary files, e.g. 256M; the repository default is 64M",
+    )
+    snapshot_parser.add_argument(
+        "--inline-threshold",
+        type=parse_size,
+        help="Files of at most this many bytes are embedded in the manifest "
+        "instead of the content store; the repository default is 0",
+    )
+    snapshot_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted snapshot of the target directory",
+    )
 
     list_parser = subparsers.add_parser(
         "list",
@@ -53,8 +102,18 @@ def parse_args():
         required=True,
         help="ID of the snapshot to restore",
     )
+    output_group = restore_parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument(
+        "--output-directory", help="Directory to restore the snapshot to"
+    )
+    output_group.add_argument(
+        "--stdout",
+        action="store_true",
+        help="Write one file of the snapshot to standard output",
+    )
     restore_parser.add_argument(
-        "--output-directory", required=True, help="Directory to restore the snapshot to"
+        "--file",
+        help="File to write with --stdout (default: the snapshot's only file)",
     )
     restore_parser.add_argument(
         "--db-path", help="Path to the database directory (default: ~/.backuptool)"
@@ -72,7 +131,124 @@ def parse_args():
         "--db-path", help="Path to the database directory (default: ~/.backuptool)"
     )
 
+    du_parser = subparsers.add_parser(
+        "du",
+        help="Show space usage",
+        description="Show logical, unique and shared bytes per snapshot and "
+        "target directory, and repository-wide deduplication",
+    )
+    du_parser.add_argument(
+        "--db-path", help="Path to the database directory (default: ~/.backuptool)"
+    )
+    du_parser.add_argument(
+        "--format",
+        choices=["simple", "grid", "fancy_grid", "github"],
+        default="simple",
+        help="Output format for the tables",
+    )
+
+    copy_parser = subparsers.add_parser(
+        "copy",
+        help="Copy snapshots to another database",
+        description="Replicate snapshots into another database, transferring "
+        "only content the destination does not already hold",
+    )
+    copy_parser.add_argument(
+        "--from", dest="source", required=True, help="Path of the source database"
+    )
+    copy_parser.add_argument(
+        "--to", dest="dest", required=True, help="Path of the destination database"
+    )
+    copy_parser.add_argument(
+        "--snapshots",
+        type=int,
+        nargs="+",
+        help="IDs of the snapshots to copy (default: all)",
+    )
+    copy_parser.add_argument(
+        "--workers", type=int, default=8, help="Number of parallel transfers"
+    )
+
+    profile_parser = subparsers.add_parser(
+        "profile-tree",
+        help="Record the anonymized shape of a directory tree",
+        description="Record depth, fan-out, file-size, duplicate, hardlink and "
+        "sparse-file histograms of a directory, without names or content, so "
+        "a similar tree can be generated with create_test_data.py --profile",
+    )
+    profile_parser.add_argument(
+        "--target-directory", required=True, help="Directory to profile"
+    )
+    profile_parser.add_argument(
+        "--output", help="File to write the profile to (default: standard output)"
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run the backup daemon",
+        description="Keep the database open and serve snapshot, list, restore "
+        "and prune requests over a Unix socket",
+    )
+    serve_parser.add_argument(
+        "--socket",
+        help="Path of the Unix socket (default: daemon.sock in the database directory)",
+    )
+    serve_parser.add_argument(
+        "--db-path", help="Path to the database directory (default: ~/.backuptool)"
+    )
+    serve_parser.add_argument(
+        "--workers", type=int, default=2, help="Number of jobs run concurrently"
+    )
+    serve_parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=64,
+        help="Maximum number of queued and running jobs",
+    )
+
     for p in [snapshot_parser, list_parser, restore_parser, prune_parser]:
+        p.add_argument(
+            "--no-daemon",
+            action="store_true",
+            help="Do not hand the command to a running daemon",
+        )
+
+    for p in [snapshot_parser, restore_parser]:
+        p.add_argument(
+            "--read-rate",
+            type=parse_size,
+            help="Maximum read bandwidth, e.g. 50M (bytes per second)",
+        )
+        p.add_argument(
+            "--write-rate",
+            type=parse_size,
+            help="Maximum write bandwidth, e.g. 20M (bytes per second)",
+        )
+        p.add_argument(
+            "--files-rate", type=float, help="Maximum number of files per second"
+        )
+        p.add_argument(
+            "--io-idle",
+            action="store_true",
+            default=None,
+            help="Run with the idle I/O scheduling class (Linux only)",
+        )
+        p.add_argument("--nice", type=int, help="Increase the process nice level")
+        p.add_argument(
+            "--adaptive",
+            action="store_true",
+            default=None,
+            help="Back off reads when read latency rises",
+        )
+        p.add_argument(
+            "--drop-cache",
+            choices=["auto", "always", "never"],
+            help="Drop file data from the page cache once it has been copied: "
+            "for large files, for all files or never; the repository default is auto",
+        )
+
+    for p in [snapshot_parser, list_parser, restore_parser, prune_parser,
+              du_parser, copy_parser, profile_parser, serve_parser]:
         p.add_argument(
             "--verbose", "-v", action="store_true", help="Enable verbose output"
         )
@@ -80,6 +256,146 @@ def parse_args():
     return parser.parse_args()
 
 
+def parse_size(value):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper().rstrip("B")
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(float(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+
+
+def throttle_from_args(args):
+    return {
+        "read_rate": args.read_rate,
+        "write_rate": args.write_rate,
+        "files_rate": args.files_rate,
+        "io_idle": args.io_idle,
+        "nice": args.nice,
+        "adaptive": args.adaptive,
+    }
+
+
+def call_daemon(args, method, params):
+    """Run a command through a running daemon; ``None`` means run it here.
+
+    Commands with per-run tuning options always run in-process, since the
+    daemon applies the repository's own settings.
+    """
+    if args.no_daemon or os.environ.get("BACKUPTOOL_NO_DAEMON"):
+        return None
+    tuning = [
+        getattr(args, name, None)
+        for name in ("read_rate", "write_rate", "files_rate", "io_idle", "nice",
+                     "adaptive", "read_order", "durability", "delta",
+                     "delta_max_depth", "manifest_memory", "inline_threshold",
+                     "drop_cache")
+    ]
+    if any(value is not None for value in tuning):
+        return None
+
+    from . import client as daemon_client
+
+    client = daemon_client.connect(args.db_path)
+    if client is None:
+        return None
+    params = dict(params, db_path=daemon_client.repository_location(args.db_path))
+    with client:
+        try:
+            return client.call(method, params, progress=show_progress)
+        except daemon_client.DaemonError as e:
+            if e.code != daemon_client.WRONG_REPOSITORY:
+                raise
+            logger.debug(f"Not using daemon: {e}")
+            return None
+        finally:
+            if sys.stderr.isatty():
+                sys.stderr.write("\n")
+
+
+def show_progress(progress):
+    logger.debug(f"Job {progress['job']}: {progress['files']} files")
+    if sys.stderr.isatty():
+        sys.stderr.write(
+            f"\r{progress['state']}: {progress['files']} files, "
+            f"{format_size(progress['bytes'])}"
+        )
+        sys.stderr.flush()
+
+
+def serve(args):
+    import signal
+    from . import daemon
+    from .client import default_socket_path
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+    server = daemon.BackupDaemon(
+        args.socket or default_socket_path(args.db_path),
+        args.db_path,
+        workers=args.workers,
+        max_queue=args.max_queue,
+    )
+    print(f"Serving {server.location} on {server.socket_path}")
+    server.serve_forever()
+    return 0
+
+
+def restore_to_stdout(args):
+    import shutil
+    from itertools import islice
+    from .repository import Repository
+
+    with Repository(args.db_path, read_only=True, throttle=throttle_from_args(args)) as repo:
+        path = args.file
+        if path is None:
+            paths = [p for p, _ in islice(repo.iter_entries(args.snapshot_number), 2)]
+            if len(paths) != 1:
+                raise ValueError(
+                    f"Snapshot {args.snapshot_number} does not hold exactly one "
+                    f"file; choose one with --file"
+                )
+            path = paths[0]
+        with repo.open_file(args.snapshot_number, path) as f:
+            shutil.copyfileobj(f, sys.stdout.buffer, 1024 * 1024)
+        sys.stdout.buffer.flush()
+
+
+def print_usage(usage, tablefmt):
+    from tabulate import tabulate
+
+    if usage["snapshots"]:
+        print(tabulate(
+            [
+                [s["id"], format_size(s["logical"]), format_size(s["unique"]),
+                 format_size(s["shared"]), s["target_dir"]]
+                for s in usage["snapshots"]
+            ],
+            headers=["ID", "LOGICAL", "UNIQUE", "SHARED", "TARGET DIRECTORY"],
+            tablefmt=tablefmt,
+        ))
+        print()
+        print(tabulate(
+            [
+                [t["target_dir"], t["snapshots"], format_size(t["logical"]),
+                 format_size(t["unique"]), format_size(t["shared"])]
+                for t in usage["targets"]
+            ],
+            headers=["TARGET DIRECTORY", "SNAPSHOTS", "LOGICAL", "UNIQUE", "SHARED"],
+            tablefmt=tablefmt,
+        ))
+        print()
+    print(f"Logical size:      {format_size(usage['logical'])}")
+    print(f"Deduplicated size: {format_size(usage['deduplicated'])} in {usage['blobs']} blobs")
+    print(f"Stored size:       {format_size(usage['stored'])}")
+    print(f"Dedup ratio:       {usage['dedup_ratio']:.2f}x")
+    print(f"Compression ratio: {usage['compression_ratio']:.2f}x")
+
+
 def format_timestamp(iso_timestamp):
     dt = datetime.datetime.fromisoformat(iso_timestamp)
     return dt.strftime("%Y-%m-%d %H:%M:%S")
@@ -94,6 +410,11 @@ def format_size(size_bytes):
 
 
 def setup_logging(verbose):
+    log_level = os.environ.get("BACKUPTOOL_LOG_LEVEL", "INFO")
+    logging.basicConfig(
+        level=getattr(logging, log_level),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
     if verbose:
         logging.getLogger("backuptool").setLevel(logging.DEBUG)
         logger.debug("Verbose logging enabled")
@@ -107,9 +428,47 @@ def main():
 
         setup_logging(getattr(args, "verbose", False))
 
-        if args.command == "snapshot":
+        if args.command == "snapshot" and args.stdin:
             try:
-                snapshot_id = core.create_snapshot(args.target_directory, args.db_path)
+                snapshot_id = core.create_stream_snapshot(
+                    sys.stdin.buffer,
+                    args.name,
+                    args.db_path,
+                    throttle=throttle_from_args(args),
+                    durability=args.durability,
+                )
+                print(f"Created snapshot {snapshot_id}")
+                return 0
+            except Exception as e:
+                logger.error(f"Failed to create snapshot: {e}")
+                print(f"Failed to create snapshot: {e}")
+                return 1
+
+        elif args.command == "snapshot":
+            try:
+                result = call_daemon(
+                    args,
+                    "snapshot",
+                    {
+                        "target_dir": os.path.abspath(args.target_directory),
+                        "resume": args.resume,
+                    },
+                )
+                if result is not None:
+                    snapshot_id = result["snapshot_id"]
+                else:
+                    snapshot_id = core.create_snapshot(
+                        args.target_directory,
+                        args.db_path,
+                        resume=args.resume,
+                        throttle=throttle_from_args(args),
+                        read_order=args.read_order,
+                        durability=args.durability,
+                        delta={"enabled": args.delta, "max_depth": args.delta_max_depth},
+                        manifest_memory=args.manifest_memory,
+                        inline_threshold=args.inline_threshold,
+                        drop_cache=args.drop_cache,
+                    )
                 print(f"Created snapshot {snapshot_id}")
                 return 0
             except FileNotFoundError as e:
@@ -123,7 +482,11 @@ def main():
 
         elif args.command == "list":
             try:
-                snapshots = core.list_snapshots(args.db_path)
+                result = call_daemon(args, "list", {})
+                if result is not None:
+                    snapshots = result["snapshots"]
+                else:
+                    snapshots = core.list_snapshots(args.db_path)
                 if not snapshots:
                     print("No snapshots found")
                     return 0
@@ -148,6 +511,8 @@ def main():
                     row.append(snapshot["target_dir"])
                     table_data.append(row)
 
+                from tabulate import tabulate
+
                 headers = ["ID", "TIMESTAMP", "FILES", "SIZE", "TARGET DIRECTORY"]
                 print(tabulate(table_data, headers=headers, tablefmt=args.format))
                 return 0
@@ -156,11 +521,36 @@ def main():
                 print(f"Failed to list snapshots: {e}")
                 return 1
 
+        elif args.command == "restore" and args.stdout:
+            # Standard output carries the data; messages go to stderr.
+            try:
+                restore_to_stdout(args)
+                return 0
+            except Exception as e:
+                logger.error(f"Error during restore: {e}")
+                print(f"Error during restore: {e}", file=sys.stderr)
+                return 1
+
         elif args.command == "restore":
             try:
-                success = core.restore_snapshot(
-                    args.snapshot_number, args.output_directory, args.db_path
+                result = call_daemon(
+                    args,
+                    "restore",
+                    {
+                        "snapshot_id": args.snapshot_number,
+                        "output_dir": os.path.abspath(args.output_directory),
+                    },
                 )
+                if result is not None:
+                    success = result["success"]
+                else:
+                    success = core.restore_snapshot(
+                        args.snapshot_number,
+                        args.output_directory,
+                        args.db_path,
+                        throttle=throttle_from_args(args),
+                        drop_cache=args.drop_cache,
+                    )
                 if success:
                     print(
                         f"Restored snapshot {args.snapshot_number} to {args.output_directory}"
@@ -176,7 +566,11 @@ def main():
 
         elif args.command == "prune":
             try:
-                success = core.prune_snapshot(args.snapshot, args.db_path)
+                result = call_daemon(args, "prune", {"snapshot_id": args.snapshot})
+                if result is not None:
+                    success = result["success"]
+                else:
+                    success = core.prune_snapshot(args.snapshot, args.db_path)
                 if success:
                     print(f"Pruned snapshot {args.snapshot}")
                     return 0
@@ -188,6 +582,62 @@ def main():
                 print(f"Error during prune: {e}")
                 return 1
 
+        elif args.command == "du":
+            try:
+                usage = core.space_usage(args.db_path)
+                print_usage(usage, args.format)
+                return 0
+            except Exception as e:
+                logger.error(f"Failed to compute space usage: {e}")
+                print(f"Failed to compute space usage: {e}")
+                return 1
+
+        elif args.command == "copy":
+            try:
+                from .replicate import copy_repository
+
+                result = copy_repository(
+                    args.source, args.dest, args.snapshots, workers=args.workers
+                )
+                for source_id, dest_id in result["snapshots"].items():
+                    print(f"Snapshot {source_id} -> {dest_id}")
+                print(
+                    f"Copied {result['copied']} snapshots ({result['skipped']} already "
+                    f"present), transferred {result['blobs']} blobs "
+                    f"({format_size(result['bytes'])})"
+                )
+                return 0
+            except Exception as e:
+                logger.error(f"Failed to copy snapshots: {e}")
+                print(f"Failed to copy snapshots: {e}")
+                return 1
+
+        elif args.command == "profile-tree":
+            try:
+                import json
+                from .profile import profile_tree
+
+                profile = json.dumps(profile_tree(args.target_directory), indent=2)
+                if args.output:
+                    with open(args.output, "w") as f:
+                        f.write(profile + "\n")
+                    print(f"Wrote profile of {args.target_directory} to {args.output}")
+                else:
+                    print(profile)
+                return 0
+            except Exception as e:
+                logger.error(f"Failed to profile directory: {e}")
+                print(f"Failed to profile directory: {e}")
+                return 1
+
+        elif args.command == "serve":
+            try:
+                return serve(args)
+            except Exception as e:
+                logger.error(f"Daemon failed: {e}")
+                print(f"Daemon failed: {e}")
+                return 1
+
         else:
             print("No command specified. Use --help for usage information.")
             return 1
@@ -0,0 +1,105 @@
+import os
+import json
+import socket
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("backuptool.client")
+
+# JSON-RPC 2.0 error codes; the -320xx range is reserved for the server.
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+JOB_FAILED = -32000
+QUEUE_FULL = -32001
+WRONG_REPOSITORY = -32002
+
+
+class DaemonError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def default_socket_path(db_path: str = None) -> Optional[str]:
+    """Socket of the daemon serving ``db_path``, if one can be derived.
+
+    ``BACKUPTOOL_SOCKET`` takes precedence; otherwise local repositories use
+    ``daemon.sock`` inside the database directory.
+    """
+    if os.environ.get("BACKUPTOOL_SOCKET"):
+        return os.environ["BACKUPTOOL_SOCKET"]
+    if db_path is None:
+        db_path = os.path.join(os.path.expanduser("~"), ".backuptool")
+    if db_path.startswith(("http://", "https://")):
+        return None
+    return os.path.join(db_path, "daemon.sock")
+
+
+def repository_location(db_path: str = None) -> str:
+    if db_path is None:
+        db_path = os.path.join(os.path.expanduser("~"), ".backuptool")
+    if db_path.startswith(("http://", "https://")):
+        return db_path.rstrip("/")
+    return os.path.realpath(db_path)
+
+
+class DaemonClient:
+    """Blocking JSON-RPC client for :class:`~backuptool.daemon.BackupDaemon`."""
+
+    def __init__(self, socket_path: str, timeout: float = None):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rb")
+        self._next_id = 1
+
+    def __enter__(self) -> "DaemonClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+    def call(self, method: str, params: Dict = None,
+             progress: Callable[[Dict], None] = None) -> Any:
+        request_id = self._next_id
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": request_id, "method": method,
+                   "params": params or {}}
+        self._socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        for line in self._file:
+            message = json.loads(line)
+            if "id" not in message:
+                if message.get("method") == "progress" and progress is not None:
+                    progress(message["params"])
+                continue
+            if message["id"] != request_id:
+                continue
+            if "error" in message:
+                raise DaemonError(message["error"]["code"], message["error"]["message"])
+            return message["result"]
+        raise ConnectionError("Daemon closed the connection")
+
+
+def connect(db_path: str = None, socket_path: str = None) -> Optional[DaemonClient]:
+    """Return a client for a running daemon, or ``None`` if there is none."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    socket_path = socket_path or default_socket_path(db_path)
+    if socket_path is None or not os.path.exists(socket_path):
+        return None
+    try:
+        return DaemonClient(socket_path)
+    except OSError as e:
+        logger.debug(f"Daemon socket {socket_path} not accepting connections: {e}")
+        return None
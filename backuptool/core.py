@@ -1,69 +1,342 @@
 import os
+import sys
+import stat
+import time
+import shutil
 import hashlib
 import json
-import shutil
+import base64
+import fnmatch
 import datetime
 import logging
-from pathlib import Path
-from typing import Dict, List, Set, Tuple, Optional, Any
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Set, Tuple, Optional
+
+from .checkpoint import SnapshotCheckpoint, discard_partials, iter_partials
+from .delta import DeltaPolicy, VersionCache, apply_delta, compute_delta
+from .index import ContentIndex
+from .journal import MetadataJournal
+from .locality import READ_ORDERS, order_batch
+from .manifest import ManifestWriter, iter_files
+from .pagecache import DROP_CACHE_MODES, CacheDropper, drop_cache
+from . import pagecache
+from .refcount import RefcountIndex
+from .sparse import data_extents, read_extents, write_sparse
+from .storage import LocalBackend, StorageBackend, open_backend
+from .throttle import Throttle
 
 logger = logging.getLogger("backuptool.core")
 
+# Bytes hashed at the start and at the end of a segmented file to recognise
+# that a later version only appended to it.
+_APPEND_BLOCK = 64 * 1024
+# Segments after which a growing file is stored in full again.
+_MAX_SEGMENTS = 64
 
-class BackupDatabase:
-    def __init__(self, db_path: str = None):
-        if db_path is None:
-            home_dir = os.path.expanduser("~")
-            db_path = os.path.join(home_dir, ".backuptool")
 
-        self.db_path = db_path
-        self.content_path = os.path.join(db_path, "content")
-        self.snapshots_path = os.path.join(db_path, "snapshots")
-        self.metadata_path = os.path.join(db_path, "metadata.json")
+def _entry_hashes(entry) -> List[str]:
+    if isinstance(entry, str):
+        return [entry]
+    if "chain" in entry:
+        return list(entry["chain"])
+    if "chunks" in entry:
+        return list(entry["chunks"])
+    if "data" in entry:
+        return []
+    return [entry["hash"]]
+
+
+def _entry_hash(entry) -> str:
+    if isinstance(entry, str):
+        return entry
+    if "data" in entry:
+        return hashlib.sha256(base64.b64decode(entry["data"])).hexdigest()
+    return entry["hash"]
+
+
+def _is_segmented(entry) -> bool:
+    return isinstance(entry, dict) and "fingerprint" in entry
+
+
+def _read_full(stream: BinaryIO, size: int) -> bytes:
+    """Read ``size`` bytes unless the stream ends first; pipes return less."""
+    parts = []
+    remaining = size
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b"".join(parts)
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes, 0 if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes everywhere but macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
 
-        try:
-            os.makedirs(self.content_path, exist_ok=True)
-            os.makedirs(self.snapshots_path, exist_ok=True)
-            logger.debug(f"Database directories created at {db_path}")
-        except OSError as e:
-            logger.error(f"Failed to create database directories: {e}")
-            raise
 
+class BackupDatabase:
+    def __init__(self, db_path: str = None, confirm_index_hits: bool = None,
+                 backend: StorageBackend = None, read_only: bool = False,
+                 compact_every: int = 100, checkpoint_every: int = 1000,
+                 checkpoint_interval: float = 30.0, throttle: Dict = None,
+                 read_order: str = None, read_batch: int = 4096,
+                 durability: str = None, delta: Dict = None,
+                 manifest_memory: int = None, inline_threshold: int = None,
+                 stream_chunk_size: int = None, drop_cache: str = None,
+                 append_min_size: int = None, append_only: List[str] = None):
+        if backend is None:
+            backend = open_backend(db_path, read_only=read_only)
+        self.backend = backend
+        self.read_only = backend.read_only
+        self.db_path = self.backend.location
+        if isinstance(self.backend, LocalBackend):
+            self.content_path = self.backend.content_path
+            self.snapshots_path = self.backend.snapshots_path
+            self.metadata_path = self.backend.metadata_path
+        self.index_path = self.backend.local_cache_path("content.idx")
+        self.refcount_path = self.backend.local_cache_path("refcount.json")
+        self.compact_every = compact_every
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+
+        self.config = self._load_config()
+        if confirm_index_hits is None:
+            confirm_index_hits = self.config.get("confirm_index_hits", False)
+        self.confirm_index_hits = confirm_index_hits
+        throttle_config = dict(self.config.get("throttle", {}))
+        throttle_config.update(
+            {k: v for k, v in (throttle or {}).items() if v is not None}
+        )
+        self.throttle = Throttle.from_config(throttle_config)
+        self.read_order = read_order or self.config.get("read_order", "walk")
+        if self.read_order not in READ_ORDERS:
+            raise ValueError(f"Unknown read order: {self.read_order}")
+        self.read_batch = read_batch
+        durability = durability or self.config.get("durability")
+        if durability:
+            self.backend.durability = durability
+        delta_config = dict(self.config.get("delta", {}))
+        delta_config.update({k: v for k, v in (delta or {}).items() if v is not None})
+        self.delta = DeltaPolicy.from_config(delta_config)
+        self._versions = VersionCache(self.delta.cache_size)
+        self.manifest_memory = manifest_memory or self.config.get(
+            "manifest_memory", 64 * 1024 * 1024
+        )
+        if inline_threshold is None:
+            inline_threshold = self.config.get("inline_threshold", 0)
+        self.inline_threshold = inline_threshold
+        self.stream_chunk_size = stream_chunk_size or self.config.get(
+            "stream_chunk_size", 4 * 1024 * 1024
+        )
+        if append_min_size is None:
+            append_min_size = self.config.get("append_min_size", 0)
+        self.append_min_size = append_min_size
+        if append_only is None:
+            append_only = self.config.get("append_only", [])
+        self.append_only = list(append_only)
+        self.drop_cache = drop_cache or self.config.get("drop_cache", "auto")
+        if self.drop_cache not in DROP_CACHE_MODES:
+            raise ValueError(f"Unknown drop cache mode: {self.drop_cache}")
+        self.drop_cache_min_size = self.config.get("drop_cache_min_size", 16 * 1024 * 1024)
+
+        self.journal = MetadataJournal(self.backend)
+        self._journal_records = 0
         self.metadata = self._load_metadata()
+        self._content_index = None
+        self._refcounts = None
+        self._blob_sizes: Dict[str, Tuple[int, int]] = {}
+        self._tracks_blob_sizes = None
+
+    @property
+    def content_index(self) -> ContentIndex:
+        # Loaded on first use so that read-only commands such as ``list``
+        # never touch the index.
+        if self._content_index is None:
+            self._content_index = ContentIndex(
+                self.index_path, self.backend, read_only=self.read_only
+            )
+            self._content_index.load()
+        return self._content_index
+
+    @property
+    def refcounts(self) -> RefcountIndex:
+        # Only loaded here; it is built on the first space_usage() call and
+        # kept up to date by snapshot and prune from then on.
+        if self._refcounts is None:
+            self._refcounts = RefcountIndex(self.refcount_path, read_only=self.read_only)
+            self._refcounts.load()
+        return self._refcounts
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise PermissionError(f"Database at {self.db_path} is opened read-only")
+
+    def _load_config(self) -> Dict:
+        try:
+            return json.loads(self.backend.get("config.json"))
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, IOError) as e:
+            logger.warning(f"Ignoring unreadable repository config: {e}")
+            return {}
 
     def _load_metadata(self) -> Dict:
-        if os.path.exists(self.metadata_path):
-            try:
-                with open(self.metadata_path, "r") as f:
-                    metadata = json.load(f)
-                logger.debug("Metadata loaded successfully")
-                return metadata
-            except (json.JSONDecodeError, IOError) as e:
-                logger.error(f"Error loading metadata: {e}")
-                logger.warning("Creating new metadata file")
-                metadata = {"next_snapshot_id": 1, "snapshots": []}
-                self._save_metadata(metadata)
-                return metadata
-        else:
-            logger.debug("Creating new metadata file")
+        # metadata.json is a checkpoint; changes made since it was written are
+        # replayed from the journal.
+        needs_checkpoint = False
+        try:
+            metadata = json.loads(self.backend.get("metadata.json"))
+            logger.debug("Metadata loaded successfully")
+        except FileNotFoundError:
             metadata = {"next_snapshot_id": 1, "snapshots": []}
+            needs_checkpoint = True
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Error loading metadata: {e}")
+            logger.warning("Recovering metadata from snapshot manifests")
+            metadata = self._recover_metadata()
+            needs_checkpoint = True
+        metadata.setdefault("journal_seq", 0)
+
+        for record in self.journal.replay():
+            if record.get("seq", 0) <= metadata["journal_seq"]:
+                continue
+            self._apply_record(metadata, record)
+            self._journal_records += 1
+        if self._journal_records:
+            logger.debug(f"Replayed {self._journal_records} journal records")
+
+        if needs_checkpoint and not self.read_only:
+            logger.debug("Creating new metadata file")
             self._save_metadata(metadata)
-            return metadata
+        return metadata
+
+    def reload_metadata(self) -> None:
+        """Pick up snapshots added or removed by other processes."""
+        self._journal_records = 0
+        self.metadata = self._load_metadata()
+        # A prune by another process removes blobs the index still lists.
+        if self._content_index is not None and self._content_index.stale():
+            logger.debug("Content store changed by another process, reloading index")
+            self._content_index = None
+
+    def _recover_metadata(self) -> Dict:
+        metadata = {"next_snapshot_id": 1, "snapshots": []}
+        snapshot_ids = sorted(
+            int(key[len("snapshots/"):])
+            for key in self.backend.list("snapshots/")
+            if key[len("snapshots/"):].isdigit()
+        )
+        for snapshot_id in snapshot_ids:
+            snapshot = self.get_snapshot(snapshot_id)
+            if snapshot is None:
+                continue
+            metadata["snapshots"].append(
+                {
+                    "id": snapshot_id,
+                    "timestamp": snapshot["timestamp"],
+                    "target_dir": snapshot["target_dir"],
+                    "file_count": len(snapshot["files"]),
+                }
+            )
+            metadata["next_snapshot_id"] = snapshot_id + 1
+        logger.info(f"Recovered {len(metadata['snapshots'])} snapshots")
+        return metadata
+
+    @staticmethod
+    def _apply_record(metadata: Dict, record: Dict) -> None:
+        if record["op"] == "add":
+            summary = record["snapshot"]
+            if not any(s["id"] == summary["id"] for s in metadata["snapshots"]):
+                metadata["snapshots"].append(summary)
+            metadata["next_snapshot_id"] = max(
+                metadata["next_snapshot_id"], summary["id"] + 1
+            )
+        elif record["op"] == "reserve":
+            metadata["next_snapshot_id"] = max(
+                metadata["next_snapshot_id"], record["id"] + 1
+            )
+        elif record["op"] == "remove":
+            metadata["snapshots"] = [
+                s for s in metadata["snapshots"] if s["id"] != record["id"]
+            ]
+        metadata["journal_seq"] = record["seq"]
+
+    def _commit(self, record: Dict) -> None:
+        # Other processes may have appended or compacted since the catalog
+        # was loaded; catch up under the lock so that sequence numbers are
+        # never handed out twice.
+        with self.backend.lock("metadata"):
+            self._catch_up()
+            self._append_record(record)
+
+    def _reserve_snapshot_id(self) -> int:
+        with self.backend.lock("metadata"):
+            self._catch_up()
+            snapshot_id = self.metadata["next_snapshot_id"]
+            self._append_record({"op": "reserve", "id": snapshot_id})
+        return snapshot_id
+
+    def _catch_up(self) -> None:
+        records = self.journal.replay()
+        if records and records[0].get("op") == "checkpoint" \
+                and records[0]["seq"] > self.metadata["journal_seq"]:
+            # Compacted by another process after records this one never saw.
+            self._journal_records = 0
+            self.metadata = self._load_metadata()
+            return
+        for record in records:
+            if record.get("seq", 0) > self.metadata["journal_seq"]:
+                self._apply_record(self.metadata, record)
+                self._journal_records += 1
+
+    def _append_record(self, record: Dict) -> None:
+        record["seq"] = self.metadata["journal_seq"] + 1
+        try:
+            self.journal.append(record)
+        except IOError as e:
+            logger.error(f"Failed to append to metadata journal: {e}")
+            raise
+        self._apply_record(self.metadata, record)
+        self._journal_records += 1
+        if self._journal_records >= self.compact_every:
+            self._compact()
+
+    def compact_metadata(self) -> None:
+        with self.backend.lock("metadata"):
+            self._catch_up()
+            self._compact()
+
+    def _compact(self) -> None:
+        self._save_metadata(self.metadata)
+        self.journal.reset(self.metadata["journal_seq"])
+        self._journal_records = 0
+        logger.debug("Metadata journal compacted")
 
     def _save_metadata(self, metadata: Dict) -> None:
         try:
-            with open(self.metadata_path, "w") as f:
-                json.dump(metadata, f, indent=2)
+            self.backend.put(
+                "metadata.json", json.dumps(metadata, indent=2).encode("utf-8")
+            )
             logger.debug("Metadata saved successfully")
         except IOError as e:
             logger.error(f"Failed to save metadata: {e}")
             raise
 
-    def _calculate_hash(self, file_path: str) -> str:
+    def _calculate_hash(self, file_path: str, extents: List[List[int]] = None) -> str:
         try:
             sha256 = hashlib.sha256()
             with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
+                for chunk in self._read_chunks(f, extents):
                     sha256.update(chunk)
             file_hash = sha256.hexdigest()
             logger.debug(f"Calculated hash for {file_path}: {file_hash[:8]}...")
@@ -72,14 +345,84 @@ class BackupDatabase:
             logger.error(f"Failed to calculate hash for {file_path}: {e}")
             raise
 
-    def _store_file_content(self, file_path: str) -> str:
+    def _read_chunks(self, f, extents: List[List[int]] = None, chunk_size: int = 4096):
+        if extents is None:
+            chunks = iter(lambda: f.read(chunk_size), b"")
+        else:
+            chunks = read_extents(f, extents)
+        dropper = self._cache_dropper(f)
+        if dropper is None:
+            yield from self._throttled_reads(chunks)
+            return
         try:
-            file_hash = self._calculate_hash(file_path)
-            content_file_path = os.path.join(self.content_path, file_hash)
+            for chunk in self._throttled_reads(chunks):
+                yield chunk
+                dropper.advance(f.tell())
+        finally:
+            dropper.finish()
+
+    def _throttled_reads(self, chunks):
+        if not self.throttle.limits_io:
+            yield from chunks
+            return
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, b"")
+            if not chunk:
+                return
+            self.throttle.observe_read(len(chunk), time.perf_counter() - start)
+            self.throttle.read(len(chunk))
+            yield chunk
+
+    def _drops_cache(self, size: int) -> bool:
+        # Keeping large files out of the page cache protects the working set
+        # of whatever else runs on the host; small files are not worth the
+        # extra system calls unless asked for.
+        if not pagecache.SUPPORTED or self.drop_cache == "never":
+            return False
+        return self.drop_cache == "always" or size >= self.drop_cache_min_size
 
-            if not os.path.exists(content_file_path):
+    def _cache_dropper(self, f, size: int = None, write: bool = False) -> Optional[CacheDropper]:
+        if size is None:
+            size = os.fstat(f.fileno()).st_size
+        if not self._drops_cache(size):
+            return None
+        return CacheDropper(f.fileno(), write=write)
+
+    def _drop_stored(self, file_hashes: Iterable[str]) -> None:
+        if isinstance(self.backend, LocalBackend):
+            for file_hash in file_hashes:
+                drop_cache(self.backend.path(f"content/{file_hash}"))
+
+    def _write_chunks(self, chunks):
+        for chunk in chunks:
+            self.throttle.write(len(chunk))
+            yield chunk
+
+    def _store_file_content(self, file_path: str, extents: List[List[int]] = None) -> str:
+        try:
+            file_hash = self._calculate_hash(file_path, extents)
+
+            if not self._has_content(file_hash):
                 logger.debug(f"Storing new file content: {file_hash[:8]}...")
-                shutil.copy2(file_path, content_file_path)
+                size = (
+                    os.path.getsize(file_path) if extents is None
+                    else sum(length for _, length in extents)
+                )
+                if extents is None and not self.throttle.limits_io:
+                    self.backend.put_file(f"content/{file_hash}", file_path)
+                    if self._drops_cache(size):
+                        drop_cache(file_path)
+                else:
+                    with open(file_path, "rb") as f:
+                        chunks = self._read_chunks(f, extents, 1024 * 1024)
+                        self.backend.put_chunks(
+                            f"content/{file_hash}", self._write_chunks(chunks)
+                        )
+                if self._drops_cache(size):
+                    self._drop_stored([file_hash])
+                self.content_index.add(file_hash)
+                self._record_blob_size(file_hash, size, size)
             else:
                 logger.debug(f"File content already exists: {file_hash[:8]}...")
 
@@ -88,64 +431,540 @@ class BackupDatabase:
             logger.error(f"Failed to store file content for {file_path}: {e}")
             raise
 
-    def create_snapshot(self, target_dir: str) -> int:
-        target_dir = os.path.abspath(target_dir)
-        if not os.path.isdir(target_dir):
-            logger.error(f"Target directory does not exist: {target_dir}")
-            raise FileNotFoundError(f"Target directory does not exist: {target_dir}")
+    def _store_delta(self, file_path: str, previous):
+        # Store a new version of a path as a delta against the version in
+        # the previous snapshot; ``None`` means store it normally.
+        if isinstance(previous, str):
+            chain = [previous]
+        elif isinstance(previous, dict) and "chain" in previous:
+            chain = previous["chain"]
+        else:
+            return None
+        size = os.path.getsize(file_path)
+        if not self.delta.candidate(size):
+            return None
+        if len(chain) > self.delta.max_depth:
+            logger.debug(f"Delta chain for {file_path} at maximum depth, storing in full")
+            return None
 
-        snapshot_id = self.metadata["next_snapshot_id"]
-        timestamp = datetime.datetime.now().isoformat()
+        with open(file_path, "rb") as f:
+            data = b"".join(self._read_chunks(f, None, 1024 * 1024))
+        file_hash = hashlib.sha256(data).hexdigest()
+        if file_hash == _entry_hash(previous):
+            return previous
+        if self._has_content(file_hash):
+            return file_hash
 
-        logger.info(f"Creating snapshot {snapshot_id} of {target_dir}")
+        delta = compute_delta(
+            self._read_version(chain), data, limit=int(len(data) * self.delta.max_ratio)
+        )
+        if delta is None:
+            logger.debug(f"Delta for {file_path} too large, storing in full")
+            self._put_content(file_hash, [data], len(data))
+            return file_hash
 
-        snapshot = {
-            "id": snapshot_id,
-            "timestamp": timestamp,
-            "target_dir": target_dir,
-            "files": {},
+        delta_hash = hashlib.sha256(delta).hexdigest()
+        logger.debug(
+            f"Storing {file_path} as {len(delta)} byte delta against {chain[0][:8]}..."
+        )
+        if not self._has_content(delta_hash):
+            self._put_content(delta_hash, [delta], len(data))
+        self._versions.put(delta_hash, data)
+        return {"hash": file_hash, "size": len(data), "chain": [delta_hash] + chain}
+
+    def _put_content(self, file_hash: str, chunks, logical_size: int) -> None:
+        stored = sum(len(chunk) for chunk in chunks)
+        self.backend.put_chunks(f"content/{file_hash}", self._write_chunks(chunks))
+        self.content_index.add(file_hash)
+        self._record_blob_size(file_hash, stored, logical_size)
+
+    def _read_version(self, chain: List[str]) -> bytes:
+        """Return the content at the head of a delta chain."""
+        data = self._versions.get(chain[0])
+        if data is not None:
+            return data
+        try:
+            blob = self.backend.get(f"content/{chain[0]}")
+        except IOError as e:
+            logger.error(f"Failed to read content {chain[0][:8]}...: {e}")
+            raise
+        data = blob if len(chain) == 1 else apply_delta(self._read_version(chain[1:]), blob)
+        self._versions.put(chain[0], data)
+        return data
+
+    def _store_entry(self, file_path: str, previous=None, size: int = None,
+                     append_only: bool = False):
+        if size is None:
+            size = os.path.getsize(file_path)
+        if size <= self.inline_threshold:
+            entry = self._inline_entry(file_path, size)
+            if entry is not None:
+                return entry
+
+        extents = data_extents(file_path)
+        if extents is None:
+            if previous is not None and self.delta.enabled:
+                entry = self._store_delta(file_path, previous)
+                if entry is not None:
+                    return entry
+            # Files in the delta size range are left to delta compression.
+            if (self.append_min_size and size >= self.append_min_size
+                    and not self.delta.candidate(size)):
+                return self._store_segmented(file_path, size, previous, append_only)
+            return self._store_file_content(file_path)
+
+        # Sparse files are stored as their packed data extents; the extent map
+        # in the manifest lets restore put the holes back.
+        logger.debug(f"Storing {file_path} as sparse file with {len(extents)} extents")
+        return {
+            "hash": self._store_file_content(file_path, extents),
+            "size": os.path.getsize(file_path),
+            "extents": extents,
         }
 
-        file_count = 0
-        total_size = 0
+    def _store_segmented(self, file_path: str, size: int, previous=None,
+                         append_only: bool = False) -> Dict:
+        """Store a large file as a list of segments with an append fingerprint.
+
+        If the file grew since ``previous``, the fingerprint of its first
+        block and of the block at the old end still matches and the old
+        range still hashes to the previous segments, those segments are kept
+        and only the appended bytes are stored as a new segment. For files
+        matching an ``append_only`` pattern the fingerprint alone is trusted,
+        so only the appended bytes are read. Otherwise the file is stored in
+        full as a single segment.
+        """
+        if _is_segmented(previous):
+            old_size = previous["size"]
+            if (size > old_size and len(previous["chunks"]) < _MAX_SEGMENTS
+                    and self._fingerprint_matches(file_path, previous)
+                    and (append_only or self._segments_match(file_path, previous))):
+                tail = self._store_file_content(file_path, [[old_size, size - old_size]])
+                logger.debug(
+                    f"Stored {size - old_size} bytes appended to {file_path} "
+                    f"as segment {tail[:8]}..."
+                )
+                return self._segmented_entry(
+                    file_path, size, previous["chunks"] + [tail],
+                    previous["lengths"] + [size - old_size],
+                )
+            # Unchanged files are recognised segment by segment, since there
+            # is no hash of the whole file to compare with.
+            if (size == old_size and len(previous["chunks"]) > 1
+                    and self._segments_match(file_path, previous)):
+                return previous
+        return self._segmented_entry(
+            file_path, size, [self._store_file_content(file_path)], [size]
+        )
+
+    def _segmented_entry(self, file_path: str, size: int,
+                         segments: List[str], lengths: List[int]) -> Dict:
+        block = min(_APPEND_BLOCK, size)
+        return {
+            "size": size,
+            "chunks": segments,
+            "lengths": lengths,
+            "fingerprint": {
+                "block": block,
+                "head": self._calculate_hash(file_path, [[0, block]]),
+                "end": self._calculate_hash(file_path, [[size - block, block]]),
+            },
+        }
+
+    def _segments_match(self, file_path: str, previous: Dict) -> bool:
+        offset = 0
+        for segment, length in zip(previous["chunks"], previous["lengths"]):
+            if self._calculate_hash(file_path, [[offset, length]]) != segment:
+                return False
+            offset += length
+        return True
+
+    def _fingerprint_matches(self, file_path: str, previous: Dict) -> bool:
+        fingerprint = previous["fingerprint"]
+        block = fingerprint["block"]
+        if self._calculate_hash(file_path, [[0, block]]) != fingerprint["head"]:
+            return False
+        end = self._calculate_hash(file_path, [[previous["size"] - block, block]])
+        return end == fingerprint["end"]
+
+    def _inline_entry(self, file_path: str, size: int) -> Optional[Dict]:
+        # Tiny files are embedded in the manifest rather than the content
+        # store; empty ones are not even opened.
+        if size == 0:
+            return {"data": ""}
+        try:
+            with open(file_path, "rb") as f:
+                # One read is enough to tell whether the file still fits.
+                data = f.read(self.inline_threshold + 1)
+            self.throttle.read(len(data))
+        except IOError as e:
+            logger.error(f"Failed to read {file_path}: {e}")
+            raise
+        if len(data) > self.inline_threshold:
+            # Grew since it was listed; store it normally.
+            return None
+        return {"data": base64.b64encode(data).decode("ascii")}
+
+    def _store_stream(self, stream: BinaryIO,
+                      progress: Callable[[int], None] = None) -> Dict:
+        # Fixed-size chunks, so a prefix that did not change since the last
+        # dump maps to the same blobs and is not stored again.
+        sha256 = hashlib.sha256()
+        chunks = []
+        size = 0
+        while True:
+            chunk = _read_full(stream, self.stream_chunk_size)
+            if not chunk:
+                break
+            self.throttle.read(len(chunk))
+            sha256.update(chunk)
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            if not self._has_content(chunk_hash):
+                self._put_content(chunk_hash, [chunk], len(chunk))
+            chunks.append(chunk_hash)
+            size += len(chunk)
+            if progress is not None:
+                progress(size)
+        return {"hash": sha256.hexdigest(), "size": size, "chunks": chunks}
+
+    def _restore_entry(self, entry, target_path: str) -> None:
+        if isinstance(entry, dict) and "chunks" in entry:
+            # Segmented files carry no hash of the whole file; their segments
+            # are verified one by one instead.
+            sha256 = hashlib.sha256()
+            chunks = self._iter_chunked(entry, verify="hash" not in entry)
+            with open(target_path, "wb") as f:
+                dropper = self._cache_dropper(f, entry["size"], write=True)
+                for chunk in self._write_chunks(chunks):
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    if dropper is not None:
+                        f.flush()
+                        dropper.advance(f.tell())
+            if "hash" in entry and sha256.hexdigest() != entry["hash"]:
+                raise IOError(f"Restored content does not match {entry['hash'][:8]}...")
+            return
+        if isinstance(entry, dict) and "data" in entry:
+            with open(target_path, "wb") as f:
+                for chunk in self._write_chunks([base64.b64decode(entry["data"])]):
+                    f.write(chunk)
+            return
+        if isinstance(entry, dict) and "chain" in entry:
+            data = self._read_version(entry["chain"])
+            if hashlib.sha256(data).hexdigest() != entry["hash"]:
+                raise IOError(f"Reconstructed content does not match {entry['hash'][:8]}...")
+            with open(target_path, "wb") as f:
+                for chunk in self._write_chunks([data]):
+                    f.write(chunk)
+            return
+        if isinstance(entry, str):
+            if not self.throttle.limits_io:
+                self.backend.get_file(f"content/{entry}", target_path)
+                return
+            with open(target_path, "wb") as f:
+                for chunk in self._write_chunks(
+                    self.backend.get_chunks(f"content/{entry}")
+                ):
+                    f.write(chunk)
+            return
+        write_sparse(
+            target_path,
+            entry["size"],
+            entry["extents"],
+            self._write_chunks(self.backend.get_chunks(f"content/{entry['hash']}")),
+        )
+
+    def _iter_chunked(self, entry: Dict, verify: bool = False) -> Iterator[bytes]:
+        for chunk_hash in entry["chunks"]:
+            if not verify:
+                yield from self.backend.get_chunks(f"content/{chunk_hash}")
+                continue
+            sha256 = hashlib.sha256()
+            for data in self.backend.get_chunks(f"content/{chunk_hash}"):
+                sha256.update(data)
+                yield data
+            if sha256.hexdigest() != chunk_hash:
+                raise IOError(f"Segment does not match {chunk_hash[:8]}...")
+
+    def _has_content(self, file_hash: str) -> bool:
+        if file_hash not in self.content_index:
+            return False
+        if self.confirm_index_hits:
+            if not self.backend.exists(f"content/{file_hash}"):
+                logger.warning(
+                    f"Content index entry {file_hash[:8]}... missing from store"
+                )
+                return False
+        return True
+
+    def _iter_batches(self, target_dir: str, processed: Dict):
+        # Files are read in batches ordered by on-disk locality; the manifest
+        # is sorted by path afterwards, so the order never leaks into it.
+        batch = []
         for root, _, files in os.walk(target_dir):
             for file in files:
                 file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, target_dir)
+                if rel_path in processed:
+                    continue
                 try:
-                    rel_path = os.path.relpath(file_path, target_dir)
+                    batch.append((file_path, rel_path, os.lstat(file_path)))
+                except OSError as e:
+                    logger.warning(f"Failed to process file {file_path}: {e}")
+                    continue
+                if len(batch) >= self.read_batch:
+                    yield order_batch(batch, self.read_order)
+                    batch = []
+        if batch:
+            yield order_batch(batch, self.read_order)
+
+    def _is_append_only(self, rel_path: str) -> bool:
+        return any(fnmatch.fnmatch(rel_path, pattern) for pattern in self.append_only)
+
+    def _previous_files(self, target_dir: str,
+                        keep: Callable[[Any], bool] = None) -> Dict:
+        previous = [
+            s["id"] for s in self.metadata["snapshots"] if s["target_dir"] == target_dir
+        ]
+        if not previous:
+            return {}
+        snapshot_id = max(previous)
+        if keep is not None:
+            # Streamed, holding only the entries asked for.
+            try:
+                return {
+                    rel_path: entry for rel_path, entry in
+                    iter_files(self.backend.get_chunks(f"snapshots/{snapshot_id}"))
+                    if keep(entry)
+                }
+            except (IOError, ValueError) as e:
+                logger.warning(f"Cannot read snapshot {snapshot_id}: {e}")
+                return {}
+        snapshot = self.get_snapshot(snapshot_id)
+        return snapshot["files"] if snapshot else {}
+
+    def _find_partial(self, target_dir: str) -> Optional[Tuple[Dict, List[Dict]]]:
+        committed = {s["id"] for s in self.metadata["snapshots"]}
+        found = None
+        for header, records in iter_partials(self.backend):
+            if header["target_dir"] != target_dir or header["id"] in committed:
+                continue
+            if found is None or header["id"] > found[0]["id"]:
+                found = (header, records)
+        return found
+
+    def create_snapshot(self, target_dir: str, resume: bool = False,
+                        progress: Callable[[int, int], None] = None) -> int:
+        self._check_writable()
+        target_dir = os.path.abspath(target_dir)
+        if not os.path.isdir(target_dir):
+            logger.error(f"Target directory does not exist: {target_dir}")
+            raise FileNotFoundError(f"Target directory does not exist: {target_dir}")
+
+        self.throttle.apply_priority()
+        partial = self._find_partial(target_dir) if resume else None
+        if partial is not None:
+            header, records = partial
+            snapshot_id = header["id"]
+            timestamp = header["timestamp"]
+            logger.info(
+                f"Resuming snapshot {snapshot_id} of {target_dir} "
+                f"with {len(records)} files already processed"
+            )
+        else:
+            if resume:
+                logger.info(f"No interrupted snapshot of {target_dir} to resume")
+            records = []
+            # Reserve the id so that an interrupted snapshot keeps it.
+            snapshot_id = self._reserve_snapshot_id()
+            timestamp = datetime.datetime.now().isoformat()
+            logger.info(f"Creating snapshot {snapshot_id} of {target_dir}")
+
+        checkpoint = SnapshotCheckpoint(
+            self.backend, snapshot_id, self.checkpoint_every, self.checkpoint_interval
+        )
+        header = {"id": snapshot_id, "timestamp": timestamp, "target_dir": target_dir}
+        if partial is None:
+            checkpoint.start(header)
+
+        # File entries are spilled to sorted runs once they exceed the memory
+        # budget, so memory does not grow with the size of the tree.
+        manifest = ManifestWriter(self.manifest_memory)
+        try:
+            file_count, total_size, hardlinks = self._snapshot_files(
+                target_dir, records, manifest, checkpoint, progress
+            )
+            try:
+                self.backend.sync()
+                self.backend.put_chunks(
+                    f"snapshots/{snapshot_id}",
+                    manifest.chunks(header, {"hardlinks": hardlinks}),
+                )
+                # The manifest must be durable before the catalog names it.
+                self.backend.sync()
+            except IOError as e:
+                logger.error(f"Failed to save snapshot {snapshot_id}: {e}")
+                raise
+            spilled = manifest.spilled
+        finally:
+            manifest.close()
 
-                    file_hash = self._store_file_content(file_path)
+        self._commit(
+            {
+                "op": "add",
+                "snapshot": {
+                    "id": snapshot_id,
+                    "timestamp": timestamp,
+                    "target_dir": target_dir,
+                    "file_count": file_count,
+                    "total_size": total_size,
+                },
+            }
+        )
 
-                    snapshot["files"][rel_path] = file_hash
+        checkpoint.discard()
+        for partial_id in discard_partials(self.backend, target_dir, snapshot_id):
+            logger.info(f"Discarded interrupted snapshot {partial_id} of {target_dir}")
+        self._flush_blob_sizes()
 
+        logger.info(
+            f"Snapshot {snapshot_id} created successfully with {file_count} files "
+            f"({total_size} bytes, {spilled} manifest entries spilled, "
+            f"peak RSS {_peak_rss() // (1024 * 1024)} MiB)"
+        )
+        return snapshot_id
+
+    def _snapshot_files(self, target_dir: str, records: List[Dict],
+                        manifest: ManifestWriter, checkpoint: SnapshotCheckpoint,
+                        progress: Callable[[int, int], None] = None) -> Tuple[int, int, List]:
+        """Store every file under ``target_dir`` and add it to ``manifest``.
+
+        Returns the file count, total size and hardlink groups.
+        """
+        if self.delta.enabled:
+            previous_files = self._previous_files(target_dir)
+        elif self.append_min_size:
+            # Only segmented entries are needed to detect appended files.
+            previous_files = self._previous_files(target_dir, _is_segmented)
+        else:
+            previous_files = {}
+
+        # Inodes with several links are hashed once; the other names are
+        # recorded as a hardlink group headed by the first path seen. Only
+        # multiply-linked files are remembered here.
+        inodes = {}
+        heads = {}
+        links = {}
+
+        file_count = 0
+        total_size = 0
+        processed = set()
+        for record in records:
+            rel_path = record["path"]
+            if "link" in record:
+                entry = heads[record["link"]]
+                links.setdefault(record["link"], [record["link"]]).append(rel_path)
+            else:
+                entry = record["entry"]
+                if "inode" in record:
+                    inodes[tuple(record["inode"])] = rel_path
+                    heads[rel_path] = entry
+            manifest.add(rel_path, entry)
+            processed.add(rel_path)
+            file_count += 1
+            total_size += record["size"]
+
+        for batch in self._iter_batches(target_dir, processed):
+            for file_path, rel_path, st in batch:
+                try:
+                    self.throttle.file()
+                    size = os.path.getsize(file_path)
+                    record = {"path": rel_path, "size": size}
+                    inode = (st.st_dev, st.st_ino)
+                    if st.st_nlink > 1 and stat.S_ISREG(st.st_mode) and inode in inodes:
+                        first = inodes[inode]
+                        entry = heads[first]
+                        links.setdefault(first, [first]).append(rel_path)
+                        record["link"] = first
+                    else:
+                        entry = self._store_entry(
+                            file_path, previous_files.get(rel_path), size,
+                            self._is_append_only(rel_path),
+                        )
+                        record["entry"] = entry
+                        if st.st_nlink > 1 and stat.S_ISREG(st.st_mode):
+                            inodes[inode] = rel_path
+                            heads[rel_path] = entry
+                            record["inode"] = list(inode)
+
+                    checkpoint.record(record)
+                    manifest.add(rel_path, entry)
                     file_count += 1
-                    total_size += os.path.getsize(file_path)
+                    total_size += size
+                    if progress is not None:
+                        progress(file_count, total_size)
                 except Exception as e:
                     logger.warning(f"Failed to process file {file_path}: {e}")
                     continue
 
-        snapshot_path = os.path.join(self.snapshots_path, str(snapshot_id))
+        return file_count, total_size, list(links.values())
+
+    def create_stream_snapshot(self, stream: BinaryIO, name: str,
+                               progress: Callable[[int, int], None] = None) -> int:
+        """Snapshot the bytes read from ``stream`` as a single file ``name``.
+
+        Data is hashed and stored chunk by chunk as it arrives, so memory use
+        does not depend on the stream length. The snapshot's target is
+        recorded as ``stdin:<name>``.
+        """
+        self._check_writable()
+        rel_path = os.path.normpath(name)
+        if not name or os.path.isabs(rel_path) or rel_path.split(os.sep)[0] == os.pardir:
+            raise ValueError(f"Invalid stream name: {name}")
+
+        snapshot_id = self._reserve_snapshot_id()
+        timestamp = datetime.datetime.now().isoformat()
+        target_dir = f"stdin:{rel_path}"
+        logger.info(f"Creating snapshot {snapshot_id} of {target_dir}")
+
+        entry = self._store_stream(
+            stream, None if progress is None else lambda size: progress(0, size)
+        )
+        snapshot = {
+            "id": snapshot_id,
+            "timestamp": timestamp,
+            "target_dir": target_dir,
+            "files": {rel_path: entry},
+            "hardlinks": [],
+        }
         try:
-            with open(snapshot_path, "w") as f:
-                json.dump(snapshot, f, indent=2)
+            self.backend.sync()
+            self.backend.put(
+                f"snapshots/{snapshot_id}", json.dumps(snapshot, indent=2).encode("utf-8")
+            )
         except IOError as e:
             logger.error(f"Failed to save snapshot {snapshot_id}: {e}")
             raise
 
-        self.metadata["next_snapshot_id"] = snapshot_id + 1
-        self.metadata["snapshots"].append(
+        self._commit(
             {
-                "id": snapshot_id,
-                "timestamp": timestamp,
-                "target_dir": target_dir,
-                "file_count": file_count,
-                "total_size": total_size,
+                "op": "add",
+                "snapshot": {
+                    "id": snapshot_id,
+                    "timestamp": timestamp,
+                    "target_dir": target_dir,
+                    "file_count": 1,
+                    "total_size": entry["size"],
+                },
             }
         )
-        self._save_metadata(self.metadata)
+        self._flush_blob_sizes()
+        if progress is not None:
+            progress(1, entry["size"])
 
         logger.info(
-            f"Snapshot {snapshot_id} created successfully with {file_count} files ({total_size} bytes)"
+            f"Snapshot {snapshot_id} created successfully from stream "
+            f"({entry['size']} bytes in {len(entry['chunks'])} chunks)"
         )
         return snapshot_id
 
@@ -154,25 +973,24 @@ class BackupDatabase:
         return self.metadata["snapshots"]
 
     def get_snapshot(self, snapshot_id: int) -> Optional[Dict]:
-        snapshot_path = os.path.join(self.snapshots_path, str(snapshot_id))
-        if not os.path.exists(snapshot_path):
+        try:
+            return json.loads(self.backend.get(f"snapshots/{snapshot_id}"))
+        except FileNotFoundError:
             logger.warning(f"Snapshot {snapshot_id} not found")
             return None
-
-        try:
-            with open(snapshot_path, "r") as f:
-                return json.load(f)
         except (json.JSONDecodeError, IOError) as e:
             logger.error(f"Failed to load snapshot {snapshot_id}: {e}")
             return None
 
-    def restore_snapshot(self, snapshot_id: int, output_dir: str) -> bool:
+    def restore_snapshot(self, snapshot_id: int, output_dir: str,
+                         progress: Callable[[int, int], None] = None) -> bool:
         snapshot = self.get_snapshot(snapshot_id)
         if snapshot is None:
             logger.error(f"Cannot restore: Snapshot {snapshot_id} not found")
             return False
 
         logger.info(f"Restoring snapshot {snapshot_id} to {output_dir}")
+        self.throttle.apply_priority()
 
         try:
             os.makedirs(output_dir, exist_ok=True)
@@ -180,12 +998,33 @@ class BackupDatabase:
             logger.error(f"Failed to create output directory {output_dir}: {e}")
             return False
 
+        available = self.backend.exists_many(
+            {
+                f"content/{file_hash}"
+                for entry in snapshot["files"].values()
+                for file_hash in _entry_hashes(entry)
+            }
+        )
+
+        linked = {
+            rel_path: group[0]
+            for group in snapshot.get("hardlinks", [])
+            for rel_path in group[1:]
+        }
+
         restored_count = 0
-        for rel_path, file_hash in snapshot["files"].items():
-            source_path = os.path.join(self.content_path, file_hash)
-            if not os.path.exists(source_path):
+        restored_size = 0
+        failed = 0
+        for rel_path, entry in snapshot["files"].items():
+            if rel_path in linked:
+                continue
+            missing = [
+                file_hash for file_hash in _entry_hashes(entry)
+                if f"content/{file_hash}" not in available
+            ]
+            if missing:
                 logger.warning(
-                    f"Content for file {rel_path} (hash: {file_hash}) not found in database"
+                    f"Content for file {rel_path} (hash: {missing[0]}) not found in database"
                 )
                 continue
 
@@ -193,16 +1032,58 @@ class BackupDatabase:
             try:
                 os.makedirs(os.path.dirname(target_path), exist_ok=True)
 
-                shutil.copy2(source_path, target_path)
+                self.throttle.file()
+                self._restore_entry(entry, target_path)
                 restored_count += 1
+                size = os.path.getsize(target_path)
+                restored_size += size
+                if self._drops_cache(size):
+                    drop_cache(target_path)
+                    self._drop_stored(_entry_hashes(entry))
+                if progress is not None:
+                    progress(restored_count, restored_size)
             except OSError as e:
-                logger.warning(f"Failed to restore file {rel_path}: {e}")
+                logger.error(f"Failed to restore file {rel_path}: {e}")
+                failed += 1
+                # A partly written file must not pass for a restored one.
+                try:
+                    if os.path.lexists(target_path):
+                        os.remove(target_path)
+                except OSError as e:
+                    logger.warning(f"Failed to remove partial file {target_path}: {e}")
+                continue
+
+        for rel_path, first in linked.items():
+            source_path = os.path.join(output_dir, first)
+            target_path = os.path.join(output_dir, rel_path)
+            if not os.path.exists(source_path):
+                logger.warning(f"Cannot link {rel_path}: {first} was not restored")
+                continue
+            try:
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                if os.path.lexists(target_path):
+                    os.remove(target_path)
+                try:
+                    os.link(source_path, target_path)
+                except OSError as e:
+                    logger.debug(f"Hardlink failed for {rel_path}, copying instead: {e}")
+                    shutil.copy2(source_path, target_path)
+                restored_count += 1
+                if progress is not None:
+                    progress(restored_count, restored_size)
+            except OSError as e:
+                logger.error(f"Failed to restore file {rel_path}: {e}")
+                failed += 1
                 continue
 
         logger.info(f"Restored {restored_count} files from snapshot {snapshot_id}")
+        if failed:
+            logger.error(f"Failed to restore {failed} files from snapshot {snapshot_id}")
+            return False
         return True
 
     def prune_snapshot(self, snapshot_id: int) -> bool:
+        self._check_writable()
         snapshot = self.get_snapshot(snapshot_id)
         if snapshot is None:
             logger.error(f"Cannot prune: Snapshot {snapshot_id} not found")
@@ -210,61 +1091,184 @@ class BackupDatabase:
 
         logger.info(f"Pruning snapshot {snapshot_id}")
 
-        snapshot_path = os.path.join(self.snapshots_path, str(snapshot_id))
         try:
-            os.remove(snapshot_path)
+            self.backend.delete(f"snapshots/{snapshot_id}")
         except OSError as e:
-            logger.error(f"Failed to remove snapshot file {snapshot_path}: {e}")
+            logger.error(f"Failed to remove snapshot {snapshot_id}: {e}")
             return False
 
-        self.metadata["snapshots"] = [
-            s for s in self.metadata["snapshots"] if s["id"] != snapshot_id
-        ]
-        self._save_metadata(self.metadata)
+        self._commit({"op": "remove", "id": snapshot_id})
 
         used_hashes = set()
         for s_id in [s["id"] for s in self.metadata["snapshots"]]:
             s = self.get_snapshot(s_id)
             if s:
-                used_hashes.update(s["files"].values())
+                for entry in s["files"].values():
+                    used_hashes.update(_entry_hashes(entry))
+        # Blobs of interrupted snapshots stay so that they can be resumed.
+        for _, records in iter_partials(self.backend):
+            for record in records:
+                if "entry" in record:
+                    used_hashes.update(_entry_hashes(record["entry"]))
 
-        removed_count = 0
-        for content_file in os.listdir(self.content_path):
-            if content_file not in used_hashes:
-                try:
-                    os.remove(os.path.join(self.content_path, content_file))
-                    removed_count += 1
-                except OSError as e:
-                    logger.warning(
-                        f"Failed to remove unused content file {content_file}: {e}"
-                    )
-                    continue
+        stored = [key[len("content/"):] for key in self.backend.list("content/")]
+        unused = [f"content/{name}" for name in stored if name not in used_hashes]
+        failed = self.backend.delete_many(unused)
+        for content_key, error in failed.items():
+            logger.warning(f"Failed to remove unused content file {content_key}: {error}")
+        removed_count = len(unused) - len(failed)
+        self.content_index.rebuild(
+            name for name in stored
+            if name in used_hashes or f"content/{name}" in failed
+        )
 
         logger.info(
             f"Pruned snapshot {snapshot_id} and removed {removed_count} unused content files"
         )
         return True
 
+    def space_usage(self) -> Dict:
+        """Logical, unique and shared bytes per snapshot and target directory."""
+        index = self._sync_refcounts()
+        return index.usage(self.metadata["snapshots"])
+
+    def _sync_refcounts(self) -> RefcountIndex:
+        index = self.refcounts
+        current = {snapshot["id"] for snapshot in self.metadata["snapshots"]}
+        stale = index.snapshots - current
+        missing = current - index.snapshots
+        if index.loaded and not stale and not missing:
+            return index
+
+        for snapshot_id in sorted(missing):
+            # Streamed so that large manifests are never loaded whole.
+            entries = (
+                entry for _, entry in
+                iter_files(self.backend.get_chunks(f"snapshots/{snapshot_id}"))
+            )
+            logical = {}
+
+            def hashes(entries=entries, logical=logical):
+                for entry in entries:
+                    if isinstance(entry, dict) and "chain" in entry:
+                        # A delta blob is logically as large as the version
+                        # it encodes.
+                        logical[entry["chain"][0]] = entry["size"]
+                    yield from _entry_hashes(entry)
+
+            # add_snapshot collects every hash before sizing new blobs, so
+            # ``logical`` is complete by the time it is consulted.
+            try:
+                index.add_snapshot(
+                    snapshot_id,
+                    hashes(),
+                    lambda file_hash: self._blob_size(file_hash, logical.get(file_hash)),
+                )
+            except (IOError, ValueError) as e:
+                logger.warning(f"Cannot read snapshot {snapshot_id} for refcounts: {e}")
+        # Removed last, so that blobs shared with new snapshots keep their
+        # known sizes.
+        index.remove_snapshots(stale)
+        try:
+            index.save()
+            self._tracks_blob_sizes = True
+        except OSError as e:
+            logger.warning(f"Failed to save refcount index: {e}")
+        logger.debug(
+            f"Refcount index updated: +{len(missing)} -{len(stale)} snapshots"
+        )
+        return index
+
+    def _record_blob_size(self, file_hash: str, stored: int, logical: int) -> None:
+        # Only worth remembering once a refcount index exists.
+        if self._tracks_blob_sizes is None:
+            self._tracks_blob_sizes = RefcountIndex(self.refcount_path).exists()
+        if self._tracks_blob_sizes:
+            self._blob_sizes[file_hash] = (stored, logical)
+
+    def _flush_blob_sizes(self) -> None:
+        # The refcount index picks up new snapshots on its next update; the
+        # sizes noted here spare it from looking up every new blob.
+        if self._blob_sizes and not self.read_only:
+            index = self._refcounts or RefcountIndex(self.refcount_path)
+            try:
+                index.record_sizes(self._blob_sizes)
+            except OSError as e:
+                logger.warning(f"Failed to append to refcount log: {e}")
+        self._blob_sizes.clear()
+
+    def _blob_size(self, file_hash: str, logical: int = None) -> Tuple[int, int]:
+        if file_hash in self._blob_sizes:
+            return self._blob_sizes[file_hash]
+        if file_hash in self.refcounts.sizes:
+            return tuple(self.refcounts.sizes[file_hash])
+        try:
+            size = self.backend.size(f"content/{file_hash}")
+        except FileNotFoundError:
+            logger.warning(f"Content {file_hash[:8]}... missing from store")
+            size = 0
+        return size, size if logical is None else logical
+
 
-def create_snapshot(target_dir: str, db_path: str = None) -> int:
+def create_snapshot(target_dir: str, db_path: str = None, resume: bool = False,
+                    throttle: Dict = None, read_order: str = None,
+                    durability: str = None, delta: Dict = None,
+                    manifest_memory: int = None, inline_threshold: int = None,
+                    drop_cache: str = None) -> int:
     logger.info(f"Creating snapshot of {target_dir}")
-    db = BackupDatabase(db_path)
-    return db.create_snapshot(target_dir)
+    db = BackupDatabase(
+        db_path, throttle=throttle, read_order=read_order, durability=durability,
+        delta=delta, manifest_memory=manifest_memory, inline_threshold=inline_threshold,
+        drop_cache=drop_cache,
+    )
+    try:
+        return db.create_snapshot(target_dir, resume=resume)
+    finally:
+        db.close()
+
+
+def create_stream_snapshot(stream: BinaryIO, name: str, db_path: str = None,
+                           throttle: Dict = None, durability: str = None) -> int:
+    logger.info(f"Creating snapshot of stream {name}")
+    db = BackupDatabase(db_path, throttle=throttle, durability=durability)
+    try:
+        return db.create_stream_snapshot(stream, name)
+    finally:
+        db.close()
 
 
 def list_snapshots(db_path: str = None) -> List[Dict]:
     logger.info("Listing snapshots")
-    db = BackupDatabase(db_path)
-    return db.list_snapshots()
+    db = BackupDatabase(db_path, read_only=True)
+    try:
+        return db.list_snapshots()
+    finally:
+        db.close()
 
 
-def restore_snapshot(snapshot_id: int, output_dir: str, db_path: str = None) -> bool:
+def restore_snapshot(snapshot_id: int, output_dir: str, db_path: str = None,
+                     throttle: Dict = None, drop_cache: str = None) -> bool:
     logger.info(f"Restoring snapshot {snapshot_id} to {output_dir}")
+    db = BackupDatabase(db_path, read_only=True, throttle=throttle, drop_cache=drop_cache)
+    try:
+        return db.restore_snapshot(snapshot_id, output_dir)
+    finally:
+        db.close()
+
+
+def space_usage(db_path: str = None) -> Dict:
+    logger.info("Computing space usage")
     db = BackupDatabase(db_path)
-    return db.restore_snapshot(snapshot_id, output_dir)
+    try:
+        return db.space_usage()
+    finally:
+        db.close()
 
 
 def prune_snapshot(snapshot_id: int, db_path: str = None) -> bool:
     logger.info(f"Pruning snapshot {snapshot_id}")
     db = BackupDatabase(db_path)
-    return db.prune_snapshot(snapshot_id)
+    try:
+        return db.prune_snapshot(snapshot_id)
+    finally:
+        db.close()
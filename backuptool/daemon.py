@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import inspect
+import socket
+import logging
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from .client import (
+    INVALID_PARAMS,
+    JOB_FAILED,
+    METHOD_NOT_FOUND,
+    PARSE_ERROR,
+    QUEUE_FULL,
+    WRONG_REPOSITORY,
+    DaemonError,
+    repository_location,
+)
+from .repository import Repository
+
+logger = logging.getLogger("backuptool.daemon")
+
+JOB_METHODS = ("snapshot", "restore", "prune")
+
+
+class Job:
+    def __init__(self, job_id: int, method: str, params: Dict):
+        self.id = job_id
+        self.method = method
+        self.params = params
+        self.state = "queued"
+        self.files = 0
+        self.bytes = 0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def update(self, files: int, nbytes: int) -> None:
+        self.files = files
+        self.bytes = nbytes
+
+    def to_dict(self) -> Dict:
+        return {
+            "job": self.id,
+            "method": self.method,
+            "params": self.params,
+            "state": self.state,
+            "files": self.files,
+            "bytes": self.bytes,
+            "result": self.result,
+            "error": self.error,
+            "submitted": self.submitted,
+            "finished": self.finished,
+        }
+
+
+class _SharedLock:
+    """Lock that many holders may share, or one may hold exclusively."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    def acquire_shared(self) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive)
+            self._shared += 1
+
+    def release_shared(self) -> None:
+        with self._cond:
+            self._shared -= 1
+            self._cond.notify_all()
+
+    def acquire_exclusive(self) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive and not self._shared)
+            self._exclusive = True
+
+    def release_exclusive(self) -> None:
+        with self._cond:
+            self._exclusive = False
+            self._cond.notify_all()
+
+
+class BackupDaemon:
+    """Serve one repository over a Unix socket with JSON-RPC 2.0.
+
+    Requests are newline-delimited JSON objects. ``snapshot``, ``restore``
+    and ``prune`` become jobs that run on a pool of ``workers`` threads; at
+    most ``max_queue`` jobs may be waiting or running at once. Snapshots and
+    prunes are serialized with each other, restores run alongside snapshots
+    but never during a prune. By default a job request blocks until the job
+    finishes, with ``progress`` notifications sent every
+    ``progress_interval`` seconds; with ``"wait": false`` the job id is
+    returned immediately and can be polled with ``status``. ``list``,
+    ``jobs``, ``status`` and ``ping`` are answered inline.
+
+    The repository stays open between requests, so its metadata, content
+    index and manifest cache remain warm.
+    """
+
+    JOB_HISTORY = 256
+
+    def __init__(self, socket_path: str, db_path: str = None, workers: int = 2,
+                 max_queue: int = 64, progress_interval: float = 0.5,
+                 **options):
+        self.socket_path = socket_path
+        self.repository = Repository(db_path, **options)
+        self.location = repository_location(self.repository.db.db_path)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.progress_interval = progress_interval
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="backuptool-job"
+        )
+        self._jobs: Dict[int, Job] = {}
+        self._next_job = 1
+        self._jobs_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._restores = _SharedLock()
+        self._server = None
+        self._thread = None
+
+    def start(self) -> None:
+        _remove_stale_socket(self.socket_path)
+        # Load the content index up front so the first snapshot is warm too.
+        if not self.repository.db.read_only:
+            self.repository.db.content_index
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="backuptool-daemon", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Serving {self.location} on {self.socket_path}")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._executor.shutdown(wait=True)
+        self.repository.close()
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+        logger.info("Daemon stopped")
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def submit(self, method: str, params: Dict) -> Job:
+        with self._jobs_lock:
+            active = sum(1 for job in self._jobs.values() if not job.done.is_set())
+            if active >= self.max_queue:
+                raise DaemonError(QUEUE_FULL, f"Job queue is full ({active} jobs)")
+            job = Job(self._next_job, method, params)
+            self._next_job += 1
+            self._jobs[job.id] = job
+            finished = [i for i, j in self._jobs.items() if j.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - self.JOB_HISTORY)]:
+                del self._jobs[job_id]
+        logger.info(f"Queued job {job.id}: {method}")
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job) -> None:
+        job.state = "running"
+        try:
+            job.result = getattr(self, f"_job_{job.method}")(job, **job.params)
+            job.state = "done"
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished = time.time()
+            job.done.set()
+
+    def _job_snapshot(self, job: Job, target_dir: str, resume: bool = False) -> Dict:
+        with self._write_lock:
+            # Also reloads the content index if blobs were pruned without
+            # the daemon, so none is wrongly taken as already stored.
+            self.repository.refresh()
+            return {
+                "snapshot_id": self.repository.create_snapshot(
+                    target_dir, resume=resume, progress=job.update
+                )
+            }
+
+    def _job_restore(self, job: Job, snapshot_id: int, output_dir: str) -> Dict:
+        self._restores.acquire_shared()
+        try:
+            return {
+                "success": self.repository.restore_snapshot(
+                    snapshot_id, output_dir, progress=job.update
+                )
+            }
+        finally:
+            self._restores.release_shared()
+
+    def _job_prune(self, job: Job, snapshot_id: int) -> Dict:
+        with self._write_lock:
+            self._restores.acquire_exclusive()
+            try:
+                self.repository.refresh()
+                return {"success": self.repository.prune_snapshot(snapshot_id)}
+            finally:
+                self._restores.release_exclusive()
+
+    def list_snapshots(self) -> List[Dict]:
+        # Pick up changes made without the daemon unless a write job is
+        # running, in which case the in-memory metadata is the latest.
+        if self._write_lock.acquire(blocking=False):
+            try:
+                self.repository.refresh()
+            finally:
+                self._write_lock.release()
+        return self.repository.list_snapshots()
+
+    def job(self, job_id: int) -> Job:
+        with self._jobs_lock:
+            if job_id not in self._jobs:
+                raise DaemonError(INVALID_PARAMS, f"Unknown job {job_id}")
+            return self._jobs[job_id]
+
+    def jobs(self) -> List[Dict]:
+        with self._jobs_lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def dispatch(self, request: Dict, send: Callable[[Dict], None]) -> Any:
+        method = request.get("method")
+        params = dict(request.get("params") or {})
+        db_path = params.pop("db_path", None)
+        if db_path is not None and repository_location(db_path) != self.location:
+            raise DaemonError(
+                WRONG_REPOSITORY, f"Daemon serves {self.location}, not {db_path}"
+            )
+
+        if method == "ping":
+            return {"location": self.location, "pid": os.getpid()}
+        if method == "list":
+            return {"snapshots": self.list_snapshots()}
+        if method == "jobs":
+            return {"jobs": self.jobs()}
+        if method == "status":
+            if "job" not in params:
+                raise DaemonError(INVALID_PARAMS, "status requires a job id")
+            return self.job(params["job"]).to_dict()
+        if method not in JOB_METHODS:
+            raise DaemonError(METHOD_NOT_FOUND, f"Unknown method: {method}")
+
+        wait = params.pop("wait", True)
+        try:
+            inspect.signature(getattr(self, f"_job_{method}")).bind(None, **params)
+        except TypeError as e:
+            raise DaemonError(INVALID_PARAMS, str(e))
+        job = self.submit(method, params)
+        if not wait:
+            return {"job": job.id}
+
+        reported = None
+        while not job.done.wait(self.progress_interval):
+            current = (job.state, job.files, job.bytes)
+            if current != reported:
+                reported = current
+                send({
+                    "jsonrpc": "2.0",
+                    "method": "progress",
+                    "params": {"job": job.id, "state": job.state,
+                               "files": job.files, "bytes": job.bytes},
+                })
+        if job.state == "failed":
+            raise DaemonError(JOB_FAILED, job.error)
+        return job.result
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        logger.debug(f"Removing stale socket {socket_path}")
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"A daemon is already listening on {socket_path}")
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:  # pragma: no cover - platforms without Unix sockets
+    _Server = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        daemon = self.server.daemon
+        write_lock = threading.Lock()
+
+        def send(message: Dict) -> None:
+            data = json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+            with write_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request_id = None
+            try:
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                except (ValueError, AttributeError):
+                    raise DaemonError(PARSE_ERROR, "Invalid JSON request")
+                result = daemon.dispatch(request, send)
+                response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+            except DaemonError as e:
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {"code": e.code, "message": e.message},
+                }
+            except Exception as e:
+                logger.error(f"Request failed: {e}")
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {"code": JOB_FAILED, "message": str(e)},
+                }
+            try:
+                send(response)
+            except OSError:
+                return
@@ -0,0 +1,315 @@
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("backuptool.delta")
+
+MAGIC = b"BTDELTA1"
+DELTA_KEYS = ("enabled", "max_depth", "min_size", "max_size", "max_ratio", "cache_size")
+
+_COPY = struct.Struct("<QQ")
+_INSERT = struct.Struct("<Q")
+_ADLER_MOD = 65521
+# Largest segment of the target whose rolling checksums are computed at once
+# with NumPy; bounds the temporary arrays to a few tens of MiB. Segments start
+# at _FIRST_SEGMENT blocks after a mismatch and double while nothing matches.
+_SEGMENT = 4 * 1024 * 1024
+_FIRST_SEGMENT = 16
+# Checksums are first looked up in a bitmap over their low bits; only the
+# few that pass are checked against the sorted table keys.
+_LOOKUP_BITS = 20
+
+
+class DeltaPolicy:
+    """When a new file version is stored as a delta against the previous one.
+
+    Files between ``min_size`` and ``max_size`` bytes whose path existed in
+    the previous snapshot of the same directory are delta-encoded against
+    that version, unless the chain of deltas leading to it is already
+    ``max_depth`` long or the delta would exceed ``max_ratio`` of the file
+    size, in which case the full content is stored. ``cache_size`` bytes of
+    reconstructed versions are kept for restore.
+    """
+
+    def __init__(self, enabled: bool = False, max_depth: int = 8,
+                 min_size: int = 64 * 1024, max_size: int = 256 * 1024 * 1024,
+                 max_ratio: float = 0.5, cache_size: int = 256 * 1024 * 1024):
+        self.enabled = bool(enabled)
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_ratio = max_ratio
+        self.cache_size = cache_size
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "DeltaPolicy":
+        config = config or {}
+        return cls(**{key: config[key] for key in DELTA_KEYS if key in config})
+
+    def candidate(self, size: int) -> bool:
+        return self.enabled and self.min_size <= size <= self.max_size
+
+
+class VersionCache:
+    """LRU cache of reconstructed file versions, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+def block_size_for(size: int) -> int:
+    # Roughly sqrt(size) as in rsync, as a power of two between 512 B and 64 KiB.
+    return max(512, min(1 << 16, 1 << max(0, int(size ** 0.5).bit_length() - 1)))
+
+
+def compute_delta(base: bytes, target: bytes, limit: int = None,
+                  block_size: int = None) -> Optional[bytes]:
+    """Encode ``target`` as copies from ``base`` plus literal inserts.
+
+    Base blocks are indexed by Adler-32 and a strong hash; the target is
+    scanned with a rolling Adler-32 as in rsync. ``None`` is returned as soon
+    as the encoded delta is known to exceed ``limit`` bytes.
+    """
+    block = block_size or block_size_for(len(base))
+    table: Dict[int, List[int]] = {}
+    for offset in range(0, len(base) - block + 1, block):
+        table.setdefault(zlib.adler32(base[offset:offset + block]), []).append(offset)
+    strong = {}
+
+    def base_digest(offset: int) -> bytes:
+        if offset not in strong:
+            strong[offset] = _digest(base[offset:offset + block])
+        return strong[offset]
+
+    ops: List[Tuple] = []
+    encoded = len(MAGIC)
+    literal_start = 0
+    scanner = _Scanner(target, block, table)
+
+    def next_candidate(pos: int) -> Optional[int]:
+        # Stop scanning once the pending literal alone would exceed the limit.
+        stop = None if limit is None else literal_start + limit - encoded
+        return scanner.next_candidate(pos, stop)
+
+    pos = next_candidate(0)
+    while pos is not None:
+        window_digest = None
+        match = None
+        for offset in table[scanner.weak(pos)]:
+            if window_digest is None:
+                window_digest = _digest(target[pos:pos + block])
+            if base_digest(offset) == window_digest:
+                match = offset
+                break
+        if match is None:
+            pos = next_candidate(pos + 1)
+            continue
+
+        if pos > literal_start:
+            ops.append(("I", literal_start, pos))
+            encoded += 1 + _INSERT.size + pos - literal_start
+        if ops and ops[-1][0] == "C" and ops[-1][1] + ops[-1][2] == match:
+            ops[-1] = ("C", ops[-1][1], ops[-1][2] + block)
+        else:
+            ops.append(("C", match, block))
+            encoded += 1 + _COPY.size
+        if limit is not None and encoded > limit:
+            return None
+        pos += block
+        literal_start = pos
+        pos = next_candidate(pos)
+
+    if literal_start < len(target):
+        ops.append(("I", literal_start, len(target)))
+        encoded += 1 + _INSERT.size + len(target) - literal_start
+    if limit is not None and encoded > limit:
+        return None
+
+    out = [MAGIC]
+    for op in ops:
+        if op[0] == "C":
+            out.append(b"C" + _COPY.pack(op[1], op[2]))
+        else:
+            out.append(b"I" + _INSERT.pack(op[2] - op[1]))
+            out.append(target[op[1]:op[2]])
+    return b"".join(out)
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    if not delta.startswith(MAGIC):
+        raise ValueError("Not a delta object")
+    out = []
+    view = memoryview(delta)
+    pos = len(MAGIC)
+    while pos < len(delta):
+        op = delta[pos:pos + 1]
+        pos += 1
+        if op == b"C":
+            offset, length = _COPY.unpack_from(delta, pos)
+            pos += _COPY.size
+            if offset + length > len(base):
+                raise ValueError("Delta copies beyond the end of its base")
+            out.append(base[offset:offset + length])
+        elif op == b"I":
+            (length,) = _INSERT.unpack_from(delta, pos)
+            pos += _INSERT.size
+            if pos + length > len(delta):
+                raise ValueError("Truncated delta insert")
+            out.append(bytes(view[pos:pos + length]))
+            pos += length
+        else:
+            raise ValueError(f"Unknown delta op {op!r}")
+    return b"".join(out)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class _Scanner:
+    """Finds target offsets whose rolling Adler-32 appears in the base table.
+
+    Where the target keeps matching, each offset is checked with one
+    Adler-32 call. Across stretches that do not match, the checksum is rolled
+    byte by byte in Python, or with NumPy computed for a whole segment at
+    once from prefix sums.
+    """
+
+    def __init__(self, target: bytes, block: int, table: Dict[int, List[int]]):
+        self.target = target
+        self.block = block
+        self.table = table
+        self.last = len(target) - block
+        self._np = _numpy()
+        self._segment_start = None
+        self._segment_blocks = _FIRST_SEGMENT
+        self._weak = None
+        self._hits = None
+        self._keys = None
+        self._bitmap = None
+        self._rolling = None
+
+    def weak(self, pos: int) -> int:
+        if self._rolling is not None and self._rolling[0] == pos:
+            return self._rolling[1]
+        if self._in_segment(pos):
+            return int(self._weak[pos - self._segment_start])
+        return zlib.adler32(self.target[pos:pos + self.block])
+
+    def next_candidate(self, pos: int, stop: int = None) -> Optional[int]:
+        """First offset at or after ``pos`` (and not after ``stop``) to try."""
+        last = self.last if stop is None else min(self.last, stop)
+        if pos > last:
+            return None
+        if self._np is not None:
+            return self._next_numpy(pos, last)
+        return self._next_python(pos, last)
+
+    def _next_python(self, pos: int, last: int) -> Optional[int]:
+        target, block, table = self.target, self.block, self.table
+        if self._rolling is None or self._rolling[0] != pos:
+            weak = zlib.adler32(target[pos:pos + block])
+        else:
+            weak = self._rolling[1]
+        a = weak & 0xFFFF
+        b = weak >> 16
+        while True:
+            if weak in table:
+                self._rolling = (pos, weak)
+                return pos
+            if pos >= last:
+                return None
+            out_byte = target[pos]
+            in_byte = target[pos + block]
+            a = (a - out_byte + in_byte) % _ADLER_MOD
+            b = (b - block * out_byte + a - 1) % _ADLER_MOD
+            weak = (b << 16) | a
+            pos += 1
+
+    def _next_numpy(self, pos: int, last: int) -> Optional[int]:
+        np = self._np
+        while pos <= last:
+            if not self._in_segment(pos):
+                # Matched blocks usually follow each other; only compute a
+                # segment once the offset itself does not match.
+                weak = zlib.adler32(self.target[pos:pos + self.block])
+                if weak in self.table:
+                    self._rolling = (pos, weak)
+                    self._segment_blocks = _FIRST_SEGMENT
+                    return pos
+                self._load_segment(pos, self._segment_blocks * self.block)
+                self._segment_blocks *= 2
+            index = int(np.searchsorted(self._hits, pos - self._segment_start))
+            if index < len(self._hits):
+                found = self._segment_start + int(self._hits[index])
+                return found if found <= last else None
+            pos = self._segment_start + len(self._weak)
+        return None
+
+    def _in_segment(self, pos: int) -> bool:
+        return (
+            self._segment_start is not None
+            and self._segment_start <= pos < self._segment_start + len(self._weak)
+        )
+
+    def _load_segment(self, pos: int, length: int) -> None:
+        np = self._np
+        if self._keys is None:
+            self._keys = np.sort(np.fromiter(self.table.keys(), dtype=np.int64))
+            self._bitmap = np.zeros(1 << _LOOKUP_BITS, dtype=bool)
+            self._bitmap[self._keys & ((1 << _LOOKUP_BITS) - 1)] = True
+        end = min(self.last + 1, pos + min(length, _SEGMENT))
+        data = np.frombuffer(self.target, dtype=np.uint8, count=end - pos + self.block - 1,
+                             offset=pos).astype(np.int64)
+        index = np.arange(len(data), dtype=np.int64)
+        sums = np.concatenate(([0], np.cumsum(data)))
+        weighted = np.concatenate(([0], np.cumsum(data * index)))
+        starts = np.arange(end - pos, dtype=np.int64)
+        a_sum = sums[starts + self.block] - sums[starts]
+        b_sum = (starts + self.block) * a_sum - (
+            weighted[starts + self.block] - weighted[starts]
+        )
+        a = (1 + a_sum) % _ADLER_MOD
+        b = (self.block + b_sum) % _ADLER_MOD
+        self._weak = (b << 16) | a
+        candidates = np.nonzero(self._bitmap[self._weak & ((1 << _LOOKUP_BITS) - 1)])[0]
+        if len(candidates):
+            values = self._weak[candidates]
+            found = np.minimum(np.searchsorted(self._keys, values), len(self._keys) - 1)
+            candidates = candidates[self._keys[found] == values]
+        self._hits = candidates
+        self._segment_start = pos
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
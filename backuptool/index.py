@@ -0,0 +1,171 @@
+import os
+import struct
+import binascii
+import logging
+from typing import Iterable, List, Optional, Set
+
+logger = logging.getLogger("backuptool.index")
+
+DIGEST_SIZE = 32
+
+
+class ContentIndex:
+    """In-memory existence index of the hashes held in the content store.
+
+    The index is persisted as a fixed header followed by raw SHA-256 digests.
+    The first ``sorted_count`` digests are sorted and searched with a binary
+    search; digests appended after the last compaction follow unsorted and are
+    kept in a set. The header also records the backend's content stamp (the
+    ``content/`` directory mtime for local storage, a generation object that
+    every removal of content bumps for S3) so that an index left
+    behind by an interrupted or foreign writer is detected as stale and
+    rebuilt from a listing of the backend's ``content/`` keys.
+    Backends that cannot provide such a stamp report a constant one, in which
+    case the index is only rebuilt when missing or unreadable. A read-only
+    index is rebuilt in memory when needed but never written back.
+    """
+
+    MAGIC = b"BTIDX001"
+    HEADER = struct.Struct("<8sQq")
+
+    def __init__(self, index_path: str, backend, read_only: bool = False):
+        self.index_path = index_path
+        self.backend = backend
+        self.read_only = read_only
+        self._sorted = b""
+        self._recent: Set[bytes] = set()
+        self._stamp = -1
+
+    def __len__(self) -> int:
+        return len(self._sorted) // DIGEST_SIZE + len(self._recent)
+
+    def __contains__(self, file_hash: str) -> bool:
+        digest = self._to_digest(file_hash)
+        if digest is None:
+            return False
+        return digest in self._recent or self._search(digest)
+
+    def stale(self) -> bool:
+        """Whether the content store changed since this index last saw it."""
+        return self._stamp != self._content_mtime()
+
+    def load(self) -> None:
+        try:
+            if self._read():
+                logger.debug(f"Content index loaded with {len(self)} entries")
+                return
+        except (IOError, OSError, ValueError) as e:
+            logger.warning(f"Content index unreadable, rebuilding: {e}")
+        self.rebuild()
+
+    def rebuild(self, names: Optional[Iterable[str]] = None) -> None:
+        if names is None:
+            names = [key[len("content/"):] for key in self.backend.list("content/")]
+        digests = sorted(
+            d for d in (self._to_digest(name) for name in names) if d is not None
+        )
+        self._sorted = b"".join(digests)
+        self._recent = set()
+        self._write()
+        logger.debug(f"Content index rebuilt with {len(digests)} entries")
+
+    def compact(self) -> None:
+        if not self._recent:
+            return
+        merged = self._digests() + sorted(self._recent)
+        merged.sort()
+        self._sorted = b"".join(merged)
+        self._recent = set()
+        self._write()
+
+    def add(self, file_hash: str) -> None:
+        digest = self._to_digest(file_hash)
+        if digest is None or digest in self:
+            return
+        self._recent.add(digest)
+        if self.read_only:
+            return
+        try:
+            with open(self.index_path, "r+b") as f:
+                f.seek(0, os.SEEK_END)
+                f.write(digest)
+                if self.backend.content_stamp_tracks_writes:
+                    self._stamp = self._content_mtime()
+                f.seek(0)
+                f.write(self._header())
+        except (IOError, OSError) as e:
+            logger.warning(f"Failed to append to content index: {e}")
+
+    def _digests(self) -> List[bytes]:
+        data = self._sorted
+        return [data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE)]
+
+    def _search(self, digest: bytes) -> bool:
+        data = self._sorted
+        lo, hi = 0, len(data) // DIGEST_SIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = data[mid * DIGEST_SIZE:(mid + 1) * DIGEST_SIZE]
+            if probe < digest:
+                lo = mid + 1
+            elif probe > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def _read(self) -> bool:
+        if not os.path.exists(self.index_path):
+            logger.debug("Content index missing")
+            return False
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        if len(data) < self.HEADER.size:
+            raise ValueError("truncated header")
+        magic, sorted_count, stamp = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC:
+            raise ValueError("bad magic")
+        if stamp != self._content_mtime():
+            logger.debug("Content index is stale")
+            return False
+        body = data[self.HEADER.size:]
+        split = sorted_count * DIGEST_SIZE
+        if split > len(body) or len(body) % DIGEST_SIZE:
+            raise ValueError("truncated body")
+        self._sorted = body[:split]
+        self._recent = {
+            body[i:i + DIGEST_SIZE] for i in range(split, len(body), DIGEST_SIZE)
+        }
+        self._stamp = stamp
+        if len(self._recent) > max(1024, sorted_count // 4):
+            self.compact()
+        return True
+
+    def _write(self) -> None:
+        self._stamp = self._content_mtime()
+        if self.read_only:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._header())
+            f.write(self._sorted)
+            for digest in self._recent:
+                f.write(digest)
+        os.replace(tmp_path, self.index_path)
+
+    def _header(self) -> bytes:
+        return self.HEADER.pack(
+            self.MAGIC, len(self._sorted) // DIGEST_SIZE, self._stamp
+        )
+
+    def _content_mtime(self) -> int:
+        return self.backend.content_stamp()
+
+    @staticmethod
+    def _to_digest(file_hash: str) -> Optional[bytes]:
+        if len(file_hash) != DIGEST_SIZE * 2:
+            return None
+        try:
+            return binascii.unhexlify(file_hash)
+        except (binascii.Error, ValueError):
+            return None
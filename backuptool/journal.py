@@ -0,0 +1,56 @@
+import json
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger("backuptool.journal")
+
+
+class MetadataJournal:
+    """Append-only log of catalog changes stored next to ``metadata.json``.
+
+    Each record is one JSON object per line carrying a monotonically
+    increasing ``seq``. Appends go through :meth:`StorageBackend.append`,
+    which fsyncs on local storage, so the cost of recording a snapshot does
+    not grow with the size of the catalog. A torn trailing record left by a
+    crash is ignored on replay.
+
+    Compaction leaves a single ``checkpoint`` record holding the ``seq`` that
+    ``metadata.json`` now covers, which tells other processes whether they
+    missed records that were folded into it.
+    """
+
+    def __init__(self, backend, key: str = "metadata.journal"):
+        self.backend = backend
+        self.key = key
+        self._needs_newline = False
+
+    def replay(self) -> List[Dict]:
+        try:
+            data = self.backend.get(self.key)
+        except FileNotFoundError:
+            return []
+
+        self._needs_newline = bool(data) and not data.endswith(b"\n")
+        records = []
+        for number, line in enumerate(data.split(b"\n"), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable journal record on line {number}")
+                continue
+            records.append(record)
+        return records
+
+    def append(self, record: Dict) -> None:
+        line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        if self._needs_newline:
+            line = b"\n" + line
+            self._needs_newline = False
+        self.backend.append(self.key, line)
+
+    def reset(self, seq: int) -> None:
+        line = json.dumps({"op": "checkpoint", "seq": seq}, separators=(",", ":"))
+        self.backend.put(self.key, line.encode("utf-8") + b"\n")
+        self._needs_newline = False
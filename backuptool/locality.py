@@ -0,0 +1,68 @@
+import os
+import sys
+import struct
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("backuptool.locality")
+
+READ_ORDERS = ("walk", "inode", "extent")
+
+# struct fiemap header followed by one struct fiemap_extent (linux/fiemap.h).
+_FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct("=QQIIII")
+_FIEMAP_EXTENT = struct.Struct("=QQQQQIIII")
+
+
+def physical_offset(file_path: str) -> Optional[int]:
+    """Return the physical byte offset of a file's first extent via FIEMAP.
+
+    ``None`` is returned when FIEMAP is unavailable (non-Linux platforms,
+    filesystems without extent mapping) or the file has no extents.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    import fcntl
+
+    request = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT.size)
+    _FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, _FS_IOC_FIEMAP, request, True)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    mapped = _FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if not mapped:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP_HEADER.size)[1]
+
+
+def order_batch(batch: List[Tuple[str, str, os.stat_result]], mode: str) -> List:
+    """Order a batch of ``(file_path, rel_path, stat)`` tuples for reading.
+
+    ``inode`` sorts by device and inode number, which on most filesystems
+    follows allocation order. ``extent`` sorts by the physical offset of each
+    file's first extent and falls back to inode order for files whose layout
+    cannot be queried. ``walk`` keeps the directory walk order.
+    """
+    if mode == "walk":
+        return batch
+    if mode == "inode":
+        return sorted(batch, key=lambda item: (item[2].st_dev, item[2].st_ino))
+    if mode == "extent":
+        keyed = []
+        for item in batch:
+            offset = physical_offset(item[0])
+            keyed.append(
+                ((item[2].st_dev, 0, offset, 0) if offset is not None
+                 else (item[2].st_dev, 1, 0, item[2].st_ino), item)
+            )
+        keyed.sort(key=lambda pair: pair[0])
+        return [item for _, item in keyed]
+    raise ValueError(f"Unknown read order: {mode}")
@@ -0,0 +1,263 @@
+import os
+import re
+import sys
+import json
+import heapq
+import codecs
+import shutil
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger("backuptool.manifest")
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Bytes of list slot, tuple and string headers per buffered entry, on top of
+# the path and encoded entry themselves.
+_ENTRY_OVERHEAD = 160
+# Most sorted runs merged at once; more are first merged into larger runs.
+_MAX_FAN_IN = 64
+_OUTPUT_CHUNK = 1024 * 1024
+
+
+class _Reader:
+    """Incremental JSON tokenizer over a stream of byte chunks.
+
+    Only the bytes needed for the value currently being decoded are kept in
+    memory, so a manifest can be walked without materializing its ``files``
+    mapping.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+        text = self._decoder.decode(chunk or b"", final=self._eof)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of manifest")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in manifest, got {self.peek()!r}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number that ends exactly at the buffer boundary may continue
+            # in the next chunk.
+            if end == len(self._buffer) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def iter_manifest(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Any]]:
+    """Stream the top-level fields of a snapshot manifest.
+
+    Yields ``(key, value)`` for every top-level field except ``files``, for
+    which one ``("files", (rel_path, entry))`` pair is yielded per file in
+    manifest order.
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "files":
+            reader.expect("{")
+            if reader.peek() != "}":
+                while True:
+                    rel_path = reader.value()
+                    reader.expect(":")
+                    yield "files", (rel_path, reader.value())
+                    if reader.peek() != ",":
+                        break
+                    reader.expect(",")
+            reader.expect("}")
+        else:
+            yield key, reader.value()
+        if reader.peek() != ",":
+            break
+        reader.expect(",")
+    reader.expect("}")
+
+
+def iter_files(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Any]]:
+    """Yield ``(rel_path, entry)`` for every file in a manifest stream."""
+    for key, value in iter_manifest(chunks):
+        if key == "files":
+            yield value
+
+
+def read_header(chunks: Iterable[bytes]) -> Dict:
+    """Return the manifest fields that precede ``files``."""
+    header = {}
+    for key, value in iter_manifest(chunks):
+        if key == "files":
+            break
+        header[key] = value
+    return header
+
+
+def rewrite_manifest(chunks: Iterable[bytes], updates: Dict) -> Iterator[bytes]:
+    """Stream a manifest with the top-level fields in ``updates`` replaced.
+
+    Files are re-encoded one at a time in manifest order, so the copy is
+    written without holding the manifest in memory.
+    """
+    fields = iter_manifest(chunks)
+    header = {}
+    first = None
+    for key, value in fields:
+        if key == "files":
+            first = value
+            break
+        header[key] = updates.get(key, value)
+    trailer = {}
+
+    def files():
+        if first is None:
+            return
+        yield first[0], json.dumps(first[1])
+        for key, value in fields:
+            if key == "files":
+                yield value[0], json.dumps(value[1])
+            else:
+                # Trailer fields follow the files and are encoded after them.
+                trailer[key] = updates.get(key, value)
+
+    return _encode(header, files(), trailer)
+
+
+class ManifestWriter:
+    """Builds a snapshot manifest without holding its ``files`` in memory.
+
+    Entries are kept JSON-encoded in a buffer until it reaches
+    ``memory_budget`` bytes, then sorted by path and spilled to a run file in
+    a temporary directory. :meth:`chunks` merges the runs and yields the
+    manifest as ``json.dumps(snapshot, indent=2)`` would have written it.
+    """
+
+    def __init__(self, memory_budget: int = 64 * 1024 * 1024, spill_dir: str = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.count = 0
+        self.spilled = 0
+        self._buffer: List[Tuple[str, str]] = []
+        self._buffered = 0
+        self._runs: List[str] = []
+        self._tmp_dir = None
+
+    def add(self, rel_path: str, entry: Any) -> None:
+        encoded = json.dumps(entry)
+        self._buffer.append((rel_path, encoded))
+        self._buffered += sys.getsizeof(rel_path) + sys.getsizeof(encoded) + _ENTRY_OVERHEAD
+        self.count += 1
+        if self._buffered >= self.memory_budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix="backuptool-manifest-", dir=self.spill_dir)
+        self._buffer.sort()
+        self._runs.append(self._write_run(self._buffer))
+        self.spilled += len(self._buffer)
+        logger.debug(
+            f"Spilled {len(self._buffer)} manifest entries to run {len(self._runs)}"
+        )
+        self._buffer = []
+        self._buffered = 0
+        if len(self._runs) >= _MAX_FAN_IN:
+            merged = self._write_run(heapq.merge(*[_read_run(run) for run in self._runs]))
+            for run in self._runs:
+                os.remove(run)
+            self._runs = [merged]
+
+    def _write_run(self, entries: Iterable[Tuple[str, str]]) -> str:
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self._tmp_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for rel_path, encoded in entries:
+                # JSON escapes tabs and newlines, so neither appears in a field.
+                f.write(f"{json.dumps(rel_path)}\t{encoded}\n")
+        return path
+
+    def iter_files(self) -> Iterator[Tuple[str, str]]:
+        """Yield ``(rel_path, encoded entry)`` sorted by path."""
+        self._buffer.sort()
+        return heapq.merge(*[_read_run(run) for run in self._runs], iter(self._buffer))
+
+    def chunks(self, header: Dict, trailer: Dict) -> Iterator[bytes]:
+        """Encode ``header`` fields, ``files`` and ``trailer`` fields."""
+        return _encode(header, self.iter_files(), trailer)
+
+    def close(self) -> None:
+        self._buffer = []
+        self._runs = []
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+
+def _encode(header: Dict, files: Iterable[Tuple[str, str]], trailer: Dict) -> Iterator[bytes]:
+    # Same layout as json.dumps(snapshot, indent=2).
+    parts = ["{"]
+    for key, value in header.items():
+        parts.append(f"\n  {_indented(key, value, 2)},")
+    parts.append('\n  "files": {')
+    size = 0
+    first = True
+    for rel_path, encoded in files:
+        if encoded.startswith("{"):
+            encoded = json.dumps(json.loads(encoded), indent=2).replace("\n", "\n    ")
+        parts.append(f"{'' if first else ','}\n    {json.dumps(rel_path)}: {encoded}")
+        first = False
+        size += len(parts[-1])
+        if size >= _OUTPUT_CHUNK:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+            size = 0
+    parts.append("}" if first else "\n  }")
+    for key, value in trailer.items():
+        parts.append(f",\n  {_indented(key, value, 2)}")
+    parts.append("\n}")
+    yield "".join(parts).encode("utf-8")
+
+
+def _indented(key: str, value: Any, level: int) -> str:
+    text = json.dumps(value, indent=2).replace("\n", "\n" + " " * level)
+    return f"{json.dumps(key)}: {text}"
+
+
+def _read_run(path: str) -> Iterator[Tuple[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            rel_path, encoded = line.rstrip("\n").split("\t", 1)
+            yield json.loads(rel_path), encoded
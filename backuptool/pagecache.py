@@ -0,0 +1,110 @@
+import os
+import logging
+from typing import Optional
+
+logger = logging.getLogger("backuptool.pagecache")
+
+DROP_CACHE_MODES = ("auto", "always", "never")
+SUPPORTED = hasattr(os, "posix_fadvise")
+# Bytes streamed between two DONTNEED calls.
+WINDOW = 8 * 1024 * 1024
+
+
+class CacheDropper:
+    """Keeps a streamed file from piling up in the page cache.
+
+    The file is advised as read sequentially, and every ``window`` bytes the
+    range processed since the last call is dropped with
+    ``POSIX_FADV_DONTNEED``. Pages that are still dirty cannot be dropped
+    yet, so when writing the previous window is dropped again one window
+    later, by which time its writeback has usually completed.
+    """
+
+    def __init__(self, fd: int, write: bool = False, window: int = WINDOW):
+        self.fd = fd
+        self.write = write
+        self.window = window
+        self._dropped = 0
+        self._previous = 0
+        _advise(fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+
+    def advance(self, position: int) -> None:
+        if position < self._dropped:
+            # Seeked backwards; the whole file is dropped at the end.
+            return
+        if position - self._dropped < self.window:
+            return
+        start = self._previous if self.write else self._dropped
+        _advise(self.fd, start, position - start, "POSIX_FADV_DONTNEED")
+        self._previous = self._dropped
+        self._dropped = position
+
+    def finish(self) -> None:
+        _advise(self.fd, 0, 0, "POSIX_FADV_DONTNEED")
+
+
+def drop_cache(path: str) -> None:
+    """Drop the cached pages of ``path``; dirty pages start writeback."""
+    if not SUPPORTED:
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        logger.debug(f"Cannot drop cache of {path}: {e}")
+        return
+    try:
+        _advise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+    finally:
+        os.close(fd)
+
+
+def resident_fraction(path: str) -> Optional[float]:
+    """Share of the pages of ``path`` in the page cache, via ``mincore``.
+
+    Returns ``None`` where this cannot be measured.
+    """
+    try:
+        import ctypes
+        import ctypes.util
+        import mmap
+    except ImportError:
+        return None
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, "mincore"):
+        return None
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                          ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0.0
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    vector = (ctypes.c_ubyte * pages)()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            if libc.mincore(addr, size, vector) != 0:
+                return None
+        finally:
+            libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+    return sum(page & 1 for page in vector) / pages
+
+
+def _advise(fd: int, offset: int, length: int, advice: str) -> None:
+    if not SUPPORTED:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+    except OSError as e:
+        logger.debug(f"posix_fadvise failed: {e}")
@@ -0,0 +1,259 @@
+import os
+import stat
+import random
+import shutil
+import hashlib
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger("backuptool.profile")
+
+PROFILE_VERSION = 1
+# Generated file contents are slices of one seeded pool, each behind a
+# header unique to the file, so files only repeat where the profile says so.
+_POOL_SIZE = 1024 * 1024
+
+
+def profile_tree(target_dir: str) -> Dict:
+    """Anonymized shape of the tree under ``target_dir``.
+
+    Only counts and histograms are recorded, never names or content:
+    directory and file depth, per-directory fan-out, the size distribution
+    of regular files in power-of-two buckets, how many files duplicate the
+    content of another, hardlinks, sparse files and symlinks. Content is
+    only hashed for files whose size collides with another file's.
+    """
+    target_dir = os.path.abspath(target_dir)
+    if not os.path.isdir(target_dir):
+        raise FileNotFoundError(f"Target directory does not exist: {target_dir}")
+
+    profile = {
+        "version": PROFILE_VERSION,
+        "directories": 0,
+        "files": 0,
+        "total_size": 0,
+        "dir_depth": {},
+        "file_depth": {},
+        "fanout": {"subdirs": {}, "files": {}},
+        "sizes": {},
+        "duplicates": {"files": 0, "bytes": 0},
+        "hardlinks": {"files": 0, "groups": 0},
+        "sparse": {"files": 0, "bytes": 0, "allocated": 0},
+        "symlinks": 0,
+    }
+    by_size: Dict[int, List[str]] = {}
+    inodes = {}
+
+    for root, dirs, files in os.walk(target_dir):
+        depth = 0 if root == target_dir else os.path.relpath(root, target_dir).count(os.sep) + 1
+        subdirs = 0
+        regular = 0
+        for name in dirs:
+            if os.path.islink(os.path.join(root, name)):
+                profile["symlinks"] += 1
+            else:
+                subdirs += 1
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except OSError as e:
+                logger.warning(f"Failed to stat {path}: {e}")
+                continue
+            if stat.S_ISLNK(st.st_mode):
+                profile["symlinks"] += 1
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            if st.st_nlink > 1:
+                inode = (st.st_dev, st.st_ino)
+                if inode in inodes:
+                    if inodes[inode] == 1:
+                        profile["hardlinks"]["groups"] += 1
+                    inodes[inode] += 1
+                    profile["hardlinks"]["files"] += 1
+                    continue
+                inodes[inode] = 1
+            regular += 1
+            profile["files"] += 1
+            profile["total_size"] += st.st_size
+            _count(profile["file_depth"], depth)
+            allocated = getattr(st, "st_blocks", None)
+            if allocated is not None and allocated * 512 < st.st_size:
+                profile["sparse"]["files"] += 1
+                profile["sparse"]["bytes"] += st.st_size
+                profile["sparse"]["allocated"] += allocated * 512
+                continue
+            bucket = profile["sizes"].setdefault(str(_bucket(st.st_size)), {"files": 0, "bytes": 0})
+            bucket["files"] += 1
+            bucket["bytes"] += st.st_size
+            if st.st_size:
+                by_size.setdefault(st.st_size, []).append(path)
+        if root != target_dir:
+            profile["directories"] += 1
+            _count(profile["dir_depth"], depth)
+        _count(profile["fanout"]["subdirs"], _bucket(subdirs))
+        _count(profile["fanout"]["files"], _bucket(regular))
+
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        seen = set()
+        for path in paths:
+            try:
+                digest = _file_digest(path)
+            except OSError as e:
+                logger.warning(f"Failed to read {path}: {e}")
+                continue
+            if digest in seen:
+                profile["duplicates"]["files"] += 1
+                profile["duplicates"]["bytes"] += size
+            seen.add(digest)
+
+    logger.info(
+        f"Profiled {profile['files']} files in {profile['directories']} directories "
+        f"({profile['total_size']} bytes)"
+    )
+    return profile
+
+
+def generate_tree(profile: Dict, base_dir: str, scale: float = 1.0, seed: int = 0) -> Dict:
+    """Create a tree under ``base_dir`` with the shape of ``profile``.
+
+    Directory and file counts are multiplied by ``scale``; sizes are drawn
+    from the profile's buckets as they are. The same profile, scale and seed
+    always produce the same tree. Returns counts of what was created.
+    """
+    if profile.get("version") != PROFILE_VERSION:
+        raise ValueError(f"Unsupported profile version: {profile.get('version')}")
+    rng = random.Random(seed)
+    pool = rng.getrandbits(8 * _POOL_SIZE).to_bytes(_POOL_SIZE, "little")
+    os.makedirs(base_dir, exist_ok=True)
+
+    # Directories are created level by level; parents are picked with weights
+    # drawn from the sub-directory fan-out histogram.
+    levels = [[base_dir]]
+    for depth in sorted(int(d) for d in profile["dir_depth"]):
+        count = _scaled(profile["dir_depth"][str(depth)], scale)
+        parents = levels[min(depth - 1, len(levels) - 1)]
+        weights = [_sample(rng, profile["fanout"]["subdirs"], minimum=1) for _ in parents]
+        level = []
+        for _ in range(count):
+            parent = rng.choices(parents, weights)[0]
+            path = os.path.join(parent, f"dir_{sum(len(lv) for lv in levels) + len(level)}")
+            os.makedirs(path, exist_ok=True)
+            level.append(path)
+        if level:
+            levels.append(level)
+
+    sizes = {key: bucket["files"] for key, bucket in profile["sizes"].items()}
+    plain = sum(sizes.values())
+    duplicate_share = profile["duplicates"]["files"] / plain if plain else 0.0
+    sparse = profile["sparse"]
+    placements = [
+        depth
+        for depth in sorted(int(d) for d in profile["file_depth"])
+        for _ in range(_scaled(profile["file_depth"][str(depth)], scale))
+    ]
+    sparse_indexes = set(rng.sample(
+        range(len(placements)), min(len(placements), _scaled(sparse["files"], scale))
+    ))
+    weights = {}
+    created: List[str] = []
+    result = {"directories": sum(len(level) for level in levels) - 1, "files": 0,
+              "bytes": 0, "duplicates": 0, "hardlinks": 0, "sparse": 0, "symlinks": 0}
+
+    for index, depth in enumerate(placements):
+        dirs = levels[min(depth, len(levels) - 1)]
+        if depth not in weights:
+            # Directories drawn as holding no files get none unless every
+            # directory at this depth was.
+            weights[depth] = [_sample(rng, profile["fanout"]["files"]) for _ in dirs]
+            if not any(weights[depth]):
+                weights[depth] = None
+        path = os.path.join(rng.choices(dirs, weights[depth])[0], f"file_{index}.bin")
+        if index in sparse_indexes:
+            size = sparse["bytes"] // sparse["files"]
+            allocated = size * sparse["allocated"] // sparse["bytes"] if size else 0
+            _write_sparse(path, size, allocated, index, pool)
+            result["sparse"] += 1
+        elif created and rng.random() < duplicate_share:
+            shutil.copyfile(rng.choice(created), path)
+            size = os.path.getsize(path)
+            result["duplicates"] += 1
+        else:
+            size = _sample(rng, sizes)
+            with open(path, "wb") as f:
+                _write_content(f, size, index, pool)
+            created.append(path)
+        result["files"] += 1
+        result["bytes"] += size
+
+    for i in range(_scaled(profile["hardlinks"]["files"], scale) if created else 0):
+        source = rng.choice(created)
+        os.link(source, os.path.join(os.path.dirname(source), f"link_{i}.bin"))
+        result["hardlinks"] += 1
+    for i in range(_scaled(profile["symlinks"], scale) if created else 0):
+        source = rng.choice(created)
+        os.symlink(
+            os.path.basename(source), os.path.join(os.path.dirname(source), f"symlink_{i}")
+        )
+        result["symlinks"] += 1
+
+    logger.info(
+        f"Generated {result['files']} files in {result['directories']} directories "
+        f"under {base_dir}"
+    )
+    return result
+
+
+def _bucket(n: int) -> int:
+    return 0 if n <= 0 else 1 << (n.bit_length() - 1)
+
+
+def _count(histogram: Dict[str, int], key: int) -> None:
+    histogram[str(key)] = histogram.get(str(key), 0) + 1
+
+
+def _scaled(count: int, scale: float) -> int:
+    return int(round(count * scale))
+
+
+def _sample(rng: random.Random, histogram: Dict[str, int], minimum: int = 0) -> int:
+    """A value drawn from a power-of-two bucket histogram."""
+    if not histogram:
+        return minimum
+    lower = int(rng.choices(list(histogram), list(histogram.values()))[0])
+    value = lower if lower <= 1 else rng.randint(lower, 2 * lower - 1)
+    return max(minimum, value)
+
+
+def _write_content(f, size: int, index: int, pool: bytes) -> None:
+    header = index.to_bytes(8, "little")
+    data = (header + pool[index % _POOL_SIZE:])[:size]
+    f.write(data)
+    written = len(data)
+    while written < size:
+        chunk = pool[:size - written]
+        f.write(chunk)
+        written += len(chunk)
+
+
+def _write_sparse(path: str, size: int, allocated: int, index: int, pool: bytes) -> None:
+    # Half the data at the start and half at the end, with a hole between.
+    with open(path, "wb") as f:
+        f.truncate(size)
+        head = min(size, allocated // 2)
+        _write_content(f, head, index, pool)
+        tail = min(size - head, allocated - head)
+        if tail > 0:
+            f.seek(size - tail)
+            _write_content(f, tail, index, pool)
+
+
+def _file_digest(path: str) -> bytes:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.digest()
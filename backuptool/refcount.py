@@ -0,0 +1,168 @@
+import os
+import json
+import logging
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger("backuptool.refcount")
+
+
+class RefcountIndex:
+    """Stored size and referencing snapshots of every content blob.
+
+    Each blob maps to ``[stored_bytes, logical_bytes, [snapshot ids]]``,
+    where logical bytes are what the blob expands to on restore. The index is
+    a local cache next to ``content.idx`` and records which snapshots it
+    covers; :class:`~backuptool.core.BackupDatabase` brings it up to date
+    with the catalog by adding and removing whole snapshots, so space
+    accounting never has to re-read every manifest or stat every blob.
+
+    Snapshots do not rewrite the index. They append the sizes of the blobs
+    they stored to a log next to it, and the next update adds the new
+    snapshots using those sizes and then folds the log into the index.
+    """
+
+    VERSION = 1
+
+    def __init__(self, index_path: str, read_only: bool = False):
+        self.index_path = index_path
+        self.log_path = os.path.splitext(index_path)[0] + ".log"
+        self.read_only = read_only
+        self.blobs: Dict[str, List] = {}
+        self.snapshots: set = set()
+        self.sizes: Dict[str, List[int]] = {}
+        self.loaded = False
+
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    def load(self) -> bool:
+        try:
+            with open(self.index_path, "rb") as f:
+                data = json.loads(f.read())
+            if data.get("version") != self.VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            self.blobs = data["blobs"]
+            self.snapshots = set(data["snapshots"])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Refcount index unreadable, rebuilding: {e}")
+            return False
+        try:
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        self.sizes.update(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"Skipping torn record in {self.log_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to read refcount log: {e}")
+        self.loaded = True
+        logger.debug(f"Refcount index loaded with {len(self.blobs)} blobs")
+        return True
+
+    def save(self) -> None:
+        self.loaded = True
+        if self.read_only:
+            return
+        data = {
+            "version": self.VERSION,
+            "snapshots": sorted(self.snapshots),
+            "blobs": self.blobs,
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        os.replace(tmp_path, self.index_path)
+        self.sizes = {}
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+
+    def record_sizes(self, sizes: Dict[str, Tuple[int, int]]) -> None:
+        """Note the stored and logical size of newly stored blobs."""
+        record = {file_hash: list(size) for file_hash, size in sizes.items()}
+        self.sizes.update(record)
+        if self.read_only:
+            return
+        with open(self.log_path, "ab") as f:
+            f.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def add_snapshot(self, snapshot_id: int, hashes: Iterable[str],
+                     sizes: Callable[[str], Tuple[int, int]]) -> None:
+        if snapshot_id in self.snapshots:
+            return
+        for file_hash in set(hashes):
+            blob = self.blobs.get(file_hash)
+            if blob is None:
+                stored, logical = sizes(file_hash)
+                blob = self.blobs[file_hash] = [stored, logical, []]
+            blob[2].append(snapshot_id)
+        self.snapshots.add(snapshot_id)
+
+    def remove_snapshots(self, snapshot_ids: Iterable[int]) -> None:
+        removed = set(snapshot_ids) & self.snapshots
+        if not removed:
+            return
+        for file_hash in list(self.blobs):
+            refs = self.blobs[file_hash][2]
+            if any(ref in removed for ref in refs):
+                refs[:] = [ref for ref in refs if ref not in removed]
+                if not refs:
+                    del self.blobs[file_hash]
+        self.snapshots -= removed
+
+    def usage(self, snapshots: List[Dict]) -> Dict:
+        """Space accounting for the given catalog entries.
+
+        ``unique`` bytes of a snapshot are held by blobs no other snapshot
+        references, i.e. what pruning it would free; ``shared`` bytes are
+        held by blobs it has in common with other snapshots. The same split
+        is made per target directory.
+        """
+        targets = {s["id"]: s["target_dir"] for s in snapshots}
+        per_snapshot = {s["id"]: {"unique": 0, "shared": 0} for s in snapshots}
+        per_target = {t: {"unique": 0, "shared": 0} for t in targets.values()}
+        stored_total = 0
+        logical_total = 0
+        for stored, logical, refs in self.blobs.values():
+            stored_total += stored
+            logical_total += logical
+            kind = "unique" if len(refs) == 1 else "shared"
+            for ref in refs:
+                if ref in per_snapshot:
+                    per_snapshot[ref][kind] += stored
+            dirs = {targets[ref] for ref in refs if ref in targets}
+            kind = "unique" if len(dirs) == 1 else "shared"
+            for target_dir in dirs:
+                per_target[target_dir][kind] += stored
+
+        logical_bytes = sum(s.get("total_size", 0) for s in snapshots)
+        report = {"snapshots": [], "targets": []}
+        for s in snapshots:
+            report["snapshots"].append({
+                "id": s["id"],
+                "target_dir": s["target_dir"],
+                "logical": s.get("total_size", 0),
+                **per_snapshot[s["id"]],
+            })
+        for target_dir in sorted(per_target):
+            matching = [s for s in snapshots if s["target_dir"] == target_dir]
+            report["targets"].append({
+                "target_dir": target_dir,
+                "snapshots": len(matching),
+                "logical": sum(s.get("total_size", 0) for s in matching),
+                **per_target[target_dir],
+            })
+        report.update({
+            "logical": logical_bytes,
+            "deduplicated": logical_total,
+            "stored": stored_total,
+            "blobs": len(self.blobs),
+            "dedup_ratio": logical_bytes / logical_total if logical_total else 1.0,
+            "compression_ratio": logical_total / stored_total if stored_total else 1.0,
+        })
+        return report
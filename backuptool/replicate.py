@@ -0,0 +1,137 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+from .client import repository_location
+from .core import BackupDatabase, _entry_hashes
+from .manifest import iter_files, rewrite_manifest
+from .storage import LocalBackend
+
+logger = logging.getLogger("backuptool.replicate")
+
+
+def copy_snapshots(source: BackupDatabase, dest: BackupDatabase,
+                   snapshot_ids: Optional[Iterable[int]] = None,
+                   workers: int = 8) -> Dict:
+    """Replicate snapshots of ``source`` into ``dest``.
+
+    Only blobs whose hash is not already listed in the destination are
+    transferred, in parallel. Manifests are written once every blob has been
+    synced and catalog records are committed last, so an interrupted copy
+    leaves no visible snapshot behind and a rerun transfers only what is
+    still missing. Snapshots copied before are recognised by the ``origin``
+    recorded in the destination catalog and skipped.
+    """
+    dest._check_writable()
+    origin = repository_location(source.db_path)
+    available = {s["id"]: s for s in source.list_snapshots()}
+    if snapshot_ids is None:
+        selected = sorted(available)
+    else:
+        selected = sorted(set(snapshot_ids))
+        unknown = [i for i in selected if i not in available]
+        if unknown:
+            raise KeyError(f"Snapshots not found in {origin}: {unknown}")
+
+    copied = {
+        s["origin"]["id"]: s["id"]
+        for s in dest.list_snapshots()
+        if s.get("origin", {}).get("repository") == origin
+    }
+    pending = [i for i in selected if i not in copied]
+
+    # Manifests are streamed twice, here for their hashes and again when
+    # they are written, so none of them is ever held whole in memory.
+    needed: Set[str] = set()
+    for snapshot_id in pending:
+        try:
+            for _, entry in iter_files(source.backend.get_chunks(f"snapshots/{snapshot_id}")):
+                needed.update(_entry_hashes(entry))
+        except (IOError, ValueError) as e:
+            raise IOError(f"Cannot read manifest of snapshot {snapshot_id}: {e}")
+
+    present = {key[len("content/"):] for key in dest.backend.list("content/")}
+    missing = sorted(needed - present)
+    logger.info(
+        f"Copying {len(pending)} snapshots from {origin}: {len(missing)} of "
+        f"{len(needed)} blobs missing from the destination"
+    )
+
+    transferred = _transfer(source, dest, missing, workers)
+
+    # Content must be durable before any manifest refers to it.
+    dest.backend.sync()
+    mapping = {}
+    for snapshot_id in pending:
+        new_id = dest._reserve_snapshot_id()
+        try:
+            dest.backend.put_chunks(
+                f"snapshots/{new_id}",
+                rewrite_manifest(
+                    source.backend.get_chunks(f"snapshots/{snapshot_id}"), {"id": new_id}
+                ),
+            )
+        except IOError as e:
+            logger.error(f"Failed to save snapshot {new_id}: {e}")
+            raise
+        mapping[snapshot_id] = new_id
+
+    # Catalog records go last: until here the copied snapshots are invisible.
+    dest.backend.sync()
+    for snapshot_id in pending:
+        summary = dict(available[snapshot_id])
+        summary.pop("origin", None)
+        summary["id"] = mapping[snapshot_id]
+        summary["origin"] = {"repository": origin, "id": snapshot_id}
+        dest._commit({"op": "add", "snapshot": summary})
+        logger.info(f"Copied snapshot {snapshot_id} as {summary['id']}")
+
+    mapping.update({i: copied[i] for i in selected if i in copied})
+    return {
+        "snapshots": dict(sorted(mapping.items())),
+        "copied": len(pending),
+        "skipped": len(selected) - len(pending),
+        "blobs": len(missing),
+        "bytes": transferred,
+    }
+
+
+def _transfer(source: BackupDatabase, dest: BackupDatabase, hashes: List[str],
+              workers: int) -> int:
+    def copy_blob(file_hash: str) -> int:
+        key = f"content/{file_hash}"
+        if isinstance(source.backend, LocalBackend):
+            dest.backend.put_file(key, source.backend.path(key))
+            return source.backend.size(key)
+        size = 0
+
+        def counted(chunks):
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+
+        dest.backend.put_chunks(key, counted(source.backend.get_chunks(key)))
+        return size
+
+    transferred = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # The content index is appended to from this thread only.
+        for file_hash, size in zip(hashes, pool.map(copy_blob, hashes)):
+            dest.content_index.add(file_hash)
+            transferred += size
+    return transferred
+
+
+def copy_repository(source_path: str, dest_path: str,
+                    snapshot_ids: Optional[Iterable[int]] = None,
+                    workers: int = 8) -> Dict:
+    source = BackupDatabase(source_path, read_only=True)
+    try:
+        dest = BackupDatabase(dest_path)
+        try:
+            return copy_snapshots(source, dest, snapshot_ids, workers=workers)
+        finally:
+            dest.close()
+    finally:
+        source.close()
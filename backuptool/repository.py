@@ -0,0 +1,162 @@
+import io
+import base64
+import logging
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .core import BackupDatabase
+from .manifest import iter_files
+from .sparse import expand_extents
+
+logger = logging.getLogger("backuptool.repository")
+
+
+class Repository:
+    """Long-lived handle on a backup database for embedding in Python code.
+
+    Unlike the module-level functions in :mod:`backuptool.core`, which open
+    the database for every call, a repository keeps its metadata, content
+    index and the last few parsed manifests warm until it is closed. The
+    ``iter_*`` methods and :meth:`open_file` stream from the stored manifests
+    and content, so huge snapshots can be processed in constant memory::
+
+        with Repository("/srv/backups") as repo:
+            for snapshot in repo.iter_snapshots(lambda s: s["file_count"] > 0):
+                for rel_path, entry in repo.iter_entries(snapshot["id"]):
+                    ...
+
+    Extra keyword arguments are passed to :class:`BackupDatabase`. Changes
+    made by other processes are picked up by :meth:`refresh`.
+    """
+
+    def __init__(self, db_path: str = None, read_only: bool = False,
+                 manifest_cache: int = 4, **options):
+        self.db = BackupDatabase(db_path, read_only=read_only, **options)
+        self.manifest_cache = manifest_cache
+        self._manifests: "OrderedDict[int, Dict]" = OrderedDict()
+
+    def __enter__(self) -> "Repository":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._manifests.clear()
+        self.db.close()
+
+    def refresh(self) -> None:
+        """Pick up snapshots and content changed by other processes."""
+        self.db.reload_metadata()
+        # Snapshot ids are never reused, so cached manifests stay valid for
+        # as long as their snapshot exists.
+        current = {snapshot["id"] for snapshot in self.db.metadata["snapshots"]}
+        for snapshot_id in [i for i in self._manifests if i not in current]:
+            del self._manifests[snapshot_id]
+
+    def create_snapshot(self, target_dir: str, resume: bool = False,
+                        progress: Callable[[int, int], None] = None) -> int:
+        return self.db.create_snapshot(target_dir, resume=resume, progress=progress)
+
+    def create_stream_snapshot(self, stream: BinaryIO, name: str,
+                               progress: Callable[[int, int], None] = None) -> int:
+        return self.db.create_stream_snapshot(stream, name, progress=progress)
+
+    def restore_snapshot(self, snapshot_id: int, output_dir: str,
+                         progress: Callable[[int, int], None] = None) -> bool:
+        return self.db.restore_snapshot(snapshot_id, output_dir, progress=progress)
+
+    def prune_snapshot(self, snapshot_id: int) -> bool:
+        self._manifests.pop(snapshot_id, None)
+        return self.db.prune_snapshot(snapshot_id)
+
+    def list_snapshots(self) -> List[Dict]:
+        return list(self.iter_snapshots())
+
+    def iter_snapshots(self, filter: Callable[[Dict], bool] = None) -> Iterator[Dict]:
+        """Yield snapshot summaries, optionally only those ``filter`` accepts."""
+        for snapshot in list(self.db.metadata["snapshots"]):
+            if filter is None or filter(snapshot):
+                yield dict(snapshot)
+
+    def get_snapshot(self, snapshot_id: int) -> Optional[Dict]:
+        """Return a fully parsed manifest, cached across calls."""
+        if snapshot_id in self._manifests:
+            self._manifests.move_to_end(snapshot_id)
+            return self._manifests[snapshot_id]
+        snapshot = self.db.get_snapshot(snapshot_id)
+        if snapshot is not None and self.manifest_cache > 0:
+            self._manifests[snapshot_id] = snapshot
+            while len(self._manifests) > self.manifest_cache:
+                self._manifests.popitem(last=False)
+        return snapshot
+
+    def iter_entries(self, snapshot_id: int,
+                     prefix: str = None) -> Iterator[Tuple[str, Any]]:
+        """Yield ``(rel_path, entry)`` for each file in a snapshot.
+
+        The manifest is parsed incrementally unless it is already cached.
+        Raises :class:`FileNotFoundError` if the snapshot does not exist.
+        """
+        if snapshot_id in self._manifests:
+            entries = iter(list(self._manifests[snapshot_id]["files"].items()))
+        else:
+            entries = iter_files(self._manifest_chunks(snapshot_id))
+        for rel_path, entry in entries:
+            if prefix is None or rel_path.startswith(prefix):
+                yield rel_path, entry
+
+    def open_file(self, snapshot_id: int, path: str) -> BinaryIO:
+        """Open a file from a snapshot for streaming reads."""
+        path = path.replace("\\", "/").lstrip("/")
+        for rel_path, entry in self.iter_entries(snapshot_id):
+            if rel_path.replace("\\", "/") == path:
+                return io.BufferedReader(_ChunkStream(self._entry_chunks(entry)))
+        raise FileNotFoundError(f"{path} not found in snapshot {snapshot_id}")
+
+    def _manifest_chunks(self, snapshot_id: int) -> Iterator[bytes]:
+        try:
+            yield from self.db.backend.get_chunks(f"snapshots/{snapshot_id}")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Snapshot {snapshot_id} not found") from None
+
+    def _entry_chunks(self, entry) -> Iterable[bytes]:
+        if isinstance(entry, dict) and "data" in entry:
+            return [base64.b64decode(entry["data"])]
+        if isinstance(entry, dict) and "chunks" in entry:
+            return self.db._iter_chunked(entry)
+        if isinstance(entry, dict) and "chain" in entry:
+            return [self.db._read_version(entry["chain"])]
+        if isinstance(entry, str):
+            return self.db.backend.get_chunks(f"content/{entry}")
+        return expand_extents(
+            entry["size"],
+            entry["extents"],
+            self.db.backend.get_chunks(f"content/{entry['hash']}"),
+        )
+
+
+class _ChunkStream(io.RawIOBase):
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        super().close()
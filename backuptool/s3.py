@@ -0,0 +1,405 @@
+import os
+import hmac
+import queue
+import base64
+import time
+import socket
+import hashlib
+import tempfile
+import logging
+import datetime
+import http.client
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape
+
+from .storage import StorageBackend, StorageError
+
+logger = logging.getLogger("backuptool.s3")
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class _PooledConnections:
+    def __init__(self, scheme: str, host: str, port: Optional[int], size: int,
+                 timeout: float):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            if self.scheme == "https":
+                return http.client.HTTPSConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _xml_children(elem: ET.Element, tag: str) -> List[ET.Element]:
+    return [child for child in elem.iter() if child.tag.split("}")[-1] == tag]
+
+
+def _xml_text(elem: ET.Element, tag: str, default: str = "") -> str:
+    found = _xml_children(elem, tag)
+    return (found[0].text or default) if found else default
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible object store accessed with path-style HTTP requests.
+
+    Connections are pooled and reused with keep-alive. Objects larger than
+    ``multipart_threshold`` are uploaded as parallel multipart uploads, batch
+    existence checks fan out over the pool (or use a single prefix listing
+    for large batches) and batch deletes use the multi-object delete call.
+    Requests are signed with AWS Signature V4 when credentials are given.
+    """
+
+    def __init__(self, endpoint: str, bucket: str, prefix: str = "",
+                 access_key: str = None, secret_key: str = None,
+                 region: str = "us-east-1", max_connections: int = 16,
+                 multipart_threshold: int = 64 * 1024 * 1024,
+                 part_size: int = 16 * 1024 * 1024, list_threshold: int = 1000,
+                 cache_dir: str = None, timeout: float = 60.0,
+                 read_only: bool = False):
+        super().__init__(read_only)
+        parts = urlsplit(endpoint)
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.max_connections = max_connections
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.list_threshold = list_threshold
+        self.location = f"{self.endpoint}/{bucket}" + (
+            f"/{self.prefix}" if self.prefix else ""
+        )
+        self._host_header = parts.netloc
+        self._pool = _PooledConnections(
+            parts.scheme, parts.hostname, parts.port, max_connections, timeout
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+
+        if cache_dir is None:
+            cache_key = hashlib.sha256(self.location.encode()).hexdigest()[:16]
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".cache", "backuptool", cache_key
+            )
+        self.cache_dir = cache_dir
+        if not read_only:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "S3Backend":
+        parts = urlsplit(url)
+        bucket, _, prefix = parts.path.lstrip("/").partition("/")
+        if not bucket:
+            raise ValueError(f"No bucket in storage URL: {url}")
+        kwargs.setdefault("access_key", os.environ.get("AWS_ACCESS_KEY_ID"))
+        kwargs.setdefault("secret_key", os.environ.get("AWS_SECRET_ACCESS_KEY"))
+        kwargs.setdefault("region", os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+        return cls(f"{parts.scheme}://{parts.netloc}", bucket, prefix, **kwargs)
+
+    # Buckets have no directory mtime, so every removal of content bumps
+    # this object and its value serves as the content stamp.
+    GENERATION_KEY = "content.generation"
+
+    def local_cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _spool_dir(self) -> str:
+        # Read-only opens do not create the cache up front, but reading a
+        # chunked object still needs local scratch space.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return self.cache_dir
+
+    def content_stamp(self) -> int:
+        try:
+            return int(self._get(self.GENERATION_KEY))
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            logger.warning(f"Unreadable {self.GENERATION_KEY}, treating indexes as stale")
+            return time.time_ns()
+
+    def _bump_generation(self, keys: Iterable[str]) -> None:
+        if any(key.startswith("content/") for key in keys):
+            self._put(self.GENERATION_KEY, str(time.time_ns()).encode("ascii"))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._pool.close()
+
+    def _object_path(self, key: str = None) -> str:
+        path = f"/{self.bucket}"
+        if key is not None:
+            path += "/" + (f"{self.prefix}/{key}" if self.prefix else key)
+        return quote(path, safe="/-_.~")
+
+    def _sign(self, method: str, path: str, query: Dict[str, str],
+              headers: Dict[str, str]) -> None:
+        now = datetime.datetime.utcnow()
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = now.strftime("%Y%m%d")
+        headers["x-amz-date"] = amz_date
+        headers["x-amz-content-sha256"] = "UNSIGNED-PAYLOAD"
+
+        canonical_query = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+            for k, v in sorted(query.items())
+        )
+        signed = sorted(headers)
+        canonical_headers = "".join(f"{k}:{headers[k].strip()}\n" for k in signed)
+        canonical_request = "\n".join(
+            [method, path, canonical_query, canonical_headers, ";".join(signed),
+             "UNSIGNED-PAYLOAD"]
+        )
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join(
+            ["AWS4-HMAC-SHA256", amz_date, scope,
+             hashlib.sha256(canonical_request.encode()).hexdigest()]
+        )
+
+        key = ("AWS4" + self.secret_key).encode()
+        for part in (datestamp, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(signed)}, Signature={signature}"
+        )
+
+    def _request(self, method: str, key: str = None, query: Dict[str, str] = None,
+                 body: bytes = b"", headers: Dict[str, str] = None,
+                 stream_to=None):
+        query = query or {}
+        path = self._object_path(key)
+        url = path
+        if query:
+            url += "?" + "&".join(
+                f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" if v else quote(k)
+                for k, v in query.items()
+            )
+
+        last_error = None
+        for attempt in range(2):
+            request_headers = {"host": self._host_header}
+            request_headers.update(headers or {})
+            request_headers["content-length"] = str(len(body))
+            if self.access_key and self.secret_key:
+                self._sign(method, path, query, request_headers)
+
+            conn = self._pool.acquire()
+            try:
+                conn.request(method, url, body=body, headers=request_headers)
+                response = conn.getresponse()
+                if stream_to is not None and response.status == 200:
+                    for chunk in iter(lambda: response.read(1024 * 1024), b""):
+                        stream_to.write(chunk)
+                    data = b""
+                else:
+                    data = response.read()
+                status, response_headers = response.status, dict(response.getheaders())
+            except (http.client.HTTPException, ConnectionError, socket.timeout) as e:
+                conn.close()
+                last_error = e
+                if stream_to is not None:
+                    break
+                logger.debug(f"Retrying {method} {url} after connection error: {e}")
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                self._pool.release(conn)
+
+            if status == 404 and method in ("GET", "HEAD") and key is not None:
+                raise FileNotFoundError(f"Object not found: {key}")
+            if status >= 300:
+                raise StorageError(
+                    f"{method} {url} failed with HTTP {status}: {data[:200]!r}"
+                )
+            return status, response_headers, data
+        raise StorageError(f"{method} {url} failed: {last_error}")
+
+    def _put(self, key: str, data: bytes) -> None:
+        self._request("PUT", key, body=data)
+
+    def _put_file(self, key: str, file_path: str) -> None:
+        size = os.path.getsize(file_path)
+        if size < self.multipart_threshold:
+            with open(file_path, "rb") as f:
+                self._put(key, f.read())
+            return
+        self._multipart_upload(key, file_path, size)
+
+    def _multipart_upload(self, key: str, file_path: str, size: int) -> None:
+        _, _, data = self._request("POST", key, query={"uploads": ""})
+        upload_id = _xml_text(ET.fromstring(data), "UploadId")
+        logger.debug(f"Started multipart upload of {key} ({size} bytes)")
+
+        def upload_part(part_number: int, offset: int) -> str:
+            with open(file_path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(self.part_size)
+            _, headers, _ = self._request(
+                "PUT", key,
+                query={"partNumber": str(part_number), "uploadId": upload_id},
+                body=chunk,
+            )
+            return {k.lower(): v for k, v in headers.items()}.get("etag", "")
+
+        offsets = range(0, size, self.part_size)
+        try:
+            futures = [
+                self._executor.submit(upload_part, number, offset)
+                for number, offset in enumerate(offsets, start=1)
+            ]
+            etags = [future.result() for future in futures]
+        except Exception:
+            self._request("DELETE", key, query={"uploadId": upload_id})
+            raise
+
+        body = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>"
+            for number, etag in enumerate(etags, start=1)
+        ) + "</CompleteMultipartUpload>"
+        self._request("POST", key, query={"uploadId": upload_id}, body=body.encode())
+
+    def _put_chunks(self, key: str, chunks: Iterable[bytes]) -> None:
+        with tempfile.NamedTemporaryFile(dir=self._spool_dir()) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            spool.flush()
+            self._put_file(key, spool.name)
+
+    def _get(self, key: str) -> bytes:
+        return self._request("GET", key)[2]
+
+    def _get_chunks(self, key: str) -> Iterator[bytes]:
+        with tempfile.TemporaryFile(dir=self._spool_dir()) as spool:
+            self._request("GET", key, stream_to=spool)
+            spool.seek(0)
+            yield from iter(lambda: spool.read(1024 * 1024), b"")
+
+    def _get_file(self, key: str, file_path: str) -> None:
+        with open(file_path, "wb") as f:
+            self._request("GET", key, stream_to=f)
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self._request("HEAD", key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _size(self, key: str) -> int:
+        _, headers, _ = self._request("HEAD", key)
+        for name, value in headers.items():
+            if name.lower() == "content-length":
+                return int(value)
+        return len(self._get(key))
+
+    def _list(self, prefix: str) -> List[str]:
+        full_prefix = f"{self.prefix}/{prefix}" if self.prefix else prefix
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        keys = []
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": full_prefix}
+            if token:
+                query["continuation-token"] = token
+            _, _, data = self._request("GET", query=query)
+            root = ET.fromstring(data)
+            keys.extend(elem.text[strip:] for elem in _xml_children(root, "Key"))
+            if _xml_text(root, "IsTruncated") != "true":
+                return keys
+            token = _xml_text(root, "NextContinuationToken")
+
+    def _delete(self, key: str) -> None:
+        # Bumped before, in case the delete is interrupted, and after, so
+        # that an index rebuilt while it ran is not taken as current.
+        self._bump_generation([key])
+        self._request("DELETE", key)
+        self._bump_generation([key])
+
+    def _put_many(self, items: Dict[str, bytes]) -> None:
+        futures = [
+            self._executor.submit(self._put, key, data) for key, data in items.items()
+        ]
+        for future in futures:
+            future.result()
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        def fetch(key):
+            try:
+                return key, self._get(key)
+            except FileNotFoundError:
+                return key, None
+
+        return {
+            key: data
+            for key, data in self._executor.map(fetch, keys)
+            if data is not None
+        }
+
+    def _exists_many(self, keys: List[str]) -> Set[str]:
+        if len(keys) < self.list_threshold:
+            return {
+                key for key, found in zip(keys, self._executor.map(self._exists, keys))
+                if found
+            }
+        wanted = set(keys)
+        prefixes = {key.rpartition("/")[0] + "/" if "/" in key else "" for key in keys}
+        found = set()
+        for prefix in prefixes:
+            found.update(key for key in self._list(prefix) if key in wanted)
+        return found
+
+    def _delete_many(self, keys: List[str]) -> Dict[str, str]:
+        self._bump_generation(keys)
+        try:
+            return self._delete_batches(keys)
+        finally:
+            self._bump_generation(keys)
+
+    def _delete_batches(self, keys: List[str]) -> Dict[str, str]:
+        failed = {}
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            body = ("<Delete><Quiet>true</Quiet>" + "".join(
+                f"<Object><Key>{escape(self._full_key(key))}</Key></Object>"
+                for key in batch
+            ) + "</Delete>").encode()
+            md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+            _, _, data = self._request(
+                "POST", query={"delete": ""}, body=body, headers={"content-md5": md5}
+            )
+            for error in _xml_children(ET.fromstring(data), "Error"):
+                key = _xml_text(error, "Key")[len(self._full_key("")):]
+                failed[key] = _xml_text(error, "Message")
+        return failed
+
+    def _full_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
@@ -0,0 +1,242 @@
+"""
+Minimal S3-compatible server used as a local stand-in for object storage.
+
+It implements the subset of the S3 API used by
+:class:`~backuptool.s3.S3Backend` (object PUT/GET/HEAD/DELETE,
+ListObjectsV2, multi-object delete and multipart uploads) on top of a local
+directory. Signatures are not verified. It is meant for tests and for
+measuring backend latency without a real object store.
+"""
+
+import os
+import sys
+import uuid
+import hashlib
+import argparse
+import threading
+import collections
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from .s3 import S3_NAMESPACE, _xml_children, _xml_text
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = unquote(parts.path).lstrip("/").partition("/")
+        query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        self.server.count(self.command)
+        return bucket, key, query
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_xml(self, root_tag: str, inner: str):
+        body = (
+            f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<{root_tag} xmlns="{S3_NAMESPACE}">{inner}</{root_tag}>'
+        ).encode()
+        self._send(200, body, {"Content-Type": "application/xml"})
+
+    def _not_found(self):
+        self._send(404, b"<Error><Code>NoSuchKey</Code></Error>")
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        data = self._body()
+        if "uploadId" in query:
+            part_path = self.server.part_path(bucket, query["uploadId"], query["partNumber"])
+            if not os.path.isdir(os.path.dirname(part_path)):
+                return self._send(404, b"<Error><Code>NoSuchUpload</Code></Error>")
+            with open(part_path, "wb") as f:
+                f.write(data)
+        else:
+            self.server.write_object(bucket, key, data)
+        self._send(200, headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+
+    def do_GET(self):
+        bucket, key, query = self._parse()
+        if not key:
+            return self._list(bucket, query)
+        path = self.server.object_path(bucket, key)
+        if not os.path.isfile(path):
+            return self._not_found()
+        with open(path, "rb") as f:
+            data = f.read()
+        self._send(200, data, {"Content-Type": "application/octet-stream"})
+
+    def do_HEAD(self):
+        bucket, key, _ = self._parse()
+        path = self.server.object_path(bucket, key)
+        if not os.path.isfile(path):
+            return self._send(404)
+        self.send_response(200)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        if "uploadId" in query:
+            self.server.remove_upload(bucket, query["uploadId"])
+        else:
+            try:
+                os.remove(self.server.object_path(bucket, key))
+            except FileNotFoundError:
+                pass
+        self._send(204)
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        data = self._body()
+        if "delete" in query:
+            for elem in _xml_children(ET.fromstring(data), "Key"):
+                try:
+                    os.remove(self.server.object_path(bucket, elem.text))
+                except FileNotFoundError:
+                    pass
+            return self._send_xml("DeleteResult", "")
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            os.makedirs(os.path.dirname(self.server.part_path(bucket, upload_id, "1")))
+            return self._send_xml(
+                "InitiateMultipartUploadResult",
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f"<UploadId>{upload_id}</UploadId>",
+            )
+        if "uploadId" in query:
+            upload_id = query["uploadId"]
+            chunks = []
+            for part in _xml_children(ET.fromstring(data), "Part"):
+                part_path = self.server.part_path(
+                    bucket, upload_id, _xml_text(part, "PartNumber")
+                )
+                with open(part_path, "rb") as f:
+                    chunks.append(f.read())
+            self.server.write_object(bucket, key, b"".join(chunks))
+            self.server.remove_upload(bucket, upload_id)
+            return self._send_xml(
+                "CompleteMultipartUploadResult",
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>",
+            )
+        self._send(400)
+
+    def _list(self, bucket, query):
+        prefix = query.get("prefix", "")
+        start_after = query.get("continuation-token", "")
+        max_keys = int(query.get("max-keys", self.server.max_keys))
+        keys = sorted(
+            k for k in self.server.keys(bucket) if k.startswith(prefix) and k > start_after
+        )
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        inner = f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+        inner += f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+        inner += f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+        if truncated:
+            inner += f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>"
+        for key in page:
+            size = os.path.getsize(self.server.object_path(bucket, key))
+            inner += f"<Contents><Key>{escape(key)}</Key><Size>{size}</Size></Contents>"
+        self._send_xml("ListBucketResult", inner)
+
+
+class LocalS3Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root: str, host: str = "127.0.0.1", port: int = 0,
+                 max_keys: int = 1000):
+        super().__init__((host, port), _Handler)
+        self.root = root
+        self.max_keys = max_keys
+        self.request_counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, method: str) -> None:
+        with self._lock:
+            self.request_counts[method] += 1
+
+    def object_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, "objects", quote(key, safe=""))
+
+    def part_path(self, bucket: str, upload_id: str, part_number: str) -> str:
+        return os.path.join(self.root, bucket, "uploads", upload_id, part_number)
+
+    def keys(self, bucket: str):
+        objects = os.path.join(self.root, bucket, "objects")
+        if not os.path.isdir(objects):
+            return []
+        return [unquote(name) for name in os.listdir(objects)]
+
+    def write_object(self, bucket: str, key: str, data: bytes) -> None:
+        path = self.object_path(bucket, key)
+        tmp_dir = os.path.join(self.root, bucket, "tmp")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def remove_upload(self, bucket: str, upload_id: str) -> None:
+        upload_dir = os.path.dirname(self.part_path(bucket, upload_id, "1"))
+        if os.path.isdir(upload_dir):
+            for name in os.listdir(upload_dir):
+                os.remove(os.path.join(upload_dir, name))
+            os.rmdir(upload_dir)
+
+    def start(self) -> "LocalS3Server":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local S3-compatible stand-in server")
+    parser.add_argument("--root", required=True, help="Directory to store objects in")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=9000, help="Port to listen on")
+    args = parser.parse_args()
+
+    server = LocalS3Server(args.root, args.host, args.port)
+    print(f"Serving {args.root} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
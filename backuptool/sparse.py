@@ -0,0 +1,105 @@
+import os
+import errno
+import logging
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger("backuptool.sparse")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def data_extents(file_path: str) -> Optional[List[List[int]]]:
+    """Return the ``[offset, length]`` data extents of a sparse file.
+
+    ``None`` is returned for files without holes and on platforms or
+    filesystems that do not support ``SEEK_DATA``/``SEEK_HOLE``, in which case
+    callers should treat the file as dense.
+    """
+    if not hasattr(os, "SEEK_DATA"):
+        return None
+    st = os.stat(file_path)
+    if not hasattr(st, "st_blocks") or st.st_blocks * 512 >= st.st_size:
+        return None
+
+    extents = []
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        offset = 0
+        while offset < st.st_size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break
+                if e.errno == errno.EINVAL:
+                    return None
+                raise
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+            extents.append([start, end - start])
+            offset = end
+    finally:
+        os.close(fd)
+
+    if len(extents) == 1 and extents[0] == [0, st.st_size]:
+        return None
+    return extents
+
+
+def read_extents(f: BinaryIO, extents: Iterable[List[int]]) -> Iterator[bytes]:
+    for offset, length in extents:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def write_sparse(target_path: str, size: int, extents: Iterable[List[int]],
+                 chunks: Iterable[bytes]) -> None:
+    """Recreate a sparse file from its packed data extents.
+
+    The file is truncated to its apparent ``size`` first so that every range
+    not covered by an extent stays a hole.
+    """
+    stream = iter(chunks)
+    pending = b""
+    with open(target_path, "wb") as f:
+        f.truncate(size)
+        for offset, length in extents:
+            f.seek(offset)
+            while length > 0:
+                if not pending:
+                    pending = next(stream, b"")
+                    if not pending:
+                        raise IOError(f"Packed data too short for {target_path}")
+                piece, pending = pending[:length], pending[length:]
+                f.write(piece)
+                length -= len(piece)
+
+
+def expand_extents(size: int, extents: Iterable[List[int]],
+                   chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield the full contents of a sparse file, zero-filling its holes."""
+    stream = iter(chunks)
+    pending = b""
+    position = 0
+    for offset, length in extents:
+        while position < offset:
+            gap = min(CHUNK_SIZE, offset - position)
+            yield bytes(gap)
+            position += gap
+        while length > 0:
+            if not pending:
+                pending = next(stream, b"")
+                if not pending:
+                    raise IOError("Packed data too short for sparse file")
+            piece, pending = pending[:length], pending[length:]
+            yield piece
+            length -= len(piece)
+            position += len(piece)
+    while position < size:
+        gap = min(CHUNK_SIZE, size - position)
+        yield bytes(gap)
+        position += gap
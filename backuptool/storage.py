@@ -0,0 +1,516 @@
+import os
+import sys
+import stat
+import time
+import shutil
+import logging
+import threading
+import contextlib
+from typing import Dict, Iterable, Iterator, List, Set
+
+logger = logging.getLogger("backuptool.storage")
+
+DURABILITY_MODES = ("none", "batch", "strict")
+
+
+class StorageError(IOError):
+    pass
+
+
+class StorageBackend:
+    """Key/value blob store used by :class:`~backuptool.core.BackupDatabase`.
+
+    Keys are ``/``-separated strings such as ``content/<hash>`` or
+    ``snapshots/<id>``. Missing objects raise :class:`FileNotFoundError`.
+    Subclasses implement the underscored primitives; the public methods add
+    per-operation latency accounting in :attr:`stats` so that backend cost can
+    be measured separately from hashing and walking. A backend opened with
+    ``read_only=True`` rejects every write with :class:`PermissionError`.
+
+    ``durability`` selects when written objects reach stable storage:
+    ``none`` never syncs, ``strict`` syncs every object as it is written and
+    ``batch`` defers content blobs until :meth:`sync` is called. Callers must
+    call :meth:`sync` before writing anything that references those blobs.
+    """
+
+    location = ""
+
+    def __init__(self, read_only: bool = False, durability: str = "batch"):
+        self.read_only = read_only
+        self.durability = durability
+        self.stats: Dict[str, List[float]] = {}
+        self._stats_lock = threading.Lock()
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise PermissionError(f"Storage at {self.location} is opened read-only")
+
+    @contextlib.contextmanager
+    def _timed(self, op: str, count: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                entry = self.stats.setdefault(op, [0, 0.0])
+                entry[0] += count
+                entry[1] += elapsed
+
+    def put(self, key: str, data: bytes) -> None:
+        self._check_writable()
+        with self._timed("put"):
+            self._put(key, data)
+
+    def put_file(self, key: str, file_path: str) -> None:
+        self._check_writable()
+        with self._timed("put_file"):
+            self._put_file(key, file_path)
+
+    def put_chunks(self, key: str, chunks: Iterable[bytes]) -> None:
+        self._check_writable()
+        with self._timed("put_chunks"):
+            self._put_chunks(key, chunks)
+
+    def append(self, key: str, data: bytes) -> None:
+        self._check_writable()
+        with self._timed("append"):
+            self._append(key, data)
+
+    def get(self, key: str) -> bytes:
+        with self._timed("get"):
+            return self._get(key)
+
+    def get_file(self, key: str, file_path: str) -> None:
+        with self._timed("get_file"):
+            self._get_file(key, file_path)
+
+    def get_chunks(self, key: str) -> Iterator[bytes]:
+        with self._timed("get_chunks"):
+            yield from self._get_chunks(key)
+
+    def exists(self, key: str) -> bool:
+        with self._timed("exists"):
+            return self._exists(key)
+
+    def size(self, key: str) -> int:
+        with self._timed("size"):
+            return self._size(key)
+
+    def list(self, prefix: str = "") -> List[str]:
+        with self._timed("list"):
+            return self._list(prefix)
+
+    def delete(self, key: str) -> None:
+        self._check_writable()
+        with self._timed("delete"):
+            self._delete(key)
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        self._check_writable()
+        with self._timed("put_many", len(items)):
+            self._put_many(items)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        with self._timed("get_many", len(keys)):
+            return self._get_many(keys)
+
+    def exists_many(self, keys: Iterable[str]) -> Set[str]:
+        keys = list(keys)
+        with self._timed("exists_many", len(keys)):
+            return self._exists_many(keys)
+
+    def delete_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        self._check_writable()
+        keys = list(keys)
+        with self._timed("delete_many", len(keys)):
+            return self._delete_many(keys)
+
+    @property
+    def durability(self) -> str:
+        return self._durability
+
+    @durability.setter
+    def durability(self, mode: str) -> None:
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {mode}")
+        self._durability = mode
+
+    def sync(self) -> None:
+        with self._timed("sync"):
+            self._sync()
+
+    def local_cache_path(self, name: str) -> str:
+        raise NotImplementedError
+
+    def content_stamp(self) -> int:
+        return 0
+
+    # Whether storing a blob changes the content stamp, so that writers must
+    # re-read it to keep their own index current.
+    content_stamp_tracks_writes = False
+    # Whether append() writes only the new bytes; otherwise it rewrites the
+    # whole object and callers that append often should use new keys.
+    appends_in_place = False
+
+    def close(self) -> None:
+        pass
+
+    @contextlib.contextmanager
+    def lock(self, name: str):
+        """Hold the exclusive lock ``name`` shared with other processes.
+
+        Backends that cannot lock do nothing here and rely on a single
+        writer.
+        """
+        yield
+
+    def _sync(self) -> None:
+        pass
+
+    def _put(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _put_file(self, key: str, file_path: str) -> None:
+        with open(file_path, "rb") as f:
+            self._put(key, f.read())
+
+    def _put_chunks(self, key: str, chunks: Iterable[bytes]) -> None:
+        self._put(key, b"".join(chunks))
+
+    def _append(self, key: str, data: bytes) -> None:
+        try:
+            existing = self._get(key)
+        except FileNotFoundError:
+            existing = b""
+        self._put(key, existing + data)
+
+    def _get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def _get_chunks(self, key: str) -> Iterator[bytes]:
+        yield self._get(key)
+
+    def _get_file(self, key: str, file_path: str) -> None:
+        data = self._get(key)
+        with open(file_path, "wb") as f:
+            f.write(data)
+
+    def _exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def _size(self, key: str) -> int:
+        return len(self._get(key))
+
+    def _list(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def _delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _put_many(self, items: Dict[str, bytes]) -> None:
+        for key, data in items.items():
+            self._put(key, data)
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        result = {}
+        for key in keys:
+            try:
+                result[key] = self._get(key)
+            except FileNotFoundError:
+                continue
+        return result
+
+    def _exists_many(self, keys: List[str]) -> Set[str]:
+        return {key for key in keys if self._exists(key)}
+
+    def _delete_many(self, keys: List[str]) -> Dict[str, str]:
+        failed = {}
+        for key in keys:
+            try:
+                self._delete(key)
+            except OSError as e:
+                failed[key] = str(e)
+        return failed
+
+
+class LocalBackend(StorageBackend):
+    # Above this many unsynced blobs a single syncfs(2) is cheaper than one
+    # fdatasync(2) per file.
+    SYNCFS_THRESHOLD = 64
+
+    def __init__(self, db_path: str, read_only: bool = False,
+                 durability: str = "batch"):
+        super().__init__(read_only, durability)
+        self.location = db_path
+        self.db_path = db_path
+        self.content_path = os.path.join(db_path, "content")
+        self.snapshots_path = os.path.join(db_path, "snapshots")
+        self.metadata_path = os.path.join(db_path, "metadata.json")
+        self._unsynced: List[str] = []
+        self._dirty_dirs: Set[str] = set()
+
+        if read_only:
+            return
+        try:
+            os.makedirs(self.content_path, exist_ok=True)
+            os.makedirs(self.snapshots_path, exist_ok=True)
+            logger.debug(f"Database directories created at {db_path}")
+        except OSError as e:
+            logger.error(f"Failed to create database directories: {e}")
+            raise
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.db_path, *key.split("/"))
+
+    def local_cache_path(self, name: str) -> str:
+        return os.path.join(self.db_path, name)
+
+    content_stamp_tracks_writes = True
+    appends_in_place = True
+
+    @contextlib.contextmanager
+    def lock(self, name: str):
+        self._check_writable()
+        with open(os.path.join(self.db_path, f"{name}.lock"), "a+b") as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+    def content_stamp(self) -> int:
+        try:
+            return os.stat(self.content_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _put(self, key: str, data: bytes) -> None:
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            if self.durability != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if self.durability != "none":
+            _fsync_dir(os.path.dirname(path))
+
+    def _append(self, key: str, data: bytes) -> None:
+        path = self.path(key)
+        created = not os.path.exists(path)
+        with open(path, "ab") as f:
+            f.write(data)
+            if self.durability != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        if created and self.durability != "none":
+            _fsync_dir(os.path.dirname(path))
+
+    def _put_file(self, key: str, file_path: str) -> None:
+        path = self.path(key)
+        tmp_path = self._tmp_path(path)
+        try:
+            shutil.copy2(file_path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        self._written(path)
+
+    def _put_chunks(self, key: str, chunks: Iterable[bytes]) -> None:
+        # Written under a temporary name so that an interrupted write never
+        # leaves a truncated object behind under its final key.
+        path = self.path(key)
+        tmp_path = self._tmp_path(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                if self.durability == "strict":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        if self.durability == "strict":
+            self._dirty_dirs.add(os.path.dirname(path))
+        elif self.durability == "batch":
+            self._unsynced.append(path)
+
+    @staticmethod
+    def _tmp_path(path: str) -> str:
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _written(self, path: str) -> None:
+        if self.durability == "strict":
+            _fsync_file(path)
+            self._dirty_dirs.add(os.path.dirname(path))
+        elif self.durability == "batch":
+            self._unsynced.append(path)
+
+    def _sync(self) -> None:
+        # Group commit: flush every blob written since the last sync, then
+        # the directories holding their entries, so that a manifest written
+        # afterwards never references data that could be lost on power loss.
+        unsynced, self._unsynced = self._unsynced, []
+        if unsynced:
+            if len(unsynced) < self.SYNCFS_THRESHOLD or not _syncfs(self.content_path):
+                for path in unsynced:
+                    _fsync_file(path)
+            self._dirty_dirs.update(os.path.dirname(path) for path in unsynced)
+            logger.debug(f"Synced {len(unsynced)} content files")
+        dirty, self._dirty_dirs = self._dirty_dirs, set()
+        for directory in dirty:
+            _fsync_dir(directory)
+
+    def _get(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def _get_chunks(self, key: str) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            yield from iter(lambda: f.read(1024 * 1024), b"")
+
+    def _get_file(self, key: str, file_path: str) -> None:
+        shutil.copy2(self.path(key), file_path)
+
+    def _exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def _size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def _list(self, prefix: str) -> List[str]:
+        base = prefix.rpartition("/")[0]
+        top = self.path(base) if base else self.db_path
+        keys = []
+        for root, _, files in os.walk(top):
+            rel_root = os.path.relpath(root, self.db_path).replace(os.sep, "/")
+            for name in files:
+                key = name if rel_root == "." else f"{rel_root}/{name}"
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def _delete(self, key: str) -> None:
+        os.remove(self.path(key))
+
+
+def open_backend(db_path: str = None, **kwargs) -> StorageBackend:
+    if db_path is None:
+        home_dir = os.path.expanduser("~")
+        db_path = os.path.join(home_dir, ".backuptool")
+    if db_path.startswith(("http://", "https://")):
+        from .s3 import S3Backend
+
+        return S3Backend.from_url(db_path, **kwargs)
+    return LocalBackend(db_path, **kwargs)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _fsync_file(path: str) -> None:
+    if os.name == "nt":
+        _fsync_file_windows(path)
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        getattr(os, "fdatasync", os.fsync)(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_file_windows(path: str) -> None:
+    # os.fsync maps to FlushFileBuffers, which needs a handle with write
+    # access. Blobs keep the mode of their source, so a read-only one is made
+    # writable for the duration of the flush.
+    mode = os.stat(path).st_mode
+    writable = mode & stat.S_IWRITE
+    if not writable:
+        os.chmod(path, mode | stat.S_IWRITE)
+    try:
+        fd = os.open(path, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    finally:
+        if not writable:
+            os.chmod(path, mode)
+
+
+def _lock_file(f) -> None:
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds; keep waiting.
+                continue
+    import fcntl
+
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    import fcntl
+
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Not every platform or filesystem supports syncing a directory.
+        pass
+    finally:
+        os.close(fd)
+
+
+def _syncfs(path: str) -> bool:
+    """Flush the whole filesystem containing ``path`` with syncfs(2).
+
+    Returns ``False`` where syncfs is unavailable so callers can fall back to
+    syncing files individually.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import ctypes
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        syncfs = libc.syncfs
+    except (OSError, AttributeError):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if syncfs(fd) != 0:
+            logger.debug(f"syncfs failed: {os.strerror(ctypes.get_errno())}")
+            return False
+        return True
+    finally:
+        os.close(fd)
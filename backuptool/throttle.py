@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import logging
+import platform
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger("backuptool.throttle")
+
+THROTTLE_KEYS = ("read_rate", "write_rate", "files_rate", "io_idle", "nice", "adaptive")
+
+# ioprio_set(2) syscall numbers by machine; see linux/ioprio.h for the values.
+_IOPRIO_SET = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "arm64": 30}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+
+
+class TokenBucket:
+    """Blocking token bucket; ``rate`` tokens per second, up to ``burst``."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.burst = max(self.burst, self.rate)
+
+    def consume(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+class Throttle:
+    """Rate limits for snapshot and restore I/O.
+
+    ``read_rate`` and ``write_rate`` are bytes per second, ``files_rate`` is
+    files per second; ``None`` or ``0`` means unlimited. With ``adaptive`` the
+    read rate is managed AIMD-style from measured read latency: it is halved
+    whenever the smoothed latency per MiB rises to twice the best value seen,
+    and grows back by 10% per sample while latency stays close to it.
+    """
+
+    MIB = 1024 * 1024
+    MIN_ADAPTIVE_RATE = 256 * 1024
+
+    def __init__(self, read_rate: float = None, write_rate: float = None,
+                 files_rate: float = None, io_idle: bool = False, nice: int = 0,
+                 adaptive: bool = False):
+        self.read_rate = read_rate or None
+        self.write_rate = write_rate or None
+        self.files_rate = files_rate or None
+        self.io_idle = io_idle
+        self.nice = nice or 0
+        self.adaptive = adaptive
+
+        self._read = TokenBucket(read_rate) if self.read_rate else None
+        self._write = TokenBucket(write_rate) if self.write_rate else None
+        self._files = TokenBucket(files_rate) if self.files_rate else None
+        self._latency = None
+        self._best_latency = None
+        self._throughput = None
+        self._priority_applied = False
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "Throttle":
+        config = config or {}
+        return cls(**{key: config[key] for key in THROTTLE_KEYS if key in config})
+
+    @property
+    def limits_io(self) -> bool:
+        return bool(self._read or self._write or self.adaptive)
+
+    def read(self, nbytes: int) -> None:
+        if self._read:
+            self._read.consume(nbytes)
+
+    def write(self, nbytes: int) -> None:
+        if self._write:
+            self._write.consume(nbytes)
+
+    def file(self) -> None:
+        if self._files:
+            self._files.consume(1)
+
+    def observe_read(self, nbytes: int, seconds: float) -> None:
+        if not self.adaptive or nbytes <= 0:
+            return
+        per_mib = seconds * self.MIB / nbytes
+        self._latency = per_mib if self._latency is None else (
+            0.8 * self._latency + 0.2 * per_mib
+        )
+        if seconds > 0:
+            sample = nbytes / seconds
+            self._throughput = sample if self._throughput is None else (
+                0.8 * self._throughput + 0.2 * sample
+            )
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+            return
+
+        if self._latency > 2 * self._best_latency:
+            current = self._read.rate if self._read else (self._throughput or self.MIB)
+            rate = max(self.MIN_ADAPTIVE_RATE, current / 2)
+            if self._read:
+                self._read.set_rate(rate)
+            else:
+                self._read = TokenBucket(rate)
+            logger.debug(f"Read latency rising, backing off to {rate:.0f} B/s")
+        elif self._read and self._latency < 1.2 * self._best_latency:
+            rate = self._read.rate * 1.1
+            if self.read_rate and rate >= self.read_rate:
+                rate = self.read_rate
+            elif not self.read_rate and self._throughput and rate > 2 * self._throughput:
+                self._read = None
+                return
+            self._read.set_rate(rate)
+
+    def apply_priority(self) -> None:
+        if self._priority_applied:
+            return
+        self._priority_applied = True
+        if self.nice:
+            try:
+                os.nice(self.nice)
+                logger.debug(f"Process niceness increased by {self.nice}")
+            except (AttributeError, OSError) as e:
+                logger.warning(f"Failed to set nice level: {e}")
+        if self.io_idle:
+            set_io_idle()
+
+
+def set_io_idle() -> bool:
+    """Move the current process to the idle I/O scheduling class (Linux only)."""
+    syscall_number = _IOPRIO_SET.get(platform.machine())
+    if not sys.platform.startswith("linux") or syscall_number is None:
+        logger.warning("Idle I/O priority is only supported on Linux")
+        return False
+
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    priority = _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT
+    if libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, 0, priority) != 0:
+        errno = ctypes.get_errno()
+        logger.warning(f"ioprio_set failed: {os.strerror(errno)}")
+        return False
+    logger.debug("I/O priority set to idle class")
+    return True
@@ -0,0 +1,67 @@
+"""
+Measure CLI startup cost.
+
+Times a bare ``import backuptool.cli`` and a full ``backuptool list`` run in
+fresh interpreters and reports the median wall time of each. With
+``--max-ms`` the script exits non-zero when the ``list`` median exceeds the
+budget, so it can be used to hold the line in CI.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def time_command(command, runs):
+    samples = []
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True, env=env)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per measurement")
+    parser.add_argument(
+        "--max-ms", type=float, help="Fail if the median list time exceeds this"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    db_dir = tempfile.mkdtemp()
+    try:
+        baseline = time_command([sys.executable, "-c", "pass"], args.runs)
+        import_ms = time_command(
+            [sys.executable, "-c", "import backuptool.cli"], args.runs
+        )
+        list_ms = time_command(
+            [sys.executable, "-m", "backuptool.cli", "list", f"--db-path={db_dir}"],
+            args.runs,
+        )
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    print(f"interpreter:          {baseline:8.1f} ms")
+    print(f"import backuptool.cli: {import_ms:7.1f} ms (+{import_ms - baseline:.1f})")
+    print(f"backuptool list:      {list_ms:8.1f} ms (+{list_ms - baseline:.1f})")
+
+    if args.max_ms is not None and list_ms > args.max_ms:
+        print(f"FAIL: list took {list_ms:.1f} ms, budget is {args.max_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
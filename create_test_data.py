@@ -1,4 +1,5 @@
 import os
+import json
 import random
 import argparse
 
@@ -56,9 +57,34 @@ def main():
     parser.add_argument(
         "--max-file-size", type=int, default=1024, help="Maximum file size in bytes"
     )
+    parser.add_argument(
+        "--profile",
+        help="Profile written by 'backuptool profile-tree'; generates a tree of "
+        "the same shape instead of random files",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier for the number of files and directories of --profile",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Random seed used with --profile"
+    )
 
     args = parser.parse_args()
-    create_test_data(args.base_dir, args.num_files, args.max_depth, args.max_file_size)
+    if args.profile:
+        from backuptool.profile import generate_tree
+
+        with open(args.profile) as f:
+            profile = json.load(f)
+        result = generate_tree(profile, args.base_dir, args.scale, args.seed)
+        print(
+            f"Created {result['files']} files ({result['bytes']} bytes) in "
+            f"{result['directories']} directories under {args.base_dir}"
+        )
+    else:
+        create_test_data(args.base_dir, args.num_files, args.max_depth, args.max_file_size)
 
 
 if __name__ == "__main__":
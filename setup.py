@@ -7,6 +7,9 @@ setup(
     install_requires=[
         "tabulate",
     ],
+    extras_require={
+        "delta": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "backuptool=backuptool.cli:main",
@@ -0,0 +1,196 @@
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+from backuptool.repository import Repository
+
+MIN_SIZE = 256 * 1024
+
+
+class TestAppendOnlyFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.rng = random.Random(0)
+        self.log = os.path.join(self.test_dir, "app.log")
+        self.append(1024 * 1024)
+        with open(os.path.join(self.test_dir, "small.txt"), "wb") as f:
+            f.write(b"small")
+        self.db = BackupDatabase(self.db_dir, append_min_size=MIN_SIZE)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def append(self, size):
+        with open(self.log, "ab") as f:
+            f.write(self.rng.getrandbits(8 * size).to_bytes(size, "little"))
+
+    def content_files(self):
+        return set(os.listdir(self.db.content_path))
+
+    def entry(self, snapshot_id):
+        return self.db.get_snapshot(snapshot_id)["files"]["app.log"]
+
+    def assert_restores(self, snapshot_id):
+        shutil.rmtree(self.output_dir)
+        self.assertTrue(self.db.restore_snapshot(snapshot_id, self.output_dir))
+        with open(self.log, "rb") as f, \
+                open(os.path.join(self.output_dir, "app.log"), "rb") as restored:
+            self.assertEqual(f.read(), restored.read())
+
+    def read_bytes(self, db):
+        """Bytes read from source files while taking a snapshot."""
+        read = [0]
+        read_chunks = db._read_chunks
+
+        def counting(*args, **kwargs):
+            for chunk in read_chunks(*args, **kwargs):
+                read[0] += len(chunk)
+                yield chunk
+
+        with mock.patch.object(db, "_read_chunks", side_effect=counting):
+            db.create_snapshot(self.test_dir)
+        return read[0]
+
+    def test_appended_bytes_stored_as_tail_segment(self):
+        self.db.create_snapshot(self.test_dir)
+        first = self.entry(1)
+        self.assertEqual(1, len(first["chunks"]))
+        self.assertIsInstance(self.db.get_snapshot(1)["files"]["small.txt"], str)
+        before = self.content_files()
+
+        self.append(100 * 1024)
+        self.db.create_snapshot(self.test_dir)
+
+        entry = self.entry(2)
+        self.assertEqual(first["chunks"], entry["chunks"][:1])
+        self.assertEqual([1024 * 1024, 100 * 1024], entry["lengths"])
+        new = self.content_files() - before
+        self.assertEqual(set(entry["chunks"][1:]), new)
+        self.assertEqual(100 * 1024, os.path.getsize(os.path.join(self.db.content_path, *new)))
+        self.assert_restores(2)
+
+    def test_append_only_files_read_only_tail(self):
+        db = BackupDatabase(self.db_dir, append_min_size=MIN_SIZE, append_only=["*.log"])
+        db.create_snapshot(self.test_dir)
+        self.append(100 * 1024)
+
+        read = self.read_bytes(db)
+
+        # Tail hashed and copied, the fingerprint blocks and small.txt.
+        self.assertEqual(2 * 100 * 1024 + 4 * 64 * 1024 + 5, read)
+        self.assertEqual([1024 * 1024, 100 * 1024], self.entry(2)["lengths"])
+        self.assert_restores(2)
+
+    def test_modified_in_middle_and_grew(self):
+        self.db.create_snapshot(self.test_dir)
+        with open(self.log, "r+b") as f:
+            f.seek(512 * 1024)
+            byte = f.read(1)
+            f.seek(512 * 1024)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        self.append(1000)
+
+        self.db.create_snapshot(self.test_dir)
+
+        self.assertEqual([1024 * 1024 + 1000], self.entry(2)["lengths"])
+        self.assert_restores(2)
+
+    def test_changed_prefix_falls_back_to_full_hash(self):
+        self.db.create_snapshot(self.test_dir)
+        with open(self.log, "r+b") as f:
+            f.write(b"rewritten")
+        self.append(1000)
+
+        self.db.create_snapshot(self.test_dir)
+
+        entry = self.entry(2)
+        self.assertEqual(1, len(entry["chunks"]))
+        self.assertNotEqual(self.entry(1)["chunks"], entry["chunks"])
+        self.assert_restores(2)
+
+    def test_unchanged_segmented_file_reuses_segments(self):
+        self.db.create_snapshot(self.test_dir)
+        self.append(1000)
+        self.db.create_snapshot(self.test_dir)
+        before = self.content_files()
+
+        self.db.create_snapshot(self.test_dir)
+
+        self.assertEqual(self.entry(2), self.entry(3))
+        self.assertEqual(before, self.content_files())
+
+    def test_truncated_file_stored_in_full(self):
+        self.db.create_snapshot(self.test_dir)
+        with open(self.log, "r+b") as f:
+            f.truncate(512 * 1024)
+
+        self.db.create_snapshot(self.test_dir)
+
+        self.assertEqual([512 * 1024], self.entry(2)["lengths"])
+        self.assert_restores(2)
+
+    def test_prune_keeps_shared_segments(self):
+        self.db.create_snapshot(self.test_dir)
+        self.append(1000)
+        self.db.create_snapshot(self.test_dir)
+
+        self.db.prune_snapshot(1)
+
+        self.assert_restores(2)
+        with Repository(self.db_dir, read_only=True) as repo:
+            with repo.open_file(2, "app.log") as f, open(self.log, "rb") as source:
+                self.assertEqual(source.read(), f.read())
+
+    def test_corrupted_segment_detected(self):
+        self.db.create_snapshot(self.test_dir)
+        self.append(1000)
+        self.db.create_snapshot(self.test_dir)
+        tail = self.entry(2)["chunks"][1]
+        with open(os.path.join(self.db.content_path, tail), "wb") as f:
+            f.write(b"x" * 1000)
+
+        with self.assertRaises(IOError):
+            self.db._restore_entry(self.entry(2), os.path.join(self.output_dir, "app.log"))
+
+    def test_disabled_by_default(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+
+        self.assertIsInstance(db.get_snapshot(1)["files"]["app.log"], str)
+
+    def test_enabled_from_repository_config(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"append_min_size": MIN_SIZE, "append_only": ["*.log"]}, f)
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+
+        self.assertIn("fingerprint", db.get_snapshot(1)["files"]["app.log"])
+        self.assertEqual(["*.log"], db.append_only)
+
+    def test_delta_takes_precedence_in_its_size_range(self):
+        db = BackupDatabase(self.db_dir, append_min_size=MIN_SIZE, delta={"enabled": True})
+        db.create_snapshot(self.test_dir)
+        self.assertIsInstance(db.get_snapshot(1)["files"]["app.log"], str)
+        self.append(1000)
+
+        db.create_snapshot(self.test_dir)
+
+        self.assertIn("chain", db.get_snapshot(2)["files"]["app.log"])
+        self.assertTrue(db.restore_snapshot(2, self.output_dir))
+        with open(self.log, "rb") as f, \
+                open(os.path.join(self.output_dir, "app.log"), "rb") as restored:
+            self.assertEqual(f.read(), restored.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
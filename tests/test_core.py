@@ -4,6 +4,7 @@ import tempfile
 import unittest
 import hashlib
 from pathlib import Path
+from unittest import mock
 
 from backuptool.core import BackupDatabase
 
@@ -102,6 +103,26 @@ class TestBackupDatabase(unittest.TestCase):
         with open(os.path.join(self.output_dir, "file1.txt"), "r") as f:
             self.assertEqual("This is file 1", f.read())
 
+    def test_failed_file_fails_restore(self):
+        snapshot_id = self.db.create_snapshot(self.test_dir)
+        restore_entry = self.db._restore_entry
+
+        def failing(entry, target_path):
+            if target_path.endswith("file3.txt"):
+                with open(target_path, "wb") as f:
+                    f.write(b"partial")
+                raise IOError("connection lost")
+            restore_entry(entry, target_path)
+
+        with mock.patch.object(self.db, "_restore_entry", side_effect=failing):
+            success = self.db.restore_snapshot(snapshot_id, self.output_dir)
+
+        self.assertFalse(success)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.output_dir, "subdir2", "file3.txt"))
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "file1.txt")))
+
     def test_prune_snapshot(self):
         self.db.create_snapshot(self.test_dir)
         self.db.create_snapshot(self.test_dir)
@@ -0,0 +1,171 @@
+import os
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from backuptool import cli
+from backuptool.client import (
+    QUEUE_FULL,
+    WRONG_REPOSITORY,
+    DaemonClient,
+    DaemonError,
+    connect,
+)
+from backuptool.core import BackupDatabase
+from backuptool.daemon import BackupDaemon
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets not supported")
+class TestBackupDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        for i in range(20):
+            with open(os.path.join(self.test_dir, f"file{i}.txt"), "w") as f:
+                f.write(f"contents {i}")
+
+        self.socket_path = os.path.join(self.db_dir, "daemon.sock")
+        self.daemon = BackupDaemon(
+            self.socket_path, self.db_dir, workers=2, progress_interval=0.01
+        )
+        self.daemon.start()
+
+    def tearDown(self):
+        self.daemon.stop()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def call(self, method, params=None, **kwargs):
+        with DaemonClient(self.socket_path) as client:
+            return client.call(method, params, **kwargs)
+
+    def test_snapshot_list_restore_prune(self):
+        snapshot_id = self.call("snapshot", {"target_dir": self.test_dir})["snapshot_id"]
+        self.assertEqual(1, snapshot_id)
+
+        snapshots = self.call("list")["snapshots"]
+        self.assertEqual([1], [s["id"] for s in snapshots])
+        self.assertEqual(20, snapshots[0]["file_count"])
+
+        result = self.call(
+            "restore", {"snapshot_id": 1, "output_dir": self.output_dir}
+        )
+        self.assertTrue(result["success"])
+        with open(os.path.join(self.output_dir, "file7.txt")) as f:
+            self.assertEqual("contents 7", f.read())
+
+        self.assertTrue(self.call("prune", {"snapshot_id": 1})["success"])
+        self.assertEqual([], self.call("list")["snapshots"])
+
+    def test_snapshot_after_prune_without_daemon(self):
+        self.call("snapshot", {"target_dir": self.test_dir})
+        BackupDatabase(self.db_dir).prune_snapshot(1)
+
+        snapshot_id = self.call("snapshot", {"target_dir": self.test_dir})["snapshot_id"]
+
+        self.assertEqual(20, len(os.listdir(os.path.join(self.db_dir, "content"))))
+        result = self.call(
+            "restore", {"snapshot_id": snapshot_id, "output_dir": self.output_dir}
+        )
+        self.assertTrue(result["success"])
+        with open(os.path.join(self.output_dir, "file7.txt")) as f:
+            self.assertEqual("contents 7", f.read())
+
+    def test_progress_notifications(self):
+        updates = []
+        original = self.daemon.repository.create_snapshot
+
+        def slow_snapshot(*args, progress=None, **kwargs):
+            def report(files, nbytes):
+                progress(files, nbytes)
+                threading.Event().wait(0.005)
+            return original(*args, progress=report, **kwargs)
+
+        with mock.patch.object(self.daemon.repository, "create_snapshot", slow_snapshot):
+            self.call("snapshot", {"target_dir": self.test_dir}, progress=updates.append)
+
+        self.assertTrue(updates)
+        files = [update["files"] for update in updates]
+        self.assertEqual(sorted(files), files)
+
+    def test_background_job_status(self):
+        job_id = self.call(
+            "snapshot", {"target_dir": self.test_dir, "wait": False}
+        )["job"]
+        self.daemon.job(job_id).done.wait(10)
+
+        status = self.call("status", {"job": job_id})
+        self.assertEqual("done", status["state"])
+        self.assertEqual({"snapshot_id": 1}, status["result"])
+        self.assertEqual(20, status["files"])
+        self.assertEqual([job_id], [job["job"] for job in self.call("jobs")["jobs"]])
+
+    def test_failed_job_reports_error(self):
+        with self.assertRaises(DaemonError) as cm:
+            self.call("snapshot", {"target_dir": os.path.join(self.test_dir, "missing")})
+        self.assertIn("does not exist", cm.exception.message)
+
+    def test_invalid_requests(self):
+        with self.assertRaises(DaemonError):
+            self.call("format_disk")
+        with self.assertRaises(DaemonError):
+            self.call("snapshot", {"target": self.test_dir})
+
+    def test_wrong_repository_rejected(self):
+        other = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(DaemonError) as cm:
+                self.call("list", {"db_path": other})
+        finally:
+            shutil.rmtree(other, ignore_errors=True)
+        self.assertEqual(WRONG_REPOSITORY, cm.exception.code)
+
+    def test_queue_limit(self):
+        self.daemon.max_queue = 1
+        release = threading.Event()
+        with mock.patch.object(
+            self.daemon, "_job_prune", lambda job, snapshot_id: release.wait(10)
+        ):
+            self.call("prune", {"snapshot_id": 1, "wait": False})
+            with self.assertRaises(DaemonError) as cm:
+                self.call("prune", {"snapshot_id": 2, "wait": False})
+            release.set()
+        self.assertEqual(QUEUE_FULL, cm.exception.code)
+
+    def test_cli_uses_running_daemon(self):
+        with mock.patch("sys.argv", [
+            "backuptool", "snapshot", "--target-directory", self.test_dir,
+            "--db-path", self.db_dir,
+        ]), mock.patch("backuptool.core.create_snapshot") as direct:
+            self.assertEqual(0, cli.main())
+        direct.assert_not_called()
+        self.assertEqual(1, len(self.daemon.jobs()))
+
+        with mock.patch("sys.argv", [
+            "backuptool", "snapshot", "--target-directory", self.test_dir,
+            "--db-path", self.db_dir, "--no-daemon",
+        ]):
+            self.assertEqual(0, cli.main())
+        self.assertEqual(1, len(self.daemon.jobs()))
+        self.assertEqual(2, len(self.call("list")["snapshots"]))
+
+    def test_stale_socket_replaced(self):
+        self.daemon.stop()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        self.assertIsNone(connect(self.db_dir))
+
+        self.daemon = BackupDaemon(self.socket_path, self.db_dir)
+        self.daemon.start()
+        self.assertIsNotNone(self.call("ping")["pid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import delta as delta_module
+from backuptool.core import BackupDatabase
+from backuptool.delta import apply_delta, compute_delta
+from backuptool.repository import Repository
+
+
+def random_bytes(rng, size):
+    return rng.getrandbits(8 * size).to_bytes(size, "little")
+
+
+class TestDeltaEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.base = random_bytes(random.Random(0), 256 * 1024)
+
+    def roundtrip(self, target):
+        delta = compute_delta(self.base, target)
+        self.assertEqual(target, apply_delta(self.base, delta))
+        return delta
+
+    def test_append(self):
+        delta = self.roundtrip(self.base + b"new log line\n" * 100)
+        self.assertLess(len(delta), 2000)
+
+    def test_insert_and_delete_shift_content(self):
+        self.assertLess(len(self.roundtrip(self.base[:100] + b"x" + self.base[100:])), 1000)
+        self.assertLess(len(self.roundtrip(self.base[:5000] + self.base[9000:])), 1000)
+
+    def test_unrelated_content(self):
+        target = random_bytes(random.Random(1), 100 * 1024)
+        self.roundtrip(target)
+        self.assertIsNone(compute_delta(self.base, target, limit=len(target) // 2))
+
+    def test_empty(self):
+        self.roundtrip(b"")
+        self.assertEqual(b"", apply_delta(b"", compute_delta(b"", b"")))
+
+
+@unittest.skipIf(delta_module._numpy() is None, "NumPy is not installed")
+class TestNumpyScanner(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(2)
+        self.base = random_bytes(rng, 512 * 1024)
+        edited = bytearray(self.base)
+        for _ in range(10):
+            pos = rng.randrange(len(edited) - 100)
+            edited[pos:pos + 20] = random_bytes(rng, 20)
+        self.targets = [
+            bytes(edited),
+            self.base[:1000] + b"x" + self.base[1000:] + b"tail",
+            random_bytes(rng, 300 * 1024),
+            # Repeated blocks give checksum hits whose strong hash differs.
+            self.base[:2048] * 64 + bytes(4096),
+            b"short",
+        ]
+
+    def compare(self, base, target, **kwargs):
+        numpy_delta = compute_delta(base, target, **kwargs)
+        with mock.patch.object(delta_module, "_numpy", return_value=None):
+            python_delta = compute_delta(base, target, **kwargs)
+        self.assertEqual(python_delta, numpy_delta)
+        return numpy_delta
+
+    def test_same_output_as_pure_python(self):
+        for target in self.targets:
+            delta = self.compare(self.base, target)
+            self.assertEqual(target, apply_delta(self.base, delta))
+
+    def test_same_output_with_limit_and_small_blocks(self):
+        for target in self.targets:
+            self.compare(self.base, target, limit=len(target) // 2)
+            self.compare(self.base, target, block_size=512)
+
+    def test_base_shorter_than_block(self):
+        self.compare(b"tiny", self.targets[0])
+
+
+class TestDeltaSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.test_dir, "app.log")
+        self.rng = random.Random(0)
+        self.versions = [random_bytes(self.rng, 200 * 1024)]
+        self.write(self.versions[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def write(self, content):
+        with open(self.log_path, "wb") as f:
+            f.write(content)
+
+    def grow(self):
+        self.versions.append(self.versions[-1] + random_bytes(self.rng, 1024))
+        self.write(self.versions[-1])
+
+    def database(self, **delta):
+        return BackupDatabase(self.db_dir, delta=dict({"enabled": True}, **delta))
+
+    def content_bytes(self):
+        return sum(
+            os.path.getsize(os.path.join(self.db_dir, "content", name))
+            for name in os.listdir(os.path.join(self.db_dir, "content"))
+        )
+
+    def test_changed_file_stored_as_delta(self):
+        db = self.database()
+        db.create_snapshot(self.test_dir)
+        for _ in range(3):
+            self.grow()
+            db.create_snapshot(self.test_dir)
+
+        entry = db.get_snapshot(4)["files"]["app.log"]
+        self.assertEqual(4, len(entry["chain"]))
+        self.assertLess(self.content_bytes(), 210 * 1024)
+
+        for snapshot_id, expected in enumerate(self.versions, start=1):
+            output = os.path.join(self.output_dir, str(snapshot_id))
+            self.assertTrue(db.restore_snapshot(snapshot_id, output))
+            with open(os.path.join(output, "app.log"), "rb") as f:
+                self.assertEqual(expected, f.read())
+
+    def test_restore_uses_base_cache(self):
+        db = self.database()
+        db.create_snapshot(self.test_dir)
+        self.grow()
+        db.create_snapshot(self.test_dir)
+
+        db = self.database()
+        with mock.patch.object(db.backend, "get", wraps=db.backend.get) as get:
+            db.restore_snapshot(2, os.path.join(self.output_dir, "a"))
+            db.restore_snapshot(2, os.path.join(self.output_dir, "b"))
+        content_reads = [c for c in get.call_args_list if c[0][0].startswith("content/")]
+        self.assertEqual(2, len(content_reads))
+
+    def test_max_depth_stores_full_copy(self):
+        db = self.database(max_depth=2)
+        db.create_snapshot(self.test_dir)
+        for _ in range(3):
+            self.grow()
+            db.create_snapshot(self.test_dir)
+
+        chains = [
+            db.get_snapshot(i)["files"]["app.log"] for i in range(1, 5)
+        ]
+        self.assertIsInstance(chains[0], str)
+        self.assertEqual([2, 3], [len(chains[1]["chain"]), len(chains[2]["chain"])])
+        self.assertIsInstance(chains[3], str)
+
+    def test_rewritten_file_stored_in_full(self):
+        db = self.database()
+        db.create_snapshot(self.test_dir)
+        self.write(random_bytes(self.rng, 200 * 1024))
+        db.create_snapshot(self.test_dir)
+
+        self.assertIsInstance(db.get_snapshot(2)["files"]["app.log"], str)
+
+    def test_unchanged_file_keeps_entry(self):
+        db = self.database()
+        db.create_snapshot(self.test_dir)
+        self.grow()
+        db.create_snapshot(self.test_dir)
+        db.create_snapshot(self.test_dir)
+
+        self.assertEqual(
+            db.get_snapshot(2)["files"]["app.log"], db.get_snapshot(3)["files"]["app.log"]
+        )
+
+    def test_prune_keeps_bases_of_remaining_versions(self):
+        db = self.database()
+        db.create_snapshot(self.test_dir)
+        self.grow()
+        db.create_snapshot(self.test_dir)
+
+        db.prune_snapshot(1)
+
+        db = self.database()
+        self.assertTrue(db.restore_snapshot(2, self.output_dir))
+        with open(os.path.join(self.output_dir, "app.log"), "rb") as f:
+            self.assertEqual(self.versions[1], f.read())
+
+    def test_repository_open_file_and_usage(self):
+        db = self.database()
+        db.create_snapshot(self.test_dir)
+        self.grow()
+        db.create_snapshot(self.test_dir)
+
+        with Repository(self.db_dir) as repo:
+            with repo.open_file(2, "app.log") as f:
+                self.assertEqual(self.versions[1], f.read())
+            usage = repo.db.space_usage()
+        self.assertGreater(usage["compression_ratio"], 1.5)
+
+    def test_disabled_by_default(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+        self.grow()
+        db.create_snapshot(self.test_dir)
+
+        self.assertIsInstance(db.get_snapshot(2)["files"]["app.log"], str)
+
+
+if __name__ == "__main__":
+    unittest.main()
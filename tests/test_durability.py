@@ -0,0 +1,141 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import storage
+from backuptool.core import BackupDatabase
+from backuptool.storage import LocalBackend
+
+
+class TestDurability(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        for i in range(5):
+            with open(os.path.join(self.test_dir, f"file{i}.txt"), "w") as f:
+                f.write(f"contents {i}")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def snapshot_events(self, durability):
+        """Snapshot the test directory, recording blob fsyncs and commits."""
+        db = BackupDatabase(self.db_dir, durability=durability)
+        events = []
+        real_put = db.backend.put
+        real_put_chunks = db.backend.put_chunks
+        real_sync = db.backend._sync
+
+        def put(key, data):
+            events.append(("put", key))
+            real_put(key, data)
+
+        def put_chunks(key, chunks):
+            events.append(("put", key))
+            real_put_chunks(key, chunks)
+
+        def sync():
+            events.append(("sync", None))
+            real_sync()
+
+        def fsync_file(path):
+            events.append(("fsync", path))
+
+        with mock.patch.object(db.backend, "put", put), \
+                mock.patch.object(db.backend, "put_chunks", put_chunks), \
+                mock.patch.object(db.backend, "_sync", sync), \
+                mock.patch.object(storage, "_fsync_file", fsync_file), \
+                mock.patch.object(storage, "_syncfs", return_value=False):
+            db.create_snapshot(self.test_dir)
+        return events
+
+    def test_batch_syncs_blobs_before_manifest(self):
+        events = self.snapshot_events("batch")
+
+        manifest = events.index(("put", "snapshots/1"))
+        fsyncs = [
+            i for i, (op, path) in enumerate(events)
+            if op == "fsync" and os.sep + "content" + os.sep in path
+        ]
+        self.assertEqual(5, len(fsyncs))
+        self.assertTrue(all(i < manifest for i in fsyncs))
+        # All blobs are flushed in one group commit right before the manifest.
+        sync = max(i for i, (op, _) in enumerate(events[:manifest]) if op == "sync")
+        self.assertTrue(all(i > sync for i in fsyncs))
+
+    def test_strict_syncs_every_blob_as_written(self):
+        events = self.snapshot_events("strict")
+
+        self.assertEqual(5, sum(1 for op, _ in events if op == "fsync"))
+        first_sync = next(i for i, (op, _) in enumerate(events) if op == "sync")
+        self.assertTrue(all(
+            i < first_sync for i, (op, _) in enumerate(events) if op == "fsync"
+        ))
+
+    def test_none_never_syncs_blobs(self):
+        events = self.snapshot_events("none")
+
+        self.assertFalse(any(op == "fsync" for op, _ in events))
+
+    def test_batch_uses_syncfs_for_large_batches(self):
+        backend = LocalBackend(self.db_dir)
+        source = os.path.join(self.test_dir, "file0.txt")
+        for i in range(backend.SYNCFS_THRESHOLD):
+            backend.put_file(f"content/{i:064x}", source)
+
+        with mock.patch.object(storage, "_syncfs", return_value=True) as syncfs, \
+                mock.patch.object(storage, "_fsync_file") as fsync_file:
+            backend.sync()
+            backend.sync()
+
+        syncfs.assert_called_once_with(backend.content_path)
+        fsync_file.assert_not_called()
+
+    def test_windows_fsync_opens_read_only_blob_for_writing(self):
+        blob = os.path.join(self.test_dir, "file0.txt")
+        os.chmod(blob, 0o444)
+        opened = []
+        real_open = os.open
+
+        def recording_open(path, flags, *args):
+            opened.append(flags)
+            return real_open(path, flags, *args)
+
+        with mock.patch.object(storage.os, "name", "nt"), \
+                mock.patch.object(storage.os, "open", side_effect=recording_open):
+            storage._fsync_file(blob)
+
+        self.assertEqual([os.O_RDWR], opened)
+        self.assertEqual(0o444, os.stat(blob).st_mode & 0o777)
+        os.chmod(blob, 0o644)
+
+    def test_durability_from_repository_config(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"durability": "strict"}, f)
+
+        self.assertEqual("strict", BackupDatabase(self.db_dir).backend.durability)
+        self.assertEqual(
+            "none", BackupDatabase(self.db_dir, durability="none").backend.durability
+        )
+
+    def test_unknown_durability_rejected(self):
+        with self.assertRaises(ValueError):
+            BackupDatabase(self.db_dir, durability="sometimes")
+
+    def test_snapshot_restores_in_every_mode(self):
+        for mode in ("none", "batch", "strict"):
+            db = BackupDatabase(self.db_dir, durability=mode)
+            snapshot_id = db.create_snapshot(self.test_dir)
+            output = os.path.join(self.db_dir, f"restore-{mode}")
+            self.assertTrue(db.restore_snapshot(snapshot_id, output))
+            with open(os.path.join(output, "file3.txt")) as f:
+                self.assertEqual("contents 3", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
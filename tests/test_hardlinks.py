@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+
+
+@unittest.skipUnless(hasattr(os, "link"), "hardlinks not supported")
+class TestHardlinks(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+
+        os.makedirs(os.path.join(self.test_dir, "a"))
+        os.makedirs(os.path.join(self.test_dir, "b"))
+        self.original = os.path.join(self.test_dir, "a", "data.bin")
+        with open(self.original, "wb") as f:
+            f.write(os.urandom(4096))
+        os.link(self.original, os.path.join(self.test_dir, "b", "data.bin"))
+        os.link(self.original, os.path.join(self.test_dir, "copy.bin"))
+
+        self.db = BackupDatabase(self.db_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_inode_hashed_once(self):
+        with mock.patch.object(
+            self.db, "_calculate_hash", wraps=self.db._calculate_hash
+        ) as calculate_hash:
+            snapshot_id = self.db.create_snapshot(self.test_dir)
+
+        self.assertEqual(1, calculate_hash.call_count)
+        snapshot = self.db.get_snapshot(snapshot_id)
+        self.assertEqual(3, len(snapshot["files"]))
+        self.assertEqual(1, len(snapshot["hardlinks"]))
+        self.assertEqual(3, len(snapshot["hardlinks"][0]))
+
+    def test_restore_recreates_links(self):
+        snapshot_id = self.db.create_snapshot(self.test_dir)
+
+        self.assertTrue(self.db.restore_snapshot(snapshot_id, self.output_dir))
+
+        paths = [
+            os.path.join(self.output_dir, "a", "data.bin"),
+            os.path.join(self.output_dir, "b", "data.bin"),
+            os.path.join(self.output_dir, "copy.bin"),
+        ]
+        inodes = {os.stat(path).st_ino for path in paths}
+        self.assertEqual(1, len(inodes))
+        self.assertEqual(3, os.stat(paths[0]).st_nlink)
+        with open(self.original, "rb") as f1, open(paths[2], "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_snapshot_without_hardlink_groups_restores(self):
+        snapshot_id = self.db.create_snapshot(self.test_dir)
+        snapshot = self.db.get_snapshot(snapshot_id)
+        del snapshot["hardlinks"]
+        self.db.get_snapshot = lambda _: snapshot
+
+        self.assertTrue(self.db.restore_snapshot(snapshot_id, self.output_dir))
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "copy.bin")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import hashlib
+
+from backuptool.core import BackupDatabase
+from backuptool.index import ContentIndex
+from backuptool.storage import LocalBackend
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestContentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.backend = LocalBackend(self.db_dir)
+        self.content_path = self.backend.content_path
+        self.index_path = os.path.join(self.db_dir, "content.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def add_blob(self, data):
+        file_hash = _hash(data)
+        with open(os.path.join(self.content_path, file_hash), "wb") as f:
+            f.write(data)
+        return file_hash
+
+    def test_rebuild_when_missing(self):
+        hashes = [self.add_blob(str(i).encode()) for i in range(10)]
+
+        index = ContentIndex(self.index_path, self.backend)
+        index.load()
+
+        self.assertTrue(os.path.exists(self.index_path))
+        self.assertEqual(10, len(index))
+        for file_hash in hashes:
+            self.assertIn(file_hash, index)
+        self.assertNotIn(_hash(b"absent"), index)
+
+    def test_appended_entries_survive_reload(self):
+        index = ContentIndex(self.index_path, self.backend)
+        index.load()
+
+        file_hash = self.add_blob(b"new blob")
+        index.add(file_hash)
+
+        reloaded = ContentIndex(self.index_path, self.backend)
+        reloaded.load()
+        self.assertIn(file_hash, reloaded)
+        self.assertEqual(1, len(reloaded))
+
+    def test_stale_index_is_rebuilt(self):
+        index = ContentIndex(self.index_path, self.backend)
+        index.load()
+
+        file_hash = self.add_blob(b"written behind the index's back")
+        os.utime(self.content_path, ns=(0, 12345))
+
+        reloaded = ContentIndex(self.index_path, self.backend)
+        reloaded.load()
+        self.assertIn(file_hash, reloaded)
+
+    def test_corrupt_index_is_rebuilt(self):
+        file_hash = self.add_blob(b"data")
+        with open(self.index_path, "wb") as f:
+            f.write(b"garbage")
+
+        index = ContentIndex(self.index_path, self.backend)
+        index.load()
+        self.assertIn(file_hash, index)
+
+    def test_compact_keeps_entries(self):
+        index = ContentIndex(self.index_path, self.backend)
+        index.load()
+        hashes = [self.add_blob(str(i).encode()) for i in range(5)]
+        for file_hash in hashes:
+            index.add(file_hash)
+
+        index.compact()
+
+        for file_hash in hashes:
+            self.assertIn(file_hash, index)
+
+
+class TestDatabaseIndexUsage(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "file1.txt"), "w") as f:
+            f.write("This is file 1")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_snapshot_updates_index(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+
+        reopened = BackupDatabase(self.db_dir)
+        for content_file in os.listdir(db.content_path):
+            self.assertIn(content_file, reopened.content_index)
+
+    def test_prune_removes_from_index(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+        file_hash = os.listdir(db.content_path)[0]
+
+        db.prune_snapshot(1)
+
+        self.assertNotIn(file_hash, db.content_index)
+
+    def test_confirm_index_hits_restores_missing_blob(self):
+        db = BackupDatabase(self.db_dir, confirm_index_hits=True)
+        db.create_snapshot(self.test_dir)
+        file_hash = os.listdir(db.content_path)[0]
+        os.remove(os.path.join(db.content_path, file_hash))
+
+        db.create_snapshot(self.test_dir)
+
+        self.assertTrue(os.path.exists(os.path.join(db.content_path, file_hash)))
+
+    def test_confirm_index_hits_from_repository_config(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"confirm_index_hits": True}, f)
+
+        self.assertTrue(BackupDatabase(self.db_dir).confirm_index_hits)
+        self.assertFalse(BackupDatabase(self.db_dir, confirm_index_hits=False).confirm_index_hits)
+
+
+if __name__ == "__main__":
+    unittest.main()
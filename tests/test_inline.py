@@ -0,0 +1,118 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+from backuptool.repository import Repository
+
+
+class TestInlineFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.write("empty", b"")
+        self.write("app.lock", b"4242\n")
+        self.write("conf/small.ini", b"[main]\nkey = \x00\xff binary\n")
+        self.write("large.bin", b"x" * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def write(self, rel_path, content):
+        path = os.path.join(self.test_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+    def read(self, root, rel_path):
+        with open(os.path.join(root, rel_path), "rb") as f:
+            return f.read()
+
+    def test_small_files_embedded_in_manifest(self):
+        db = BackupDatabase(self.db_dir, inline_threshold=256)
+        db.create_snapshot(self.test_dir)
+
+        files = db.get_snapshot(1)["files"]
+        self.assertEqual({"data": ""}, files["empty"])
+        self.assertIn("data", files["app.lock"])
+        self.assertIsInstance(files["large.bin"], str)
+        self.assertEqual(1, len(os.listdir(db.content_path)))
+
+        self.assertTrue(db.restore_snapshot(1, self.output_dir))
+        for rel_path in ("empty", "app.lock", os.path.join("conf", "small.ini"), "large.bin"):
+            self.assertEqual(
+                self.read(self.test_dir, rel_path), self.read(self.output_dir, rel_path)
+            )
+
+    def test_empty_file_needs_no_store_operations(self):
+        os.remove(os.path.join(self.test_dir, "app.lock"))
+        shutil.rmtree(os.path.join(self.test_dir, "conf"))
+        os.remove(os.path.join(self.test_dir, "large.bin"))
+        db = BackupDatabase(self.db_dir)
+        with mock.patch("builtins.open", wraps=open) as opened, \
+                mock.patch.object(db, "_has_content") as has_content:
+            db.create_snapshot(self.test_dir)
+        self.assertNotIn(
+            os.path.join(self.test_dir, "empty"), [c[0][0] for c in opened.call_args_list]
+        )
+        has_content.assert_not_called()
+        self.assertEqual([], os.listdir(db.content_path))
+
+        with mock.patch.object(db.backend, "get_file") as get_file, \
+                mock.patch.object(db.backend, "get_chunks") as get_chunks:
+            self.assertTrue(db.restore_snapshot(1, self.output_dir))
+        get_file.assert_not_called()
+        get_chunks.assert_not_called()
+        self.assertEqual(b"", self.read(self.output_dir, "empty"))
+
+    def test_file_grown_since_listing_stored_normally(self):
+        db = BackupDatabase(self.db_dir, inline_threshold=256)
+        large = os.path.join(self.test_dir, "large.bin")
+        with mock.patch.object(db, "_read_chunks") as read_chunks:
+            self.assertIsNone(db._inline_entry(large, 5))
+        read_chunks.assert_not_called()
+
+        entry = db._store_entry(large, None, 5)
+        self.assertIsInstance(entry, str)
+        db._restore_entry(entry, os.path.join(self.output_dir, "large.bin"))
+        self.assertEqual(b"x" * 1000, self.read(self.output_dir, "large.bin"))
+
+    def test_threshold_from_repository_config(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"inline_threshold": 8}, f)
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+
+        files = db.get_snapshot(1)["files"]
+        self.assertIn("data", files["app.lock"])
+        self.assertIsInstance(files[os.path.join("conf", "small.ini")], str)
+
+    def test_inline_files_ignored_by_prune_and_usage(self):
+        db = BackupDatabase(self.db_dir, inline_threshold=256)
+        db.create_snapshot(self.test_dir)
+        db.create_snapshot(self.test_dir)
+        self.assertEqual(1, db.space_usage()["blobs"])
+
+        db.prune_snapshot(1)
+        self.assertTrue(db.restore_snapshot(2, self.output_dir))
+        self.assertEqual(b"4242\n", self.read(self.output_dir, "app.lock"))
+
+    def test_repository_reads_inline_files(self):
+        BackupDatabase(self.db_dir, inline_threshold=256).create_snapshot(self.test_dir)
+
+        with Repository(self.db_dir, read_only=True) as repo:
+            with repo.open_file(1, "app.lock") as f:
+                self.assertEqual(b"4242\n", f.read())
+            with repo.open_file(1, "empty") as f:
+                self.assertEqual(b"", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
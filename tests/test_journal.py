@@ -0,0 +1,133 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from backuptool.core import BackupDatabase
+
+
+class TestMetadataJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "file1.txt"), "w") as f:
+            f.write("This is file 1")
+        self.journal_path = os.path.join(self.db_dir, "metadata.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def journal_lines(self):
+        with open(self.journal_path, "rb") as f:
+            return [line for line in f.read().split(b"\n") if line]
+
+    def test_snapshot_appends_instead_of_rewriting(self):
+        db = BackupDatabase(self.db_dir)
+        with open(db.metadata_path) as f:
+            checkpoint = f.read()
+
+        db.create_snapshot(self.test_dir)
+        db.create_snapshot(self.test_dir)
+        db.prune_snapshot(1)
+
+        with open(db.metadata_path) as f:
+            self.assertEqual(checkpoint, f.read())
+        ops = [json.loads(line)["op"] for line in self.journal_lines()]
+        self.assertEqual(["reserve", "add", "reserve", "add", "remove"], ops)
+
+    def test_state_is_rebuilt_on_load(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+        db.create_snapshot(self.test_dir)
+        db.prune_snapshot(1)
+
+        reopened = BackupDatabase(self.db_dir)
+
+        self.assertEqual([2], [s["id"] for s in reopened.list_snapshots()])
+        self.assertEqual(3, reopened.metadata["next_snapshot_id"])
+
+    def test_periodic_compaction(self):
+        db = BackupDatabase(self.db_dir, compact_every=4)
+        db.create_snapshot(self.test_dir)
+        db.create_snapshot(self.test_dir)
+
+        self.assertEqual(
+            [{"op": "checkpoint", "seq": 4}], [json.loads(line) for line in self.journal_lines()]
+        )
+        with open(db.metadata_path) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(2, len(checkpoint["snapshots"]))
+        self.assertEqual(4, checkpoint["journal_seq"])
+
+        db.create_snapshot(self.test_dir)
+        reopened = BackupDatabase(self.db_dir)
+        self.assertEqual([1, 2, 3], [s["id"] for s in reopened.list_snapshots()])
+
+    def test_records_already_in_checkpoint_are_skipped(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+        with open(self.journal_path, "rb") as f:
+            journal = f.read()
+        db.compact_metadata()
+        with open(self.journal_path, "wb") as f:
+            f.write(journal)
+
+        reopened = BackupDatabase(self.db_dir)
+
+        self.assertEqual(1, len(reopened.list_snapshots()))
+
+    def test_torn_record_is_ignored(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+        with open(self.journal_path, "ab") as f:
+            f.write(b'{"op":"add","snapsh')
+
+        reopened = BackupDatabase(self.db_dir)
+        self.assertEqual(1, len(reopened.list_snapshots()))
+
+        reopened.create_snapshot(self.test_dir)
+        self.assertEqual(
+            [1, 2], [s["id"] for s in BackupDatabase(self.db_dir).list_snapshots()]
+        )
+
+    def test_corrupt_checkpoint_is_recovered_from_manifests(self):
+        db = BackupDatabase(self.db_dir, compact_every=1)
+        db.create_snapshot(self.test_dir)
+        db.create_snapshot(self.test_dir)
+        with open(db.metadata_path, "w") as f:
+            f.write("{ torn")
+
+        reopened = BackupDatabase(self.db_dir)
+
+        self.assertEqual([1, 2], [s["id"] for s in reopened.list_snapshots()])
+        self.assertEqual(3, reopened.metadata["next_snapshot_id"])
+
+    def test_concurrent_writers_keep_each_others_records(self):
+        first = BackupDatabase(self.db_dir)
+        second = BackupDatabase(self.db_dir)
+
+        first.create_snapshot(self.test_dir)
+        second.create_snapshot(self.test_dir)
+        first.prune_snapshot(1)
+
+        seqs = [json.loads(line)["seq"] for line in self.journal_lines()]
+        self.assertEqual(sorted(set(seqs)), seqs)
+        self.assertEqual([2], [s["id"] for s in BackupDatabase(self.db_dir).list_snapshots()])
+
+    def test_writer_catches_up_after_compaction_by_another(self):
+        first = BackupDatabase(self.db_dir, compact_every=2)
+        second = BackupDatabase(self.db_dir, compact_every=100)
+
+        first.create_snapshot(self.test_dir)
+        second.create_snapshot(self.test_dir)
+
+        reopened = BackupDatabase(self.db_dir)
+        self.assertEqual([1, 2], [s["id"] for s in reopened.list_snapshots()])
+        self.assertEqual(3, reopened.metadata["next_snapshot_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+from backuptool.locality import order_batch, physical_offset
+
+
+class TestReadOrdering(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        for name in ["c.txt", "a.txt", "sub/b.txt", "sub/d.txt"]:
+            path = os.path.join(self.test_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"contents of {name}")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def batch(self):
+        items = []
+        for root, _, files in os.walk(self.test_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                items.append((path, os.path.relpath(path, self.test_dir), os.lstat(path)))
+        return items
+
+    def test_inode_order(self):
+        ordered = order_batch(self.batch(), "inode")
+
+        inodes = [st.st_ino for _, _, st in ordered]
+        self.assertEqual(sorted(inodes), inodes)
+
+    def test_extent_order_keeps_every_file(self):
+        batch = self.batch()
+
+        ordered = order_batch(batch, "extent")
+
+        self.assertEqual(sorted(batch), sorted(ordered))
+
+    def test_walk_order_is_unchanged(self):
+        batch = self.batch()
+
+        self.assertEqual(batch, order_batch(batch, "walk"))
+
+    def test_physical_offset_is_int_or_none(self):
+        offset = physical_offset(os.path.join(self.test_dir, "a.txt"))
+
+        self.assertTrue(offset is None or isinstance(offset, int))
+
+    def test_snapshot_reads_in_inode_order_and_sorts_manifest(self):
+        db = BackupDatabase(self.db_dir, read_order="inode")
+        with mock.patch.object(
+            db, "_calculate_hash", wraps=db._calculate_hash
+        ) as calculate_hash:
+            snapshot_id = db.create_snapshot(self.test_dir)
+
+        read_inodes = [os.stat(c.args[0]).st_ino for c in calculate_hash.call_args_list]
+        self.assertEqual(sorted(read_inodes), read_inodes)
+        files = list(db.get_snapshot(snapshot_id)["files"])
+        self.assertEqual(sorted(files), files)
+
+    def test_repository_default_and_validation(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            f.write('{"read_order": "extent"}')
+
+        self.assertEqual("extent", BackupDatabase(self.db_dir).read_order)
+        with self.assertRaises(ValueError):
+            BackupDatabase(self.db_dir, read_order="random")
+
+
+if __name__ == "__main__":
+    unittest.main()
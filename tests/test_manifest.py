@@ -0,0 +1,131 @@
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+from backuptool.core import BackupDatabase
+from backuptool.manifest import ManifestWriter, rewrite_manifest
+
+
+class TestManifestWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+        rng = random.Random(0)
+        self.files = {}
+        for i in range(2000):
+            path = "".join(rng.choice("ab/é\t\n") for _ in range(rng.randint(1, 12)))
+            self.files[path] = rng.choice([
+                f"{i:064x}",
+                {"hash": f"{i:064x}", "size": 10, "extents": [[0, 1], [4, 2]]},
+                {"hash": f"{i:064x}", "size": 10, "chain": ["a" * 64, "b" * 64]},
+            ])
+        self.header = {"id": 3, "timestamp": "2024-01-01T00:00:00", "target_dir": "/t"}
+        self.hardlinks = [["a", "b"], ["c", "d", "e"]]
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def expected(self):
+        snapshot = dict(self.header)
+        snapshot["files"] = dict(sorted(self.files.items()))
+        snapshot["hardlinks"] = self.hardlinks
+        return json.dumps(snapshot, indent=2).encode("utf-8")
+
+    def write(self, budget):
+        writer = ManifestWriter(budget, spill_dir=self.spill_dir)
+        for path, entry in self.files.items():
+            writer.add(path, entry)
+        try:
+            data = b"".join(writer.chunks(self.header, {"hardlinks": self.hardlinks}))
+        finally:
+            writer.close()
+        return writer, data
+
+    def test_in_memory_matches_json_dumps(self):
+        writer, data = self.write(1 << 30)
+        self.assertEqual(0, writer.spilled)
+        self.assertEqual(self.expected(), data)
+
+    def test_spilled_runs_merge_in_order(self):
+        writer, data = self.write(4096)
+        self.assertEqual(len(self.files), writer.count)
+        self.assertGreater(writer.spilled, len(self.files) // 2)
+        self.assertEqual(self.expected(), data)
+        self.assertEqual([], os.listdir(self.spill_dir))
+
+    def test_many_runs_are_merged_early(self):
+        writer = ManifestWriter(1, spill_dir=self.spill_dir)
+        for path, entry in self.files.items():
+            writer.add(path, entry)
+            self.assertLessEqual(len(writer._runs), 64)
+        try:
+            paths = [path for path, _ in writer.iter_files()]
+        finally:
+            writer.close()
+        self.assertEqual(sorted(self.files), paths)
+
+    def test_rewrite_replaces_fields_and_keeps_layout(self):
+        data = self.expected()
+        chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+
+        rewritten = b"".join(rewrite_manifest(chunks, {"id": 9, "hardlinks": []}))
+
+        self.header["id"] = 9
+        self.hardlinks = []
+        self.assertEqual(self.expected(), rewritten)
+
+    def test_empty(self):
+        writer = ManifestWriter()
+        data = b"".join(writer.chunks({"id": 1}, {"hardlinks": []}))
+        self.assertEqual({"id": 1, "files": {}, "hardlinks": []}, json.loads(data))
+
+
+class TestBoundedSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        for i in range(200):
+            subdir = os.path.join(self.test_dir, f"dir{i % 7}")
+            os.makedirs(subdir, exist_ok=True)
+            with open(os.path.join(subdir, f"file{i}.txt"), "w") as f:
+                f.write(f"contents {i}")
+        os.link(
+            os.path.join(self.test_dir, "dir0", "file0.txt"),
+            os.path.join(self.test_dir, "link.txt"),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def manifest(self, snapshot_id):
+        with open(os.path.join(self.db_dir, "snapshots", str(snapshot_id)), "rb") as f:
+            return json.loads(f.read())
+
+    def test_spilled_manifest_matches_in_memory(self):
+        BackupDatabase(self.db_dir).create_snapshot(self.test_dir)
+        db = BackupDatabase(self.db_dir, manifest_memory=2048)
+        with self.assertLogs("backuptool.core", "INFO") as logs:
+            db.create_snapshot(self.test_dir)
+
+        first, second = self.manifest(1), self.manifest(2)
+        self.assertEqual(first["files"], second["files"])
+        self.assertEqual(1, len(second["hardlinks"]))
+        self.assertEqual(first["hardlinks"], second["hardlinks"])
+        self.assertEqual(list(second["files"]), sorted(second["files"]))
+        summary = logs.output[-1]
+        self.assertIn("peak RSS", summary)
+        self.assertNotIn(" 0 manifest entries spilled", summary)
+
+    def test_budget_from_repository_config(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"manifest_memory": 4096}, f)
+        self.assertEqual(4096, BackupDatabase(self.db_dir).manifest_memory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import pagecache
+from backuptool.core import BackupDatabase
+from backuptool.pagecache import CacheDropper, drop_cache, resident_fraction
+
+SIZE = 32 * 1024 * 1024
+
+
+@unittest.skipUnless(pagecache.SUPPORTED, "posix_fadvise is not available")
+class TestPageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.large = os.path.join(self.test_dir, "large.bin")
+        with open(self.large, "wb") as f:
+            for i in range(SIZE // (1024 * 1024)):
+                f.write(bytes([i]) * (1024 * 1024))
+            os.fsync(f.fileno())
+        with open(os.path.join(self.test_dir, "small.txt"), "wb") as f:
+            f.write(b"small")
+        if resident_fraction(self.large) is None:
+            self.skipTest("mincore is not available")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def read_all(self, path):
+        with open(path, "rb") as f:
+            while f.read(1024 * 1024):
+                pass
+
+    def blob_paths(self):
+        content = os.path.join(self.db_dir, "content")
+        return [os.path.join(content, name) for name in os.listdir(content)]
+
+    def test_drop_cache(self):
+        self.read_all(self.large)
+        self.assertGreater(resident_fraction(self.large), 0.5)
+
+        drop_cache(self.large)
+
+        self.assertLess(resident_fraction(self.large), 0.1)
+
+    def test_dropper_drops_behind_reader(self):
+        with open(self.large, "rb") as f:
+            dropper = CacheDropper(f.fileno(), window=4 * 1024 * 1024)
+            while f.read(1024 * 1024):
+                dropper.advance(f.tell())
+            # Everything but the last window is already gone.
+            self.assertLess(resident_fraction(self.large), 0.25)
+            dropper.finish()
+        self.assertLess(resident_fraction(self.large), 0.1)
+
+    def test_snapshot_leaves_source_uncached(self):
+        self.read_all(self.large)
+        BackupDatabase(self.db_dir, drop_cache="always").create_snapshot(self.test_dir)
+
+        self.assertLess(resident_fraction(self.large), 0.1)
+
+    def test_snapshot_never_mode_keeps_cache(self):
+        self.read_all(self.large)
+        BackupDatabase(self.db_dir, drop_cache="never").create_snapshot(self.test_dir)
+
+        self.assertGreater(resident_fraction(self.large), 0.5)
+
+    def test_restore_leaves_blobs_uncached(self):
+        BackupDatabase(self.db_dir, drop_cache="never").create_snapshot(self.test_dir)
+        db = BackupDatabase(self.db_dir, drop_cache="auto")
+        for path in self.blob_paths():
+            self.read_all(path)
+
+        self.assertTrue(db.restore_snapshot(1, self.output_dir))
+
+        blob = max(self.blob_paths(), key=os.path.getsize)
+        self.assertLess(resident_fraction(blob), 0.1)
+        with open(os.path.join(self.output_dir, "large.bin"), "rb") as f:
+            self.assertEqual(bytes([31]) * 10, f.read()[-10:])
+
+    def test_auto_mode_skips_small_files(self):
+        db = BackupDatabase(self.db_dir)
+        self.assertEqual("auto", db.drop_cache)
+        with mock.patch("backuptool.core.drop_cache") as dropped:
+            db.create_snapshot(self.test_dir)
+        paths = [c[0][0] for c in dropped.call_args_list]
+        self.assertIn(self.large, paths)
+        self.assertNotIn(os.path.join(self.test_dir, "small.txt"), paths)
+
+    def test_mode_from_repository_config(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"drop_cache": "never"}, f)
+        self.assertEqual("never", BackupDatabase(self.db_dir).drop_cache)
+
+    def test_unknown_mode_rejected(self):
+        with self.assertRaises(ValueError):
+            BackupDatabase(self.db_dir, drop_cache="sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()
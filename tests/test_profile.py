@@ -0,0 +1,99 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import cli
+from backuptool.profile import generate_tree, profile_tree
+
+
+class TestProfileTree(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        for i in range(12):
+            self.write(os.path.join(f"secret_{i % 3}", f"payroll_{i}.txt"), b"x" * (100 + i))
+        self.write(os.path.join("secret_0", "deep", "copy_a.bin"), b"same" * 300)
+        self.write(os.path.join("secret_1", "copy_b.bin"), b"same" * 300)
+        self.write("empty.txt", b"")
+        os.link(
+            os.path.join(self.test_dir, "empty.txt"),
+            os.path.join(self.test_dir, "secret_2", "link.txt"),
+        )
+        os.symlink("empty.txt", os.path.join(self.test_dir, "symlink"))
+        with open(os.path.join(self.test_dir, "disk.img"), "wb") as f:
+            f.truncate(8 * 1024 * 1024)
+            f.write(b"header")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def write(self, rel_path, content):
+        path = os.path.join(self.test_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+    def test_profile_counts(self):
+        profile = profile_tree(self.test_dir)
+
+        self.assertEqual(4, profile["directories"])
+        self.assertEqual(16, profile["files"])
+        self.assertEqual({"1": 3, "2": 1}, profile["dir_depth"])
+        self.assertEqual({"0": 2, "1": 13, "2": 1}, profile["file_depth"])
+        self.assertEqual({"files": 1, "bytes": 1200}, profile["duplicates"])
+        self.assertEqual({"files": 1, "groups": 1}, profile["hardlinks"])
+        self.assertEqual(1, profile["symlinks"])
+        self.assertEqual(12, profile["sizes"]["64"]["files"])
+        self.assertEqual(1, profile["sizes"]["0"]["files"])
+        if profile["sparse"]["files"]:
+            self.assertEqual(8 * 1024 * 1024, profile["sparse"]["bytes"])
+
+    def test_profile_is_anonymized(self):
+        text = json.dumps(profile_tree(self.test_dir))
+        for word in ("secret", "payroll", "copy", "disk", self.test_dir):
+            self.assertNotIn(word, text)
+
+    def test_generated_tree_matches_profile(self):
+        profile = profile_tree(self.test_dir)
+        result = generate_tree(profile, self.output_dir, seed=1)
+
+        generated = profile_tree(self.output_dir)
+        self.assertEqual(profile["files"], generated["files"])
+        self.assertEqual(profile["directories"], generated["directories"])
+        self.assertEqual(profile["dir_depth"], generated["dir_depth"])
+        self.assertEqual(profile["file_depth"], generated["file_depth"])
+        self.assertEqual(profile["hardlinks"], generated["hardlinks"])
+        self.assertEqual(profile["symlinks"], generated["symlinks"])
+        self.assertEqual(result["duplicates"], generated["duplicates"]["files"])
+        self.assertEqual(profile["sparse"]["files"], result["sparse"])
+
+    def test_scale_and_seed(self):
+        profile = profile_tree(self.test_dir)
+        first = os.path.join(self.output_dir, "a")
+        second = os.path.join(self.output_dir, "b")
+
+        result = generate_tree(profile, first, scale=3, seed=7)
+        generate_tree(profile, second, scale=3, seed=7)
+
+        self.assertEqual(48, result["files"])
+        self.assertEqual(12, result["directories"])
+        self.assertEqual(profile_tree(first), profile_tree(second))
+
+    def test_cli_writes_profile(self):
+        output = os.path.join(self.output_dir, "profile.json")
+        with mock.patch("sys.argv", [
+            "backuptool", "profile-tree", "--target-directory", self.test_dir,
+            "--output", output,
+        ]):
+            self.assertEqual(0, cli.main())
+        with open(output) as f:
+            self.assertEqual(16, json.load(f)["files"])
+
+
+if __name__ == "__main__":
+    unittest.main()
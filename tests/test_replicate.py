@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import cli
+from backuptool.core import BackupDatabase
+from backuptool.replicate import copy_repository, copy_snapshots
+
+
+class TestCopySnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.source_dir = tempfile.mkdtemp()
+        self.dest_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        for i in range(10):
+            self.write(f"file{i}.txt", f"contents {i}")
+        self.source = BackupDatabase(self.source_dir)
+        self.source.create_snapshot(self.test_dir)
+        self.write("file0.txt", "changed")
+        self.write("extra.txt", "extra")
+        self.source.create_snapshot(self.test_dir)
+
+    def tearDown(self):
+        for path in (self.test_dir, self.source_dir, self.dest_dir, self.output_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def write(self, name, content):
+        with open(os.path.join(self.test_dir, name), "w") as f:
+            f.write(content)
+
+    def blobs(self, db_dir):
+        return set(os.listdir(os.path.join(db_dir, "content")))
+
+    def test_copy_all_and_restore(self):
+        result = copy_repository(self.source_dir, self.dest_dir)
+
+        self.assertEqual({1: 1, 2: 2}, result["snapshots"])
+        self.assertEqual(12, result["blobs"])
+        self.assertEqual(self.blobs(self.source_dir), self.blobs(self.dest_dir))
+
+        dest = BackupDatabase(self.dest_dir)
+        self.assertEqual([1, 2], [s["id"] for s in dest.list_snapshots()])
+        self.assertTrue(dest.restore_snapshot(2, self.output_dir))
+        with open(os.path.join(self.output_dir, "file0.txt")) as f:
+            self.assertEqual("changed", f.read())
+
+    def test_only_missing_blobs_transferred(self):
+        copy_repository(self.source_dir, self.dest_dir, [1])
+        result = copy_repository(self.source_dir, self.dest_dir, [2])
+
+        self.assertEqual(2, result["blobs"])
+        self.assertEqual({2: 2}, result["snapshots"])
+
+    def test_rerun_skips_copied_snapshots(self):
+        copy_repository(self.source_dir, self.dest_dir)
+        result = copy_repository(self.source_dir, self.dest_dir)
+
+        self.assertEqual(0, result["copied"])
+        self.assertEqual(2, result["skipped"])
+        self.assertEqual(0, result["blobs"])
+        self.assertEqual(2, len(BackupDatabase(self.dest_dir).list_snapshots()))
+
+    def test_ids_assigned_after_existing_snapshots(self):
+        BackupDatabase(self.dest_dir).create_snapshot(self.test_dir)
+
+        result = copy_repository(self.source_dir, self.dest_dir, [1])
+
+        self.assertEqual({1: 2}, result["snapshots"])
+        dest = BackupDatabase(self.dest_dir)
+        self.assertEqual(2, dest.get_snapshot(2)["id"])
+        self.assertEqual(1, dest.list_snapshots()[1]["origin"]["id"])
+
+    def test_interrupted_copy_resumes(self):
+        source = BackupDatabase(self.source_dir, read_only=True)
+        dest = BackupDatabase(self.dest_dir)
+        original = dest.backend.put_file
+        calls = []
+
+        def failing(key, file_path):
+            calls.append(key)
+            if len(calls) > 5:
+                raise IOError("connection lost")
+            original(key, file_path)
+
+        with mock.patch.object(dest.backend, "put_file", failing):
+            with self.assertRaises(IOError):
+                copy_snapshots(source, dest, workers=1)
+        self.assertEqual([], BackupDatabase(self.dest_dir).list_snapshots())
+        self.assertEqual([], os.listdir(os.path.join(self.dest_dir, "snapshots")))
+        self.assertEqual(5, len(self.blobs(self.dest_dir)))
+
+        result = copy_repository(self.source_dir, self.dest_dir)
+        self.assertEqual(7, result["blobs"])
+        self.assertEqual(2, result["copied"])
+
+    def test_delta_chains_copied(self):
+        log_path = os.path.join(self.test_dir, "app.log")
+        content = os.urandom(100 * 1024)
+        with open(log_path, "wb") as f:
+            f.write(content)
+        source = BackupDatabase(self.source_dir, delta={"enabled": True})
+        source.create_snapshot(self.test_dir)
+        with open(log_path, "ab") as f:
+            f.write(b"more\n" * 100)
+        snapshot_id = source.create_snapshot(self.test_dir)
+        self.assertIn("chain", source.get_snapshot(snapshot_id)["files"]["app.log"])
+
+        result = copy_repository(self.source_dir, self.dest_dir, [snapshot_id])
+
+        dest = BackupDatabase(self.dest_dir)
+        self.assertTrue(
+            dest.restore_snapshot(result["snapshots"][snapshot_id], self.output_dir)
+        )
+        with open(os.path.join(self.output_dir, "app.log"), "rb") as f:
+            self.assertEqual(content + b"more\n" * 100, f.read())
+
+    def test_manifests_streamed_not_loaded(self):
+        source = BackupDatabase(self.source_dir, read_only=True)
+        dest = BackupDatabase(self.dest_dir)
+        with mock.patch.object(source, "get_snapshot") as get_snapshot:
+            copy_snapshots(source, dest)
+        get_snapshot.assert_not_called()
+
+        for snapshot_id in (1, 2):
+            self.assertEqual(source.get_snapshot(snapshot_id), dest.get_snapshot(snapshot_id))
+
+    def test_unknown_snapshot(self):
+        with self.assertRaises(KeyError):
+            copy_repository(self.source_dir, self.dest_dir, [7])
+
+    def test_cli(self):
+        with mock.patch("sys.argv", [
+            "backuptool", "copy", "--from", self.source_dir, "--to", self.dest_dir,
+            "--snapshots", "2",
+        ]):
+            self.assertEqual(0, cli.main())
+        self.assertEqual(1, len(BackupDatabase(self.dest_dir).list_snapshots()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+from backuptool.manifest import iter_files, read_header
+from backuptool.repository import Repository
+
+
+class TestManifestStreaming(unittest.TestCase):
+
+    def test_iter_files_across_chunk_boundaries(self):
+        manifest = {
+            "id": 12345,
+            "timestamp": "2024-01-01T00:00:00",
+            "target_dir": '/data/"files"',
+            "files": {
+                f"dir/fïle{i}": "ab" * 32 if i % 2 else
+                {"hash": "cd" * 32, "size": 1048576, "extents": [[0, 4096]]}
+                for i in range(50)
+            },
+            "hardlinks": [],
+        }
+        data = json.dumps(manifest, indent=2).encode("utf-8")
+        for size in (1, 3, 64, len(data)):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(manifest["files"], dict(iter_files(chunks)))
+            self.assertEqual(
+                {"id": 12345, "timestamp": manifest["timestamp"],
+                 "target_dir": manifest["target_dir"]},
+                read_header(chunks),
+            )
+
+
+class TestRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.files = {
+            "a.txt": b"alpha",
+            "sub/b.txt": b"bravo" * 1000,
+            "sub/c.txt": b"charlie",
+        }
+        for rel_path, content in self.files.items():
+            path = os.path.join(self.test_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def test_context_manager_closes_backend(self):
+        repo = Repository(self.db_dir)
+        with mock.patch.object(repo.db.backend, "close") as close:
+            with repo:
+                pass
+        close.assert_called_once_with()
+
+    def test_metadata_loaded_once(self):
+        with mock.patch.object(
+            BackupDatabase, "_load_metadata", autospec=True,
+            side_effect=BackupDatabase._load_metadata,
+        ) as load:
+            with Repository(self.db_dir) as repo:
+                repo.create_snapshot(self.test_dir)
+                repo.create_snapshot(self.test_dir)
+                self.assertEqual(2, len(repo.list_snapshots()))
+        self.assertEqual(1, load.call_count)
+
+    def test_iter_snapshots_filter(self):
+        other_dir = tempfile.mkdtemp()
+        try:
+            with Repository(self.db_dir) as repo:
+                repo.create_snapshot(self.test_dir)
+                repo.create_snapshot(other_dir)
+                matched = list(repo.iter_snapshots(
+                    lambda s: s["target_dir"] == os.path.abspath(other_dir)
+                ))
+        finally:
+            shutil.rmtree(other_dir, ignore_errors=True)
+
+        self.assertEqual([2], [s["id"] for s in matched])
+
+    def test_iter_entries_streams_manifest(self):
+        with Repository(self.db_dir) as repo:
+            snapshot_id = repo.create_snapshot(self.test_dir)
+            with mock.patch.object(repo.db, "get_snapshot") as get_snapshot:
+                entries = dict(repo.iter_entries(snapshot_id))
+                sub = [path for path, _ in repo.iter_entries(snapshot_id, prefix="sub")]
+            get_snapshot.assert_not_called()
+
+        self.assertEqual(
+            sorted(os.path.normpath(p) for p in self.files), sorted(entries)
+        )
+        self.assertEqual(2, len(sub))
+
+    def test_iter_entries_missing_snapshot(self):
+        with Repository(self.db_dir) as repo:
+            with self.assertRaises(FileNotFoundError):
+                list(repo.iter_entries(42))
+
+    def test_get_snapshot_cached(self):
+        with Repository(self.db_dir) as repo:
+            snapshot_id = repo.create_snapshot(self.test_dir)
+            first = repo.get_snapshot(snapshot_id)
+            with mock.patch.object(repo.db, "get_snapshot") as get_snapshot:
+                self.assertIs(first, repo.get_snapshot(snapshot_id))
+            get_snapshot.assert_not_called()
+
+    def test_open_file(self):
+        with Repository(self.db_dir) as repo:
+            snapshot_id = repo.create_snapshot(self.test_dir)
+            with repo.open_file(snapshot_id, "sub/b.txt") as f:
+                self.assertEqual(b"bravo", f.read(5))
+                self.assertEqual(self.files["sub/b.txt"][5:], f.read())
+            with self.assertRaises(FileNotFoundError):
+                repo.open_file(snapshot_id, "missing.txt")
+
+    @unittest.skipUnless(hasattr(os, "SEEK_DATA"), "SEEK_DATA not supported")
+    def test_open_sparse_file(self):
+        path = os.path.join(self.test_dir, "sparse.bin")
+        with open(path, "wb") as f:
+            f.seek(1024 * 1024)
+            f.write(b"tail")
+            f.truncate(2 * 1024 * 1024)
+        with open(path, "rb") as f:
+            expected = f.read()
+
+        with Repository(self.db_dir) as repo:
+            snapshot_id = repo.create_snapshot(self.test_dir)
+            with repo.open_file(snapshot_id, "sparse.bin") as f:
+                self.assertEqual(expected, f.read())
+
+    def test_refresh_sees_other_writers(self):
+        with Repository(self.db_dir, read_only=True) as reader:
+            self.assertEqual([], reader.list_snapshots())
+            BackupDatabase(self.db_dir).create_snapshot(self.test_dir)
+            reader.refresh()
+            self.assertEqual(1, len(reader.list_snapshots()))
+
+    def test_refresh_after_prune_by_other_process(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, True)
+        with Repository(self.db_dir) as repo:
+            repo.create_snapshot(self.test_dir)
+            BackupDatabase(self.db_dir).prune_snapshot(1)
+
+            repo.refresh()
+            snapshot_id = repo.create_snapshot(self.test_dir)
+
+            self.assertEqual(3, len(os.listdir(os.path.join(self.db_dir, "content"))))
+            self.assertTrue(repo.restore_snapshot(snapshot_id, output_dir))
+            with open(os.path.join(output_dir, "sub", "b.txt"), "rb") as f:
+                self.assertEqual(self.files["sub/b.txt"], f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
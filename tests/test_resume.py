@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+from backuptool.s3 import S3Backend
+from backuptool.s3server import LocalS3Server
+
+
+class Interrupted(BaseException):
+    pass
+
+
+class Interrupting:
+
+    def make_test_files(self):
+        self.test_dir = tempfile.mkdtemp()
+        for i in range(10):
+            with open(os.path.join(self.test_dir, f"file{i}.txt"), "w") as f:
+                f.write(f"This is file {i}")
+
+    def interrupt_after(self, db, count, resume=False):
+        store_entry = db._store_entry
+        calls = []
+
+        def failing(file_path, *args):
+            if len(calls) == count:
+                raise Interrupted()
+            calls.append(file_path)
+            return store_entry(file_path, *args)
+
+        with mock.patch.object(db, "_store_entry", side_effect=failing):
+            with self.assertRaises(Interrupted):
+                db.create_snapshot(self.test_dir, resume=resume)
+
+
+class TestResumableSnapshots(Interrupting, unittest.TestCase):
+
+    def setUp(self):
+        self.make_test_files()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_resume_skips_processed_files(self):
+        db = BackupDatabase(self.db_dir, checkpoint_every=1)
+        self.interrupt_after(db, 4)
+        self.assertTrue(os.path.exists(os.path.join(db.snapshots_path, "1.partial")))
+
+        db = BackupDatabase(self.db_dir)
+        with mock.patch.object(
+            db, "_calculate_hash", wraps=db._calculate_hash
+        ) as calculate_hash:
+            snapshot_id = db.create_snapshot(self.test_dir, resume=True)
+
+        self.assertEqual(1, snapshot_id)
+        self.assertEqual(6, calculate_hash.call_count)
+        self.assertEqual(10, len(db.get_snapshot(1)["files"]))
+        self.assertEqual(10, db.list_snapshots()[0]["file_count"])
+        self.assertFalse(os.path.exists(os.path.join(db.snapshots_path, "1.partial")))
+
+        self.assertTrue(db.restore_snapshot(1, self.output_dir))
+        self.assertEqual(10, len(os.listdir(self.output_dir)))
+
+    def test_new_snapshot_discards_older_partial(self):
+        db = BackupDatabase(self.db_dir, checkpoint_every=1)
+        self.interrupt_after(db, 4)
+        other_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_dir, True)
+        with open(os.path.join(other_dir, "other.txt"), "w") as f:
+            f.write("other")
+        db = BackupDatabase(self.db_dir, checkpoint_every=1)
+        with mock.patch.object(db, "_store_entry", side_effect=Interrupted()):
+            with self.assertRaises(Interrupted):
+                db.create_snapshot(other_dir)
+
+        db = BackupDatabase(self.db_dir)
+        snapshot_id = db.create_snapshot(self.test_dir)
+
+        self.assertEqual(3, snapshot_id)
+        self.assertFalse(os.path.exists(os.path.join(db.snapshots_path, "1.partial")))
+        # Partials of other directories stay resumable.
+        self.assertTrue(os.path.exists(os.path.join(db.snapshots_path, "2.partial")))
+        os.remove(os.path.join(db.snapshots_path, "2.partial"))
+        db.prune_snapshot(snapshot_id)
+        self.assertEqual([], os.listdir(db.content_path))
+
+    def test_resume_without_partial_starts_fresh(self):
+        db = BackupDatabase(self.db_dir)
+
+        snapshot_id = db.create_snapshot(self.test_dir, resume=True)
+
+        self.assertEqual(1, snapshot_id)
+        self.assertEqual(10, len(db.get_snapshot(1)["files"]))
+
+    def test_interrupted_id_is_not_reused(self):
+        db = BackupDatabase(self.db_dir, checkpoint_every=1)
+        self.interrupt_after(db, 2)
+
+        db = BackupDatabase(self.db_dir)
+        self.assertEqual(2, db.create_snapshot(self.test_dir))
+        # The committed snapshot superseded the partial one.
+        self.assertEqual(3, db.create_snapshot(self.test_dir, resume=True))
+
+    def test_prune_keeps_blobs_of_interrupted_snapshot(self):
+        db = BackupDatabase(self.db_dir)
+        db.create_snapshot(self.test_dir)
+        db.checkpoint_every = 1
+        with open(os.path.join(self.test_dir, "new.txt"), "w") as f:
+            f.write("only in the interrupted snapshot")
+        put_chunks = db.backend.put_chunks
+
+        def crash_before_manifest(key, chunks):
+            if key == "snapshots/2":
+                raise Interrupted()
+            return put_chunks(key, chunks)
+
+        with mock.patch.object(db.backend, "put_chunks", side_effect=crash_before_manifest):
+            with self.assertRaises(Interrupted):
+                db.create_snapshot(self.test_dir)
+
+        db.prune_snapshot(1)
+
+        self.assertEqual(11, len(os.listdir(db.content_path)))
+
+
+class TestResumableSnapshotsOnS3(Interrupting, unittest.TestCase):
+
+    def setUp(self):
+        self.make_test_files()
+        self.server_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.server = LocalS3Server(self.server_dir).start()
+        self.backend = S3Backend(self.server.url, "bucket", "repo", cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.stop()
+        for path in (self.test_dir, self.server_dir, self.cache_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_checkpoints_written_as_parts(self):
+        db = BackupDatabase(backend=self.backend, checkpoint_every=1)
+        self.interrupt_after(db, 4)
+
+        parts = self.backend.list("snapshots/1.partial/")
+        self.assertEqual(5, len(parts))
+        self.assertFalse(self.backend.exists("snapshots/1.partial"))
+        # Each batch is its own object; earlier ones are never rewritten.
+        self.assertEqual(1, len(self.backend.get("snapshots/1.partial/4").splitlines()))
+
+        self.interrupt_after(db, 2, resume=True)
+        self.assertEqual(7, len(self.backend.list("snapshots/1.partial/")))
+
+        with mock.patch.object(
+            db, "_calculate_hash", wraps=db._calculate_hash
+        ) as calculate_hash:
+            self.assertEqual(1, db.create_snapshot(self.test_dir, resume=True))
+        self.assertEqual(4, calculate_hash.call_count)
+        self.assertEqual(10, len(db.get_snapshot(1)["files"]))
+        self.assertEqual([], self.backend.list("snapshots/1.partial/"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from backuptool.core import BackupDatabase
+from backuptool.sparse import data_extents
+
+
+def _make_sparse(path, size, chunks):
+    with open(path, "wb") as f:
+        f.truncate(size)
+        for offset, data in chunks:
+            f.seek(offset)
+            f.write(data)
+
+
+@unittest.skipUnless(hasattr(os, "SEEK_DATA"), "SEEK_DATA not supported")
+class TestSparseFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+
+        self.sparse_path = os.path.join(self.test_dir, "disk.img")
+        self.size = 64 * 1024 * 1024
+        self.chunks = [(0, b"header" * 100), (32 * 1024 * 1024, b"middle" * 1000)]
+        _make_sparse(self.sparse_path, self.size, self.chunks)
+        if data_extents(self.sparse_path) is None:
+            self.skipTest("filesystem does not report holes")
+
+        self.db = BackupDatabase(self.db_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_data_extents_cover_written_ranges(self):
+        extents = data_extents(self.sparse_path)
+
+        covered = sum(length for _, length in extents)
+        self.assertLess(covered, self.size // 4)
+        for offset, data in self.chunks:
+            self.assertTrue(
+                any(start <= offset and offset + len(data) <= start + length
+                    for start, length in extents)
+            )
+
+    def test_dense_file_has_no_extents(self):
+        dense_path = os.path.join(self.test_dir, "dense.txt")
+        with open(dense_path, "w") as f:
+            f.write("no holes here")
+
+        self.assertIsNone(data_extents(dense_path))
+
+    def test_snapshot_stores_only_data(self):
+        snapshot_id = self.db.create_snapshot(self.test_dir)
+
+        entry = self.db.get_snapshot(snapshot_id)["files"]["disk.img"]
+        self.assertEqual(self.size, entry["size"])
+        blob = os.path.join(self.db.content_path, entry["hash"])
+        self.assertEqual(sum(length for _, length in entry["extents"]),
+                         os.path.getsize(blob))
+        self.assertEqual(self.size, self.db.list_snapshots()[0]["total_size"])
+
+    def test_restore_recreates_sparse_file(self):
+        snapshot_id = self.db.create_snapshot(self.test_dir)
+
+        self.assertTrue(self.db.restore_snapshot(snapshot_id, self.output_dir))
+
+        restored = os.path.join(self.output_dir, "disk.img")
+        self.assertEqual(self.size, os.path.getsize(restored))
+        self.assertLess(os.stat(restored).st_blocks * 512, self.size // 4)
+        with open(self.sparse_path, "rb") as f1, open(restored, "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_prune_keeps_sparse_blob_in_use(self):
+        self.db.create_snapshot(self.test_dir)
+        self.db.create_snapshot(self.test_dir)
+
+        self.db.prune_snapshot(1)
+
+        entry = self.db.get_snapshot(2)["files"]["disk.img"]
+        self.assertTrue(
+            os.path.exists(os.path.join(self.db.content_path, entry["hash"]))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
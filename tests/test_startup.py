@@ -0,0 +1,129 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from backuptool.core import BackupDatabase, list_snapshots
+from backuptool.s3 import S3Backend
+from backuptool.s3server import LocalS3Server
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_cli_import_skips_heavy_modules(self):
+        code = (
+            "import sys, backuptool.cli; "
+            "heavy = ['tabulate', 'http.client', 'xml.etree.ElementTree', "
+            "'concurrent.futures', 'pathlib']; "
+            "print(','.join(m for m in heavy if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            env=dict(os.environ, PYTHONPATH=ROOT),
+        )
+
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertEqual("", result.stdout.strip())
+
+
+class TestReadOnlyOpen(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "file1.txt"), "w") as f:
+            f.write("This is file 1")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def snapshot_tree(self):
+        state = {}
+        for root, dirs, files in os.walk(self.db_dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                state[path] = os.stat(path).st_mtime_ns
+        return state
+
+    def test_missing_repository_is_not_created(self):
+        missing = os.path.join(self.db_dir, "missing")
+
+        self.assertEqual([], list_snapshots(missing))
+        self.assertFalse(os.path.exists(missing))
+
+    def test_list_does_not_write(self):
+        BackupDatabase(self.db_dir).create_snapshot(self.test_dir)
+        os.remove(os.path.join(self.db_dir, "content.idx"))
+        before = self.snapshot_tree()
+
+        snapshots = list_snapshots(self.db_dir)
+
+        self.assertEqual(1, len(snapshots))
+        self.assertEqual(before, self.snapshot_tree())
+
+    def test_read_only_rejects_writes(self):
+        db = BackupDatabase(self.db_dir, read_only=True)
+
+        with self.assertRaises(PermissionError):
+            db.create_snapshot(self.test_dir)
+        self.assertEqual([], os.listdir(self.db_dir))
+
+    def test_read_only_restore(self):
+        BackupDatabase(self.db_dir).create_snapshot(self.test_dir)
+        output_dir = os.path.join(self.test_dir, "out")
+
+        db = BackupDatabase(self.db_dir, read_only=True)
+
+        self.assertTrue(db.restore_snapshot(1, output_dir))
+        self.assertTrue(os.path.exists(os.path.join(output_dir, "file1.txt")))
+
+
+class TestReadOnlyS3Open(unittest.TestCase):
+
+    def setUp(self):
+        self.server_dir = tempfile.mkdtemp()
+        self.work_dir = tempfile.mkdtemp()
+        self.server = LocalS3Server(self.server_dir).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.server_dir, ignore_errors=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def backend(self, cache, read_only=False):
+        return S3Backend(
+            self.server.url, "bucket", "repo",
+            cache_dir=os.path.join(self.work_dir, cache), read_only=read_only,
+        )
+
+    def test_chunked_restore_on_fresh_host(self):
+        data = os.urandom(200 * 1024)
+        writer = self.backend("writer")
+        try:
+            db = BackupDatabase(backend=writer, stream_chunk_size=64 * 1024)
+            db.create_stream_snapshot(io.BytesIO(data), "dump.sql")
+            self.assertIn("chunks", db.get_snapshot(1)["files"]["dump.sql"])
+        finally:
+            writer.close()
+
+        reader = self.backend("reader", read_only=True)
+        output_dir = os.path.join(self.work_dir, "out")
+        try:
+            self.assertFalse(os.path.exists(reader.cache_dir))
+            self.assertTrue(BackupDatabase(backend=reader).restore_snapshot(1, output_dir))
+        finally:
+            reader.close()
+        with open(os.path.join(output_dir, "dump.sql"), "rb") as f:
+            self.assertEqual(data, f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
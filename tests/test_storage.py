@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+
+from backuptool.core import BackupDatabase
+from backuptool.s3 import S3Backend
+from backuptool.s3server import LocalS3Server
+from backuptool.storage import LocalBackend, open_backend
+
+
+class BackendContract:
+
+    def test_put_get_exists_delete(self):
+        self.backend.put("snapshots/1", b"manifest")
+
+        self.assertTrue(self.backend.exists("snapshots/1"))
+        self.assertEqual(b"manifest", self.backend.get("snapshots/1"))
+
+        self.backend.delete("snapshots/1")
+
+        self.assertFalse(self.backend.exists("snapshots/1"))
+        with self.assertRaises(FileNotFoundError):
+            self.backend.get("snapshots/1")
+
+    def test_size(self):
+        self.backend.put("content/abc", b"x" * 1234)
+
+        self.assertEqual(1234, self.backend.size("content/abc"))
+        with self.assertRaises(FileNotFoundError):
+            self.backend.size("content/missing")
+
+    def test_put_file_and_get_file(self):
+        source = os.path.join(self.work_dir, "source.bin")
+        target = os.path.join(self.work_dir, "target.bin")
+        data = os.urandom(300 * 1024)
+        with open(source, "wb") as f:
+            f.write(data)
+
+        self.backend.put_file("content/abc", source)
+        self.backend.get_file("content/abc", target)
+
+        with open(target, "rb") as f:
+            self.assertEqual(data, f.read())
+
+    def test_list_and_batches(self):
+        self.backend.put_many({f"content/{i:02d}": str(i).encode() for i in range(12)})
+        self.backend.put("metadata.json", b"{}")
+
+        keys = self.backend.list("content/")
+        self.assertEqual([f"content/{i:02d}" for i in range(12)], keys)
+
+        wanted = ["content/03", "content/07", "content/99"]
+        self.assertEqual({"content/03", "content/07"}, self.backend.exists_many(wanted))
+        self.assertEqual(
+            {"content/03": b"3"}, self.backend.get_many(["content/03", "content/99"])
+        )
+
+        self.assertEqual({}, self.backend.delete_many(keys[:6]))
+        self.assertEqual(keys[6:], self.backend.list("content/"))
+
+    def test_stats_record_operations(self):
+        self.backend.put("metadata.json", b"{}")
+        self.backend.get("metadata.json")
+
+        self.assertEqual(1, self.backend.stats["put"][0])
+        self.assertEqual(1, self.backend.stats["get"][0])
+
+
+class TestLocalBackend(BackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.work_dir = tempfile.mkdtemp()
+        self.backend = LocalBackend(self.db_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_lock_excludes_other_holders(self):
+        other = LocalBackend(self.db_dir)
+        acquired = threading.Event()
+
+        def hold():
+            with other.lock("metadata"):
+                acquired.set()
+
+        with self.backend.lock("metadata"):
+            thread = threading.Thread(target=hold)
+            thread.start()
+            self.assertFalse(acquired.wait(0.2))
+        thread.join(5)
+        self.assertTrue(acquired.is_set())
+
+
+class TestS3Backend(BackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.server_dir = tempfile.mkdtemp()
+        self.work_dir = tempfile.mkdtemp()
+        self.server = LocalS3Server(self.server_dir, max_keys=5).start()
+        self.backend = S3Backend(
+            self.server.url,
+            "bucket",
+            "repo",
+            multipart_threshold=128 * 1024,
+            part_size=64 * 1024,
+            list_threshold=4,
+            cache_dir=os.path.join(self.work_dir, "cache"),
+        )
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.stop()
+        shutil.rmtree(self.server_dir, ignore_errors=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_large_file_uses_multipart_upload(self):
+        source = os.path.join(self.work_dir, "large.bin")
+        with open(source, "wb") as f:
+            f.write(os.urandom(300 * 1024))
+
+        self.backend.put_file("content/large", source)
+
+        self.assertEqual(5, self.server.request_counts["PUT"])
+        self.assertEqual(2, self.server.request_counts["POST"])
+
+    def test_large_existence_batch_uses_listing(self):
+        self.backend.put_many({f"content/{i}": b"x" for i in range(3)})
+        self.server.request_counts.clear()
+
+        found = self.backend.exists_many(f"content/{i}" for i in range(10))
+
+        self.assertEqual({"content/0", "content/1", "content/2"}, found)
+        self.assertEqual(0, self.server.request_counts["HEAD"])
+        self.assertEqual(1, self.server.request_counts["GET"])
+
+    def test_connections_are_reused(self):
+        for i in range(5):
+            self.backend.put(f"content/{i}", b"x")
+
+        self.assertEqual(1, self.backend._pool._idle.qsize())
+
+    def test_open_backend_from_url(self):
+        backend = open_backend(
+            f"{self.server.url}/bucket/other",
+            cache_dir=os.path.join(self.work_dir, "cache2"),
+        )
+        try:
+            self.assertIsInstance(backend, S3Backend)
+            self.assertEqual("bucket", backend.bucket)
+            self.assertEqual("other", backend.prefix)
+        finally:
+            backend.close()
+
+    def test_database_round_trip(self):
+        source_dir = os.path.join(self.work_dir, "source")
+        output_dir = os.path.join(self.work_dir, "output")
+        os.makedirs(os.path.join(source_dir, "subdir"))
+        with open(os.path.join(source_dir, "file1.txt"), "w") as f:
+            f.write("This is file 1")
+        with open(os.path.join(source_dir, "subdir", "file2.txt"), "w") as f:
+            f.write("This is file 1")
+
+        db = BackupDatabase(backend=self.backend)
+        snapshot_id = db.create_snapshot(source_dir)
+        self.assertEqual(1, len(self.backend.list("content/")))
+
+        self.assertTrue(db.restore_snapshot(snapshot_id, output_dir))
+        with open(os.path.join(output_dir, "subdir", "file2.txt")) as f:
+            self.assertEqual("This is file 1", f.read())
+
+        self.assertTrue(db.prune_snapshot(snapshot_id))
+        self.assertEqual([], self.backend.list("content/"))
+        self.assertEqual([], BackupDatabase(backend=self.backend).list_snapshots())
+
+    def test_prune_on_other_host_invalidates_index(self):
+        source_dir = os.path.join(self.work_dir, "source")
+        output_dir = os.path.join(self.work_dir, "output")
+        os.makedirs(source_dir)
+        with open(os.path.join(source_dir, "file.txt"), "w") as f:
+            f.write("contents")
+        BackupDatabase(backend=self.backend).create_snapshot(source_dir)
+        stamp = self.backend.content_stamp()
+
+        other = S3Backend(
+            self.server.url, "bucket", "repo",
+            cache_dir=os.path.join(self.work_dir, "other-cache"),
+        )
+        try:
+            self.assertTrue(BackupDatabase(backend=other).prune_snapshot(1))
+        finally:
+            other.close()
+        self.assertNotEqual(stamp, self.backend.content_stamp())
+
+        db = BackupDatabase(backend=self.backend)
+        snapshot_id = db.create_snapshot(source_dir)
+        self.assertEqual(1, len(self.backend.list("content/")))
+        self.assertTrue(db.restore_snapshot(snapshot_id, output_dir))
+
+    def test_storing_content_keeps_stamp(self):
+        stamp = self.backend.content_stamp()
+        self.backend.put("content/a", b"x")
+        self.assertEqual(stamp, self.backend.content_stamp())
+        self.backend.delete_many(["content/a"])
+        self.assertNotEqual(stamp, self.backend.content_stamp())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import cli
+from backuptool.core import BackupDatabase
+
+CHUNK = 64 * 1024
+
+
+class PipeStream:
+    """Returns at most ``pipe_size`` bytes per read, like a pipe."""
+
+    def __init__(self, data, pipe_size=10000):
+        self.data = data
+        self.pos = 0
+        self.pipe_size = pipe_size
+        self.largest_read = 0
+
+    def read(self, size=-1):
+        self.largest_read = max(self.largest_read, size)
+        end = self.pos + min(size, self.pipe_size)
+        data = self.data[self.pos:end]
+        self.pos = end
+        return data
+
+
+class TestStreamSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        rng = random.Random(0)
+        self.dump = rng.getrandbits(8 * 10 * CHUNK).to_bytes(10 * CHUNK, "little") + b"tail"
+        self.db = BackupDatabase(self.db_dir, stream_chunk_size=CHUNK)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def content_files(self):
+        return len(os.listdir(os.path.join(self.db_dir, "content")))
+
+    def test_stream_stored_in_chunks(self):
+        stream = PipeStream(self.dump)
+        snapshot_id = self.db.create_stream_snapshot(stream, "dump.sql")
+
+        self.assertLessEqual(stream.largest_read, CHUNK)
+        entry = self.db.get_snapshot(snapshot_id)["files"]["dump.sql"]
+        self.assertEqual(11, len(entry["chunks"]))
+        self.assertEqual(len(self.dump), entry["size"])
+        summary = self.db.list_snapshots()[0]
+        self.assertEqual("stdin:dump.sql", summary["target_dir"])
+        self.assertEqual(len(self.dump), summary["total_size"])
+
+        self.assertTrue(self.db.restore_snapshot(snapshot_id, self.output_dir))
+        with open(os.path.join(self.output_dir, "dump.sql"), "rb") as f:
+            self.assertEqual(self.dump, f.read())
+
+    def test_unchanged_prefix_deduplicated(self):
+        self.db.create_stream_snapshot(PipeStream(self.dump), "dump.sql")
+        self.assertEqual(11, self.content_files())
+
+        changed = self.dump[:8 * CHUNK] + b"new rows" * 1000
+        self.db.create_stream_snapshot(PipeStream(changed), "dump.sql")
+
+        self.assertEqual(12, self.content_files())
+
+    def test_prune_keeps_shared_chunks(self):
+        self.db.create_stream_snapshot(PipeStream(self.dump), "dump.sql")
+        second = self.db.create_stream_snapshot(PipeStream(self.dump[:5 * CHUNK]), "dump.sql")
+
+        self.db.prune_snapshot(1)
+
+        self.assertEqual(5, self.content_files())
+        self.assertTrue(self.db.restore_snapshot(second, self.output_dir))
+
+    def test_empty_stream(self):
+        snapshot_id = self.db.create_stream_snapshot(io.BytesIO(b""), "empty")
+
+        self.assertEqual(0, self.content_files())
+        self.assertTrue(self.db.restore_snapshot(snapshot_id, self.output_dir))
+        self.assertEqual(0, os.path.getsize(os.path.join(self.output_dir, "empty")))
+
+    def test_invalid_names_rejected(self):
+        for name in ("", "/etc/passwd", "../outside"):
+            with self.assertRaises(ValueError):
+                self.db.create_stream_snapshot(io.BytesIO(b"x"), name)
+
+    def test_cli_stdin_and_stdout(self):
+        stdin = io.TextIOWrapper(io.BytesIO(self.dump))
+        with mock.patch("sys.argv", [
+            "backuptool", "snapshot", "--stdin", "--name", "dump.sql",
+            "--db-path", self.db_dir,
+        ]), mock.patch("sys.stdin", stdin):
+            self.assertEqual(0, cli.main())
+
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with mock.patch("sys.argv", [
+            "backuptool", "restore", "--snapshot-number", "1", "--stdout",
+            "--db-path", self.db_dir,
+        ]), mock.patch("sys.stdout", stdout):
+            self.assertEqual(0, cli.main())
+        self.assertEqual(self.dump, stdout.buffer.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
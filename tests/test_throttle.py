@@ -0,0 +1,123 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool import throttle as throttle_module
+from backuptool.core import BackupDatabase
+from backuptool.throttle import Throttle, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_waits_once_burst_is_spent(self):
+        bucket = TokenBucket(1000)
+        with mock.patch.object(throttle_module.time, "sleep") as sleep:
+            self.assertEqual(0.0, bucket.consume(1000))
+            wait = bucket.consume(500)
+
+        self.assertAlmostEqual(0.5, wait, delta=0.05)
+        sleep.assert_called_once()
+
+    def test_set_rate(self):
+        bucket = TokenBucket(100)
+        bucket.set_rate(400)
+
+        self.assertEqual(400, bucket.rate)
+        self.assertEqual(400, bucket.burst)
+
+
+class TestThrottle(unittest.TestCase):
+
+    def test_unlimited_by_default(self):
+        throttle = Throttle()
+
+        self.assertFalse(throttle.limits_io)
+        with mock.patch.object(throttle_module.time, "sleep") as sleep:
+            throttle.read(10 ** 9)
+            throttle.write(10 ** 9)
+            throttle.file()
+        sleep.assert_not_called()
+
+    def test_from_config_ignores_unknown_keys(self):
+        throttle = Throttle.from_config({"read_rate": 100, "colour": "blue"})
+
+        self.assertEqual(100, throttle.read_rate)
+        self.assertTrue(throttle.limits_io)
+
+    def test_adaptive_backs_off_and_recovers(self):
+        throttle = Throttle(adaptive=True)
+        mib = Throttle.MIB
+        for _ in range(5):
+            throttle.observe_read(mib, 0.01)
+        self.assertIsNone(throttle._read)
+
+        for _ in range(10):
+            throttle.observe_read(mib, 0.1)
+        self.assertIsNotNone(throttle._read)
+        backed_off = throttle._read.rate
+
+        for _ in range(50):
+            throttle.observe_read(mib, 0.005)
+        self.assertTrue(throttle._read is None or throttle._read.rate > backed_off)
+
+    def test_adaptive_never_exceeds_configured_rate(self):
+        throttle = Throttle(read_rate=10 * Throttle.MIB, adaptive=True)
+        for _ in range(50):
+            throttle.observe_read(Throttle.MIB, 0.001)
+
+        self.assertLessEqual(throttle._read.rate, 10 * Throttle.MIB)
+
+    def test_apply_priority_once(self):
+        throttle = Throttle(nice=5, io_idle=True)
+        with mock.patch.object(throttle_module.os, "nice") as nice, mock.patch.object(
+            throttle_module, "set_io_idle"
+        ) as set_io_idle:
+            throttle.apply_priority()
+            throttle.apply_priority()
+
+        nice.assert_called_once_with(5)
+        set_io_idle.assert_called_once_with()
+
+
+class TestDatabaseThrottling(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.data = os.urandom(64 * 1024)
+        with open(os.path.join(self.test_dir, "data.bin"), "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_repository_config_with_command_override(self):
+        with open(os.path.join(self.db_dir, "config.json"), "w") as f:
+            json.dump({"throttle": {"read_rate": 1000, "files_rate": 5}}, f)
+
+        db = BackupDatabase(self.db_dir, throttle={"read_rate": 2000, "nice": None})
+
+        self.assertEqual(2000, db.throttle.read_rate)
+        self.assertEqual(5, db.throttle.files_rate)
+
+    def test_throttled_snapshot_and_restore_round_trip(self):
+        db = BackupDatabase(
+            self.db_dir, throttle={"read_rate": 10 ** 9, "write_rate": 10 ** 9}
+        )
+        with mock.patch.object(db.throttle, "write", wraps=db.throttle.write) as write:
+            snapshot_id = db.create_snapshot(self.test_dir)
+            self.assertTrue(db.restore_snapshot(snapshot_id, self.output_dir))
+
+        self.assertEqual(2 * len(self.data), sum(c.args[0] for c in write.call_args_list))
+        with open(os.path.join(self.output_dir, "data.bin"), "rb") as f:
+            self.assertEqual(self.data, f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
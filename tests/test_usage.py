@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backuptool.core import BackupDatabase
+from backuptool.refcount import RefcountIndex
+
+
+class TestSpaceUsage(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.dir_a = tempfile.mkdtemp()
+        self.dir_b = tempfile.mkdtemp()
+        self.write(self.dir_a, "shared.bin", b"s" * 1000)
+        self.write(self.dir_a, "only_a.bin", b"a" * 300)
+        self.write(self.dir_b, "shared.bin", b"s" * 1000)
+        self.write(self.dir_b, "only_b.bin", b"b" * 200)
+        self.db = BackupDatabase(self.db_dir)
+
+    def tearDown(self):
+        for path in (self.db_dir, self.dir_a, self.dir_b):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def write(self, directory, name, content):
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(content)
+
+    def by_id(self, usage):
+        return {s["id"]: s for s in usage["snapshots"]}
+
+    def test_unique_and_shared_bytes(self):
+        self.db.create_snapshot(self.dir_a)
+        self.db.create_snapshot(self.dir_b)
+
+        usage = self.db.space_usage()
+        snapshots = self.by_id(usage)
+
+        self.assertEqual(
+            {"logical": 1300, "unique": 300, "shared": 1000},
+            {k: snapshots[1][k] for k in ("logical", "unique", "shared")},
+        )
+        self.assertEqual(200, snapshots[2]["unique"])
+        self.assertEqual(1000, snapshots[2]["shared"])
+        self.assertEqual(2500, usage["logical"])
+        self.assertEqual(1500, usage["stored"])
+        self.assertAlmostEqual(2500 / 1500, usage["dedup_ratio"])
+        self.assertAlmostEqual(1.0, usage["compression_ratio"])
+
+    def test_per_target_directory(self):
+        self.db.create_snapshot(self.dir_a)
+        self.write(self.dir_a, "only_a.bin", b"A" * 300)
+        self.db.create_snapshot(self.dir_a)
+        self.db.create_snapshot(self.dir_b)
+
+        targets = {t["target_dir"]: t for t in self.db.space_usage()["targets"]}
+        target_a = targets[os.path.abspath(self.dir_a)]
+
+        self.assertEqual(2, target_a["snapshots"])
+        self.assertEqual(600, target_a["unique"])
+        self.assertEqual(1000, target_a["shared"])
+
+    def test_index_maintained_without_rereading_manifests(self):
+        self.db.create_snapshot(self.dir_a)
+        self.db.space_usage()
+
+        with mock.patch.object(self.db.backend, "size") as size:
+            self.db.create_snapshot(self.dir_b)
+        size.assert_not_called()
+
+        with mock.patch.object(self.db, "get_snapshot") as get_snapshot, \
+                mock.patch.object(self.db.backend, "size") as size:
+            usage = self.db.space_usage()
+        get_snapshot.assert_not_called()
+        size.assert_not_called()
+        self.assertEqual(200, self.by_id(usage)[2]["unique"])
+
+    def test_prune_updates_index(self):
+        self.db.create_snapshot(self.dir_a)
+        self.db.create_snapshot(self.dir_b)
+        self.assertEqual(1000, self.by_id(self.db.space_usage())[2]["shared"])
+
+        self.db.prune_snapshot(1)
+
+        usage = self.db.space_usage()
+        self.assertEqual([2], list(self.by_id(usage)))
+        self.assertEqual(1200, self.by_id(usage)[2]["unique"])
+        self.assertEqual(1200, usage["stored"])
+
+    def test_snapshot_and_prune_leave_index_file_alone(self):
+        self.db.create_snapshot(self.dir_a)
+        self.db.space_usage()
+
+        db = BackupDatabase(self.db_dir)
+        with mock.patch.object(RefcountIndex, "load") as load, \
+                mock.patch.object(RefcountIndex, "save") as save:
+            db.create_snapshot(self.dir_b)
+            db.prune_snapshot(1)
+        load.assert_not_called()
+        save.assert_not_called()
+        self.assertTrue(os.path.exists(os.path.join(self.db_dir, "refcount.log")))
+
+        db = BackupDatabase(self.db_dir)
+        with mock.patch.object(db.backend, "size") as size:
+            usage = db.space_usage()
+        size.assert_not_called()
+        self.assertEqual([2], list(self.by_id(usage)))
+        self.assertEqual(1200, usage["stored"])
+        self.assertFalse(os.path.exists(os.path.join(self.db_dir, "refcount.log")))
+
+    def test_index_catches_up_with_other_writers(self):
+        self.db.create_snapshot(self.dir_a)
+        self.db.space_usage()
+
+        other = BackupDatabase(self.db_dir)
+        other._refcounts = mock.Mock(loaded=False)
+        other.create_snapshot(self.dir_b)
+
+        usage = BackupDatabase(self.db_dir).space_usage()
+        self.assertEqual([1, 2], sorted(self.by_id(usage)))
+        self.assertEqual(1000, self.by_id(usage)[1]["shared"])
+
+
+if __name__ == "__main__":
+    unittest.main()